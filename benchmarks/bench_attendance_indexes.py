@@ -0,0 +1,95 @@
+"""
+Attendance hot queries on a synthetic multi-year table, without and with the
+indexes added by the attendance-index schema migration.
+
+    python benchmarks/bench_attendance_indexes.py [users] [years]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.database import DatabaseManager
+from src.db_pool import close_all_pools
+
+EMOTIONS = ["Happy", "Neutral", "Surprised", "Sad"]
+
+QUERIES = {
+    "duplicate check (user, today)": ("SELECT id FROM attendance WHERE user_id = ? AND date = ?", "user_today"),
+    "get_attendance_today": ('''
+        SELECT u.name, a.timestamp, u.is_active, a.emotion
+        FROM attendance a JOIN users u ON a.user_id = u.id
+        WHERE a.date = ? ORDER BY a.timestamp DESC''', "today"),
+    "get_peak_hours": ('''
+        SELECT strftime('%H', timestamp) as hour, COUNT(*) FROM attendance
+        WHERE date = ? GROUP BY hour ORDER BY hour ASC''', "today"),
+    "get_mood_stats": ("SELECT emotion, COUNT(*) FROM attendance WHERE date = ? GROUP BY emotion", "today"),
+    "get_attendance_range (1 month)": ('''
+        SELECT a.id, u.name, a.date, a.timestamp, u.is_active, a.emotion
+        FROM attendance a JOIN users u ON a.user_id = u.id
+        WHERE a.date BETWEEN ? AND ? ORDER BY a.date DESC, a.timestamp DESC''', "month"),
+}
+
+def build(db_path, users, years):
+    db = DatabaseManager(db_path)
+    conn = db.get_connection()
+    with db.transaction() as cursor:
+        cursor.executemany("INSERT INTO users (name) VALUES (?)", [(f"user{i}",) for i in range(users)])
+    rng = random.Random(0)
+    today = datetime.date.today()
+    rows = []
+    for day in range(365 * years):
+        date = today - datetime.timedelta(days=day)
+        for user_id in range(1, users + 1):
+            if rng.random() < 0.8:
+                ts = f"{date} {rng.randint(7, 10):02d}:{rng.randint(0, 59):02d}:00"
+                rows.append((user_id, date.isoformat(), ts, rng.choice(EMOTIONS)))
+    with db.transaction() as cursor:
+        cursor.executemany("INSERT INTO attendance (user_id, date, timestamp, emotion) VALUES (?, ?, ?, ?)", rows)
+    conn.execute("ANALYZE")
+    close_all_pools()
+    return len(rows)
+
+def run_queries(db_path, users, repeat=20):
+    conn = sqlite3.connect(db_path)
+    today = datetime.date.today().isoformat()
+    month_ago = (datetime.date.today() - datetime.timedelta(days=30)).isoformat()
+    params = {"today": (today,), "month": (month_ago, today)}
+    results = {}
+    for label, (sql, kind) in QUERIES.items():
+        start = time.perf_counter()
+        for i in range(repeat):
+            args = (1 + i % users, today) if kind == "user_today" else params[kind]
+            conn.execute(sql, args).fetchall()
+        results[label] = (time.perf_counter() - start) / repeat * 1000
+    conn.close()
+    return results
+
+def main(users, years):
+    with tempfile.TemporaryDirectory() as tmp:
+        indexed = os.path.join(tmp, "indexed", "database.db")
+        plain = os.path.join(tmp, "plain", "database.db")
+        count = build(indexed, users, years)
+        os.makedirs(os.path.dirname(plain))
+        shutil.copy(indexed, plain)
+        conn = sqlite3.connect(plain)
+        for name in ("idx_attendance_user_date", "idx_attendance_date_user", "idx_encodings_user"):
+            conn.execute(f"DROP INDEX {name}")
+        conn.execute("ANALYZE")
+        conn.close()
+
+        print(f"{count} attendance rows ({users} users, {years} years)")
+        before = run_queries(plain, users)
+        after = run_queries(indexed, users)
+        print(f"  {'query':<32} {'no index':>10} {'indexed':>10}")
+        for label in QUERIES:
+            print(f"  {label:<32} {before[label]:8.2f}ms {after[label]:8.2f}ms  ({before[label] / after[label]:.0f}x)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 3)
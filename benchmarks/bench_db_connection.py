@@ -0,0 +1,90 @@
+"""
+Per-call latency of DatabaseManager before/after the pooled connection.
+
+"before" reproduces the old pattern (sqlite3.connect + close on every call,
+rollback journal, synchronous=FULL); "after" calls the DatabaseManager methods,
+which run on a persistent WAL connection.
+
+    python benchmarks/bench_db_connection.py [iterations]
+"""
+import os
+import sys
+import time
+import sqlite3
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.database import DatabaseManager
+from src.db_pool import close_all_pools
+
+def old_get_setting(db_path, key):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT value FROM settings WHERE key=?", (key,))
+    result = cursor.fetchone()
+    conn.close()
+    return result[0] if result else None
+
+def old_mark_attendance(db_path, user_id):
+    today = datetime.datetime.now().strftime("%Y-%m-%d")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM attendance WHERE user_id = ? AND date = ?", (user_id, today))
+    if cursor.fetchone():
+        conn.close()
+        return False
+    cursor.execute("INSERT INTO attendance (user_id, date, timestamp, emotion) VALUES (?, ?, ?, ?)",
+                   (user_id, today, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "Neutral"))
+    conn.commit()
+    conn.close()
+    return True
+
+def old_set_setting(db_path, key, value):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+    conn.commit()
+    conn.close()
+
+def timed(label, func, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    per_call = (time.perf_counter() - start) / iterations * 1e6
+    print(f"  {label:<38} {per_call:9.1f} us/call")
+    return per_call
+
+def run(iterations):
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path = os.path.join(tmp, "old", "database.db")
+        new_path = os.path.join(tmp, "new", "database.db")
+        for path in (old_path, new_path):
+            db = DatabaseManager(path)
+            for i in range(50):
+                db.add_user(f"user{i}")
+        close_all_pools()
+        # The old code ran with SQLite's defaults
+        conn = sqlite3.connect(old_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+        db = DatabaseManager(new_path)
+        print(f"{iterations} iterations")
+        print("before (connect per call):")
+        before = [
+            timed("get_setting", lambda i: old_get_setting(old_path, "tolerance"), iterations),
+            timed("mark_attendance (already present)", lambda i: old_mark_attendance(old_path, 1 + i % 50), iterations),
+            timed("set_setting", lambda i: old_set_setting(old_path, "bench", str(i)), iterations),
+        ]
+        print("after (pooled WAL connection):")
+        after = [
+            timed("get_setting", lambda i: db.get_setting("tolerance"), iterations),
+            timed("mark_attendance (already present)", lambda i: db.mark_attendance(1 + i % 50), iterations),
+            timed("set_setting", lambda i: db.set_setting("bench", str(i)), iterations),
+        ]
+        print("speed-up:", ", ".join(f"{b / a:.1f}x" for b, a in zip(before, after)))
+        close_all_pools()
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
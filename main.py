@@ -3,27 +3,40 @@ import os
 
 # Add the project root to the python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.startup import startup_timer
 
 from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QTimer
 from src.ui.main_window import MainWindow
 from src.database import DatabaseManager
 from src.ui.styles import DARK_THEME
 from src.ui.login import LoginDialog
+from src.capture import camera_manager
+
+def apply_camera_setting(key, value):
+    if key == "camera_grace_seconds":
+        camera_manager.grace_period = value
 
 def main():
-    # Initialize Database
+    # The one database service of the application, schema set up here once
     db = DatabaseManager()
+    camera_manager.grace_period = db.get_typed_setting("camera_grace_seconds")
+    db.settings.subscribe(apply_camera_setting)
     
     # Create Application
     app = QApplication(sys.argv)
     app.setStyleSheet(DARK_THEME)
     
     # Show Login Dialog
-    login = LoginDialog()
+    login = LoginDialog(db)
+    QTimer.singleShot(0, lambda: startup_timer.mark("login_dialog", "Login dialog"))
     if login.exec() == LoginDialog.DialogCode.Accepted:
+        startup_timer.mark("login", "Login accepted")
         # Create Main Window
-        window = MainWindow()
+        window = MainWindow(db)
         window.show()
+        # Runs once the window is painted
+        QTimer.singleShot(0, window.on_shown)
         
         # Run Event Loop
         sys.exit(app.exec())
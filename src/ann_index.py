@@ -0,0 +1,224 @@
+import os
+import time
+import numpy as np
+
+# Below this size a brute-force scan is faster than probing an index
+ANN_MIN_GALLERY = 5000
+DEFAULT_NPROBE = 8
+
+# One row of the persisted assignment file
+ASSIGNMENT_DTYPE = np.dtype([('encoding_id', '<i8'), ('list_id', '<i8')])
+
+def _sq_distances(vectors, centroids, c_norms):
+    """Squared euclidean distances between rows of vectors and centroids."""
+    v_norms = np.einsum('ij,ij->i', vectors, vectors)
+    sq = v_norms[:, None] + c_norms[None, :] - 2.0 * (vectors @ centroids.T)
+    return np.maximum(sq, 0, out=sq)
+
+class IVFIndex:
+    """
+    Inverted-file index over a gallery matrix.
+    A k-means coarse quantizer splits the gallery into lists; a query probes the
+    nprobe closest lists and the caller re-ranks those candidates exactly.
+    """
+    def __init__(self, centroids, assignments=None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.c_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self.assignments = np.zeros(0, dtype=np.int64) if assignments is None else np.asarray(assignments, dtype=np.int64)
+        self._order = None
+        self._offsets = None
+
+    @classmethod
+    def train(cls, matrix, nlist=None, iterations=10, seed=0):
+        """Runs k-means on (a sample of) the gallery and assigns every row."""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        count = len(matrix)
+        if nlist is None:
+            nlist = int(np.clip(4 * np.sqrt(count), 16, 4096))
+        nlist = min(nlist, count)
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(count, nlist * 40)
+        sample = matrix[rng.choice(count, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            index = cls(centroids)
+            labels = index.assign(sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            centroids = sums / np.maximum(counts, 1)[:, None]
+            # Re-seed empty clusters with random samples
+            if empty.any():
+                centroids[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+
+        index = cls(centroids)
+        index.add(matrix)
+        return index
+
+    def __len__(self):
+        return len(self.assignments)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def assign(self, vectors, chunk_size=4096):
+        """Returns the nearest list id for each vector."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start:start + chunk_size]
+            labels[start:start + chunk_size] = np.argmin(_sq_distances(chunk, self.centroids, self.c_norms), axis=1)
+        return labels
+
+    def add(self, vectors=None, labels=None):
+        """Appends rows to the index (labels are computed when not given)."""
+        if labels is None:
+            labels = self.assign(vectors)
+        self.assignments = np.concatenate([self.assignments, np.asarray(labels, dtype=np.int64)])
+        self._order = None
+        return labels
+
+    def _build_lists(self):
+        self._order = np.argsort(self.assignments, kind='stable')
+        self._offsets = np.searchsorted(self.assignments[self._order], np.arange(self.nlist + 1))
+
+    def candidates(self, queries, nprobe=DEFAULT_NPROBE):
+        """Returns, for each query, the gallery rows stored in its nprobe closest lists."""
+        if self._order is None:
+            self._build_lists()
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        nprobe = max(1, min(nprobe, self.nlist))
+        sq = _sq_distances(queries, self.centroids, self.c_norms)
+        if nprobe < self.nlist:
+            probes = np.argpartition(sq, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.tile(np.arange(self.nlist), (len(queries), 1))
+
+        result = []
+        for lists in probes:
+            parts = [self._order[self._offsets[l]:self._offsets[l + 1]] for l in lists]
+            result.append(np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64))
+        return result
+
+class IVFIndexStore:
+    """
+    Persists an IVFIndex next to the database.
+    <base>.npz holds the centroids and names the generation of the index,
+    <base>.<generation>.lists an append-only (encoding_id, list_id) record per
+    indexed encoding. Both are written under temporary names and swapped in, the
+    npz last, so a reader always sees centroids with the lists trained with them.
+    """
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.centroids_path = base_path + ".npz"
+
+    def _lists_path(self, generation):
+        return f"{self.base_path}.{generation}.lists"
+
+    def _load_header(self):
+        """Returns (centroids, trained_size, generation), centroids is None without a usable index."""
+        if not os.path.exists(self.centroids_path):
+            return None, 0, None
+        try:
+            with np.load(self.centroids_path) as data:
+                return data['centroids'], int(data['trained_size']), int(data['generation'])
+        except Exception as e:
+            # A torn, corrupt or older file counts as no index: matching stays exact until retrained
+            print(f"Error loading ANN index: {e}")
+            return None, 0, None
+
+    def _load_assignments(self, generation):
+        lists_path = self._lists_path(generation)
+        if not os.path.exists(lists_path):
+            return np.zeros(0, dtype=ASSIGNMENT_DTYPE)
+        count = os.path.getsize(lists_path) // ASSIGNMENT_DTYPE.itemsize
+        return np.fromfile(lists_path, dtype=ASSIGNMENT_DTYPE, count=count)
+
+    def _records(self, encoding_ids, labels):
+        records = np.zeros(len(encoding_ids), dtype=ASSIGNMENT_DTYPE)
+        records['encoding_id'] = encoding_ids
+        records['list_id'] = labels
+        return records
+
+    def _append_assignments(self, generation, encoding_ids, labels):
+        with open(self._lists_path(generation), 'ab') as f:
+            f.write(self._records(encoding_ids, labels).tobytes())
+
+    def save(self, index, encoding_ids):
+        generation = time.time_ns()
+        tmp_suffix = f".{os.getpid()}.tmp"
+        lists_path = self._lists_path(generation)
+        with open(lists_path + tmp_suffix, 'wb') as f:
+            f.write(self._records(encoding_ids, index.assignments).tobytes())
+        os.replace(lists_path + tmp_suffix, lists_path)
+        # np.savez would add an .npz suffix to a file name, a file object is written as-is
+        with open(self.centroids_path + tmp_suffix, 'wb') as f:
+            np.savez(f, centroids=index.centroids, trained_size=len(index), generation=generation)
+        os.replace(self.centroids_path + tmp_suffix, self.centroids_path)
+        # Lists of replaced generations are no longer referenced
+        directory = os.path.dirname(self.base_path) or "."
+        prefix = os.path.basename(self.base_path) + "."
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name.endswith(".lists") and os.path.join(directory, name) != lists_path:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def add(self, encoding_id, vector):
+        """Incrementally indexes one new encoding (no-op until an index was trained)."""
+        centroids, _, generation = self._load_header()
+        if centroids is None:
+            return
+        label = IVFIndex(centroids).assign(vector)
+        self._append_assignments(generation, [encoding_id], label)
+
+    def needs_training(self, count):
+        """True if a gallery of count rows should get a newly trained index (none yet, or it doubled since)."""
+        if count < ANN_MIN_GALLERY:
+            return False
+        _, trained_size, _ = self._load_header()
+        return trained_size == 0 or count > 2 * trained_size
+
+    def train(self, encoding_ids, matrix):
+        """Trains and saves an index over matrix (slow: seconds for large galleries)."""
+        index = IVFIndex.train(matrix)
+        self.save(index, np.asarray(encoding_ids, dtype=np.int64))
+        return index
+
+    def load(self, encoding_ids, matrix):
+        """
+        Returns the saved index aligned with the rows of matrix, without training:
+        None for small galleries or when no index was trained yet.
+        """
+        if len(matrix) < ANN_MIN_GALLERY:
+            return None
+        encoding_ids = np.asarray(encoding_ids, dtype=np.int64)
+        centroids, _, generation = self._load_header()
+        if centroids is None:
+            return None
+
+        # Map persisted assignments onto the current rows, keeping the last record per id
+        records = self._load_assignments(generation)
+        _, last = np.unique(records['encoding_id'][::-1], return_index=True)
+        records = records[::-1][last]
+        if len(records):
+            pos = np.minimum(np.searchsorted(records['encoding_id'], encoding_ids), len(records) - 1)
+            known = records['encoding_id'][pos] == encoding_ids
+        else:
+            pos = np.zeros(len(encoding_ids), dtype=np.int64)
+            known = np.zeros(len(encoding_ids), dtype=bool)
+
+        index = IVFIndex(centroids)
+        labels = np.empty(len(encoding_ids), dtype=np.int64)
+        labels[known] = records['list_id'][pos[known]]
+        if not known.all():
+            # Rows added while the store was out of sync
+            labels[~known] = index.assign(np.asarray(matrix)[~known])
+            self._append_assignments(generation, encoding_ids[~known], labels[~known])
+        index.add(labels=labels)
+        return index
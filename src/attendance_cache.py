@@ -0,0 +1,52 @@
+import os
+import threading
+
+class AttendanceCache:
+    """
+    Set of users already marked present today, shared by every DatabaseManager
+    of a database file. It is loaded from the database once per day (the first
+    lookup after midnight reloads it), so repeated sightings of a registered
+    person are answered without touching SQLite.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._date = None
+        self._present = set()
+
+    def _ensure_day(self, today, loader):
+        if self._date != today:
+            self._present = set(loader(today))
+            self._date = today
+
+    def is_present(self, user_id, today, loader):
+        """loader(date) returns the user ids present on that date; called on day rollover only."""
+        with self._lock:
+            self._ensure_day(today, loader)
+            return user_id in self._present
+
+    def add(self, user_id, date):
+        with self._lock:
+            if date == self._date:
+                self._present.add(user_id)
+
+    def discard(self, user_id, date):
+        with self._lock:
+            if date == self._date:
+                self._present.discard(user_id)
+
+    def clear(self):
+        """Forces a reload on the next lookup."""
+        with self._lock:
+            self._date = None
+            self._present = set()
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_attendance_cache(db_path):
+    key = os.path.abspath(db_path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = AttendanceCache()
+        return cache
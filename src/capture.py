@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import deque
+import cv2
+
+class FrameSource:
+    """
+    Reads a camera on its own thread into a small ring buffer.
+    Processing stages always get the newest frame and never wait on the driver
+    buffer; frames nobody picked up in time are simply dropped.
+    Listeners are called on the capture thread for every frame (e.g. for display).
+    """
+    def __init__(self, device=0, buffer_size=2):
+        self.device = device
+        self._buffer = deque(maxlen=buffer_size) # [(seq, frame)]
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._listeners = []
+        self._running = False
+        self._thread = None
+        self.cap = None
+        self.fps = 0.0
+        self.error = None # set when the device could not be opened
+
+    def start(self):
+        if self._running:
+            return self
+        cap = cv2.VideoCapture(self.device)
+        if not cap.isOpened():
+            cap.release()
+            self.error = "Camera not available"
+            print(f"{self.error} (device {self.device})")
+            with self._cond:
+                self._cond.notify_all() # subscribers waiting for a frame see the error
+            return self
+        self.error = None
+        self.cap = cap
+        self._running = True
+        self._thread = threading.Thread(target=self._reader, args=(cap,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            # The reader releases the device itself; a read stuck in the driver
+            # must not have the capture object freed underneath it
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.cap = None
+        with self._cond:
+            self._buffer.clear()
+            self._cond.notify_all()
+
+    def is_running(self):
+        return self._running
+
+    def add_listener(self, callback):
+        """callback(seq, frame) is called on the capture thread for every new frame."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _reader(self, cap):
+        last_time = time.monotonic()
+        try:
+            while self._running:
+                ret, frame = cap.read()
+                if not ret:
+                    time.sleep(0.01)
+                    continue
+                now = time.monotonic()
+                # Smoothed capture rate, useful to compare against the processing rate
+                self.fps = 0.9 * self.fps + 0.1 / max(now - last_time, 1e-6)
+                last_time = now
+                with self._cond:
+                    self._seq += 1
+                    seq = self._seq
+                    self._buffer.append((seq, frame))
+                    self._cond.notify_all()
+                for callback in list(self._listeners):
+                    try:
+                        callback(seq, frame)
+                    except Exception as e:
+                        print(f"Frame listener error: {e}")
+        finally:
+            cap.release()
+
+    def latest(self, after_seq=0, timeout=1.0):
+        """
+        Returns (seq, frame) of the newest frame with seq > after_seq,
+        waiting up to timeout seconds. Returns (after_seq, None) on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: (self._buffer and self._buffer[-1][0] > after_seq)
+                                       or not self._running, timeout):
+                return after_seq, None
+            if not self._buffer:
+                return after_seq, None
+            return self._buffer[-1]
+
+    def subscribe(self):
+        return FrameSubscriber(self)
+
+class FrameSubscriber:
+    """Per-consumer cursor on a FrameSource, counting the frames this consumer skipped."""
+    def __init__(self, source):
+        self.source = source
+        self.last_seq = 0
+        self.received = 0
+        self.dropped = 0
+
+    @property
+    def error(self):
+        """Why the camera delivers no frames (e.g. "Camera not available"), None while it works."""
+        return self.source.error
+
+    def read(self, timeout=1.0):
+        """Returns the newest unseen frame, or None if no frame arrived in time."""
+        seq, frame = self.source.latest(self.last_seq, timeout)
+        if frame is None:
+            return None
+        if self.last_seq:
+            self.dropped += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.received += 1
+        return frame
+
+class CameraManager:
+    """
+    Owns each camera device once for the whole process.
+    Every acquire() shares the same running FrameSource (reference counted);
+    after the last release() the device is kept warm for grace_period seconds
+    so switching tabs does not reopen it.
+    """
+    def __init__(self, grace_period=10.0):
+        self.grace_period = grace_period
+        self._lock = threading.Lock()
+        self._sources = {} # {device: FrameSource}
+        self._refs = {} # {device: subscriber_count}
+        self._timers = {} # {device: threading.Timer}
+
+    def acquire(self, device=0):
+        with self._lock:
+            timer = self._timers.pop(device, None)
+            if timer is not None:
+                timer.cancel()
+            source = self._sources.get(device)
+            if source is None or not source.is_running():
+                source = FrameSource(device).start()
+                self._sources[device] = source
+            self._refs[device] = self._refs.get(device, 0) + 1
+            return source
+
+    def release(self, device=0):
+        with self._lock:
+            if self._refs.get(device, 0) == 0:
+                return
+            self._refs[device] -= 1
+            if self._refs[device] > 0:
+                return
+            if self.grace_period <= 0:
+                source = self._sources.pop(device, None)
+            else:
+                timer = threading.Timer(self.grace_period, self._close_if_unused, (device,))
+                timer.daemon = True
+                self._timers[device] = timer
+                timer.start()
+                return
+        if source is not None:
+            source.stop()
+
+    def _close_if_unused(self, device):
+        with self._lock:
+            if self._refs.get(device, 0) > 0:
+                return
+            self._timers.pop(device, None)
+            source = self._sources.pop(device, None)
+        if source is not None:
+            source.stop()
+
+    def subscriber_count(self, device=0):
+        return self._refs.get(device, 0)
+
+    def shutdown(self):
+        """Closes every device immediately (application exit)."""
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            sources = list(self._sources.values())
+            self._timers.clear()
+            self._sources.clear()
+            self._refs.clear()
+        for source in sources:
+            source.stop()
+
+# Process-wide instance shared by enrollment, testing and attendance
+camera_manager = CameraManager()
@@ -0,0 +1,78 @@
+import os
+import hashlib
+import cv2
+import numpy as np
+
+THUMBNAIL_SIZE = 96
+JPEG_QUALITY = 90
+
+class CropStore:
+    """
+    Content-addressed store for face crops.
+    A crop is saved as <root>/<ab>/<sha1>.jpg, named by the hash of its JPEG
+    bytes, so two crops can never overwrite each other and identical crops are
+    stored once. A small thumbnail is written next to it under <root>/thumbs.
+    """
+    def __init__(self, root="data/strangers"):
+        self.root = root
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def save(self, image):
+        """Stores a BGR crop with its thumbnail and returns the crop path."""
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        if not ok:
+            raise ValueError("Could not encode crop")
+        data = encoded.tobytes()
+        digest = hashlib.sha1(data).hexdigest()
+        path = os.path.join(self.root, digest[:2], digest + ".jpg")
+        if not os.path.exists(path):
+            self._write(path, data)
+        thumb_path = self.thumbnail_path(path)
+        if not os.path.exists(thumb_path):
+            self._write_thumbnail(image, thumb_path)
+        return path
+
+    def thumbnail_path(self, path):
+        """Where the thumbnail of a crop lives (also for crops saved before the store)."""
+        name = os.path.basename(path)
+        return os.path.join(self.root, "thumbs", name[:2], name)
+
+    def _write_thumbnail(self, image, thumb_path):
+        height, width = image.shape[:2]
+        scale = THUMBNAIL_SIZE / max(height, width, 1)
+        if scale < 1:
+            image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        if ok:
+            self._write(thumb_path, encoded.tobytes())
+
+    def ensure_thumbnail(self, path):
+        """Returns the thumbnail path of a crop, creating it from the crop if missing (None if unreadable)."""
+        thumb_path = self.thumbnail_path(path)
+        if os.path.exists(thumb_path):
+            return thumb_path
+        image = None
+        if path and os.path.exists(path):
+            # imdecode instead of imread, paths may contain non-ASCII characters
+            image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return None
+        self._write_thumbnail(image, thumb_path)
+        return thumb_path
+
+    def remove(self, path):
+        """Deletes a crop and its thumbnail."""
+        for p in (path, self.thumbnail_path(path)):
+            try:
+                if os.path.exists(p):
+                    os.remove(p)
+            except OSError as e:
+                print(f"Could not remove {p}: {e}")
@@ -1,164 +1,405 @@
 import sqlite3
 import datetime
 import os
+import threading
+import uuid
+from contextlib import contextmanager
 import bcrypt
+import numpy as np
+from src.db_pool import get_pool
+from src.attendance_cache import get_attendance_cache
+from src.settings_store import get_settings_cache
+from src.embedding_store import EmbeddingStore, encode_encoding, decode_encoding
+from src.ann_index import IVFIndexStore
+from src.crop_store import CropStore
+from src.gallery import notify_gallery_changed
+from src.stranger_index import get_stranger_index, find_clusters, embedding_list, RECENT_DAYS, MERGE_TOLERANCE
+
+_schema_ready = set() # database files whose schema is current in this process
+_schema_lock = threading.Lock()
 
 class DatabaseManager:
     def __init__(self, db_path="data/database.db"):
         self.db_path = db_path
+        # Persistent per-thread connections shared by every DatabaseManager of this file
+        self.pool = get_pool(db_path)
+        # Who is already present today, answered in memory
+        self.attendance_cache = get_attendance_cache(db_path)
+        # Settings are read from SQLite once, then served (and observed) in memory
+        self.settings = get_settings_cache(db_path)
+        # Embeddings of recently seen strangers, to recognise repeat visitors
+        self.stranger_index = get_stranger_index(db_path)
+        # Stranger crops and their thumbnails, named by content hash
+        self.crops = CropStore(os.path.join(os.path.dirname(self.db_path), "strangers"))
+        # Memory-mapped copy of the stranger embeddings, searched by face
+        self.stranger_embeddings = EmbeddingStore(os.path.join(os.path.dirname(self.db_path), "stranger_embeddings"))
+        # Memory-mapped float32 copy of the encodings table, stored next to the database
+        self.embeddings = EmbeddingStore(os.path.join(os.path.dirname(self.db_path), "embeddings"))
+        # Approximate nearest-neighbour index used for large galleries
+        self.ann_index = IVFIndexStore(os.path.join(os.path.dirname(self.db_path), "ann_index"))
         self._create_dirs()
-        self.init_db()
+        self.ensure_schema()
 
     def _create_dirs(self):
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
 
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
+        """Returns the calling thread's pooled connection. Do not close it."""
+        return self.pool.connection()
 
-    def init_db(self):
+    @contextmanager
+    def transaction(self):
+        """Yields a cursor; commits on success and rolls back on any error."""
         conn = self.get_connection()
         cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                phone TEXT,
-                email TEXT,
-                address TEXT,
-                notes TEXT,
-                is_active INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Migration: Add is_active if it doesn't exist
         try:
-            cursor.execute("ALTER TABLE users ADD COLUMN is_active INTEGER DEFAULT 1")
+            yield cursor
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def ensure_schema(self):
+        """Creates and migrates the schema once per database file and process, only if it is behind."""
+        key = os.path.abspath(self.db_path)
+        with _schema_lock:
+            if key in _schema_ready:
+                return
+            if self.schema_version() < len(self.MIGRATIONS):
+                self.init_db()
+            _schema_ready.add(key)
+
+    def schema_version(self):
+        cursor = self.get_connection().cursor()
+        try:
+            cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
         except sqlite3.OperationalError:
-            pass # Column already exists
+            return 0 # created before versioning, or a new file
+        return cursor.fetchone()[0]
 
-        # Face Encodings table
-        # Storing encoding as bytes (blob)
+    def _has_column(self, cursor, table, column):
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row[1] == column for row in cursor.fetchall())
+
+    def init_db(self):
+        with self.transaction() as cursor:
+            # Users table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    phone TEXT,
+                    email TEXT,
+                    address TEXT,
+                    notes TEXT,
+                    is_active INTEGER DEFAULT 1,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        
+            # Migration: Add is_active if it doesn't exist
+            if not self._has_column(cursor, "users", "is_active"):
+                cursor.execute("ALTER TABLE users ADD COLUMN is_active INTEGER DEFAULT 1")
+
+            # Face Encodings table
+            # Storing encoding as bytes (blob)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS encodings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    encoding BLOB NOT NULL,
+                    image_path TEXT,
+                    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+                )
+            ''')
+
+            # Strangers table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS strangers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    image_path TEXT,
+                    first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    count INTEGER DEFAULT 1
+                )
+            ''')
+
+            # Attendance table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS attendance (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    date TEXT,
+                    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+                )
+            ''')
+        
+            # Settings table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+        
+            # Migration: Add emotion column to attendance if it doesn't exist
+            if not self._has_column(cursor, "attendance", "emotion"):
+                cursor.execute("ALTER TABLE attendance ADD COLUMN emotion TEXT DEFAULT 'Neutral'")
+
+            # Initialize default admin password (default: admin) if not set
+            cursor.execute("SELECT value FROM settings WHERE key='admin_password'")
+            if not cursor.fetchone():
+                default_password = b"admin"
+                hashed = bcrypt.hashpw(default_password, bcrypt.gensalt()).decode('utf-8')
+                cursor.execute("INSERT INTO settings (key, value) VALUES ('admin_password', ?)", (hashed,))
+
+        self.migrate()
+
+    def migrate(self):
+        """Applies every schema migration newer than the recorded schema_version, one transaction each."""
+        with self.transaction() as cursor:
+            cursor.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+            cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            current = cursor.fetchone()[0]
+
+        for version, migration in enumerate(self.MIGRATIONS, start=1):
+            if version <= current:
+                continue
+            with self.transaction() as cursor:
+                # Serializes concurrent processes; re-check once the write lock is held
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+                if cursor.fetchone()[0] >= version:
+                    continue
+                migration(self, cursor)
+                cursor.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+
+    def _migrate_attendance_indexes(self, cursor):
+        # Keep the first record of each (user, day) before enforcing uniqueness.
+        # The others are moved to an archive table in the same transaction, not lost
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS encodings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+            CREATE TABLE IF NOT EXISTS attendance_duplicates (
+                id INTEGER PRIMARY KEY,
                 user_id INTEGER,
-                encoding BLOB NOT NULL,
-                image_path TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+                timestamp TIMESTAMP,
+                date TEXT,
+                emotion TEXT,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-
-        # Strangers table
+        duplicates = "id NOT IN (SELECT MIN(id) FROM attendance GROUP BY user_id, date)"
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO attendance_duplicates (id, user_id, timestamp, date, emotion)
+            SELECT id, user_id, timestamp, date, emotion FROM attendance WHERE {duplicates}
+        ''')
+        cursor.execute(f"DELETE FROM attendance WHERE {duplicates}")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_user_date ON attendance (user_id, date)")
+        # Covers the per-day queries (today's list, peak hours, mood) without touching the table
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date_user ON attendance (date, user_id, timestamp, emotion)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_encodings_user ON encodings (user_id)")
+
+    def _migrate_attendance_rollups(self, cursor):
+        # Rollups kept current by triggers, so analytics never aggregate the raw table
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS strangers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                image_path TEXT,
-                first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                count INTEGER DEFAULT 1
-            )
+            CREATE TABLE IF NOT EXISTS attendance_hourly (
+                date TEXT NOT NULL,
+                hour TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (date, hour)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attendance_mood_daily (
+                date TEXT NOT NULL,
+                emotion TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (date, emotion)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attendance_presence (
+                date TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (date, user_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_presence_user_date ON attendance_presence (user_id, date)")
+
+        add = self._rollup_add_sql("NEW")
+        remove = self._rollup_remove_sql("OLD")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_insert AFTER INSERT ON attendance BEGIN {add} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_delete AFTER DELETE ON attendance BEGIN {remove} END")
+        cursor.execute("CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_update AFTER UPDATE OF user_id, date, timestamp, emotion "
+                       f"ON attendance BEGIN {remove} {add} END")
+
+        # Backfill from the existing history
+        cursor.execute("DELETE FROM attendance_hourly")
+        cursor.execute("DELETE FROM attendance_mood_daily")
+        cursor.execute("DELETE FROM attendance_presence")
+        cursor.execute('''
+            INSERT INTO attendance_hourly (date, hour, count)
+            SELECT date, strftime('%H', timestamp), COUNT(*) FROM attendance
+            WHERE date IS NOT NULL AND strftime('%H', timestamp) IS NOT NULL
+            GROUP BY 1, 2
+        ''')
+        cursor.execute('''
+            INSERT INTO attendance_mood_daily (date, emotion, count)
+            SELECT date, COALESCE(emotion, 'Neutral'), COUNT(*) FROM attendance
+            WHERE date IS NOT NULL GROUP BY 1, 2
+        ''')
+        cursor.execute('''
+            INSERT OR IGNORE INTO attendance_presence (date, user_id)
+            SELECT date, user_id FROM attendance WHERE date IS NOT NULL AND user_id IS NOT NULL
         ''')
 
-        # Attendance table
+    @staticmethod
+    def _rollup_add_sql(row):
+        return f'''
+            INSERT INTO attendance_hourly (date, hour, count)
+            SELECT {row}.date, strftime('%H', {row}.timestamp), 1
+            WHERE {row}.date IS NOT NULL AND strftime('%H', {row}.timestamp) IS NOT NULL
+            ON CONFLICT (date, hour) DO UPDATE SET count = count + 1;
+            INSERT INTO attendance_mood_daily (date, emotion, count)
+            SELECT {row}.date, COALESCE({row}.emotion, 'Neutral'), 1 WHERE {row}.date IS NOT NULL
+            ON CONFLICT (date, emotion) DO UPDATE SET count = count + 1;
+            INSERT OR IGNORE INTO attendance_presence (date, user_id)
+            SELECT {row}.date, {row}.user_id WHERE {row}.date IS NOT NULL AND {row}.user_id IS NOT NULL;
+        '''
+
+    @staticmethod
+    def _rollup_remove_sql(row):
+        return f'''
+            UPDATE attendance_hourly SET count = count - 1
+            WHERE date = {row}.date AND hour = strftime('%H', {row}.timestamp);
+            DELETE FROM attendance_hourly WHERE date = {row}.date AND count <= 0;
+            UPDATE attendance_mood_daily SET count = count - 1
+            WHERE date = {row}.date AND emotion = COALESCE({row}.emotion, 'Neutral');
+            DELETE FROM attendance_mood_daily WHERE date = {row}.date AND count <= 0;
+            DELETE FROM attendance_presence WHERE date = {row}.date AND user_id = {row}.user_id
+            AND NOT EXISTS (SELECT 1 FROM attendance WHERE date = {row}.date AND user_id = {row}.user_id);
+        '''
+
+    def _migrate_history_index(self, cursor):
+        # Walks the history in (date, timestamp, id) order for keyset pagination
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date_time ON attendance (date, timestamp)")
+
+    def _migrate_gallery_changes(self, cursor):
+        # Change feed of the recognition gallery; the last generation is its version
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS attendance (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+            CREATE TABLE IF NOT EXISTS gallery_changes (
+                generation INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
                 user_id INTEGER,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                date TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+                encoding_id INTEGER
             )
         ''')
-        
-        # Settings table
+        cursor.execute("CREATE TRIGGER IF NOT EXISTS trg_gallery_add AFTER INSERT ON encodings BEGIN "
+                       "INSERT INTO gallery_changes (kind, user_id, encoding_id) VALUES ('add', NEW.user_id, NEW.id); END")
+        cursor.execute("CREATE TRIGGER IF NOT EXISTS trg_gallery_active AFTER UPDATE OF is_active ON users "
+                       "WHEN COALESCE(OLD.is_active, 1) != COALESCE(NEW.is_active, 1) BEGIN "
+                       "INSERT INTO gallery_changes (kind, user_id) "
+                       "VALUES (CASE WHEN NEW.is_active = 1 THEN 'activate' ELSE 'deactivate' END, NEW.id); END")
+        cursor.execute("CREATE TRIGGER IF NOT EXISTS trg_gallery_rename AFTER UPDATE OF name ON users "
+                       "WHEN OLD.name IS NOT NEW.name BEGIN "
+                       "INSERT INTO gallery_changes (kind, user_id) VALUES ('rename', NEW.id); END")
+
+    def _migrate_stranger_embeddings(self, cursor):
+        # Face encoding of each stranger, so repeat sightings update one row
+        if not self._has_column(cursor, "strangers", "embedding"):
+            cursor.execute("ALTER TABLE strangers ADD COLUMN embedding BLOB")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_strangers_last_seen ON strangers (last_seen)")
+
+    def _migrate_stranger_sightings(self, cursor):
+        # Ids of the stranger events already written, so a replayed journal counts each sighting once
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT
+            CREATE TABLE IF NOT EXISTS stranger_sightings (
+                event_id TEXT PRIMARY KEY,
+                seen_at TIMESTAMP NOT NULL
             )
         ''')
-        
-        # Migration: Add emotion column to attendance if it doesn't exist
-        try:
-            cursor.execute("ALTER TABLE attendance ADD COLUMN emotion TEXT DEFAULT 'Neutral'")
-        except sqlite3.OperationalError:
-            pass 
-
-        # Initialize default admin password (default: admin) if not set
-        cursor.execute("SELECT value FROM settings WHERE key='admin_password'")
-        if not cursor.fetchone():
-            default_password = b"admin"
-            hashed = bcrypt.hashpw(default_password, bcrypt.gensalt()).decode('utf-8')
-            cursor.execute("INSERT INTO settings (key, value) VALUES ('admin_password', ?)", (hashed,))
-
-        conn.commit()
-        conn.close()
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_stranger_sightings_seen ON stranger_sightings (seen_at)")
+
+    # Schema versions in order: entry N upgrades the database to version N
+    MIGRATIONS = [
+        _migrate_attendance_indexes,
+        _migrate_attendance_rollups,
+        _migrate_history_index,
+        _migrate_gallery_changes,
+        _migrate_stranger_embeddings,
+        _migrate_stranger_sightings,
+    ]
+
+    # History sort orders: key -> SQL expressions, always ending with the unique id
+    HISTORY_SORT_KEYS = {
+        "id": ("a.id",),
+        "name": ("u.name", "a.id"),
+        "status": ("u.is_active", "a.id"),
+        "mood": ("COALESCE(a.emotion, 'Neutral')", "a.id"),
+        "date": ("a.date", "COALESCE(a.timestamp, '')", "a.id"),
+    }
 
     def add_user(self, name, phone=None, email=None, address=None, notes=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO users (name, phone, email, address, notes)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (name, phone, email, address, notes))
-        user_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO users (name, phone, email, address, notes)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (name, phone, email, address, notes))
+            user_id = cursor.lastrowid
         return user_id
 
     def update_user(self, user_id, name, phone=None, email=None, address=None, notes=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE users 
-            SET name=?, phone=?, email=?, address=?, notes=?
-            WHERE id=?
-        ''', (name, phone, email, address, notes, user_id))
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute('''
+                UPDATE users 
+                SET name=?, phone=?, email=?, address=?, notes=?
+                WHERE id=?
+            ''', (name, phone, email, address, notes, user_id))
+        notify_gallery_changed(self.db_path)
 
     def delete_user(self, user_id):
         """Soft delete: just mark as inactive."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET is_active=0 WHERE id=?', (user_id,))
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute('UPDATE users SET is_active=0 WHERE id=?', (user_id,))
+        notify_gallery_changed(self.db_path)
 
     def add_encoding(self, user_id, encoding_bytes, image_path=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO encodings (user_id, encoding, image_path)
-            VALUES (?, ?, ?)
-        ''', (user_id, encoding_bytes, image_path))
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO encodings (user_id, encoding, image_path)
+                VALUES (?, ?, ?)
+            ''', (user_id, encoding_bytes, image_path))
+            encoding_id = cursor.lastrowid
+        self._encoding_added(encoding_id, user_id, encoding_bytes)
+        return encoding_id
+
+    def _encoding_added(self, encoding_id, user_id, encoding_bytes):
+        """Called once a new encoding is committed."""
+        # Keep the embedding store and ANN index in sync (a stale store is repaired on next sync)
+        vector = decode_encoding(encoding_bytes)
+        if self.embeddings.last_encoding_id() < encoding_id:
+            self.embeddings.append([encoding_id], [user_id], [vector])
+        self.ann_index.add(encoding_id, vector)
+        notify_gallery_changed(self.db_path)
 
     def get_all_users(self):
         """Returns only active users."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
         cursor.execute('SELECT * FROM users WHERE is_active=1')
         users = cursor.fetchall()
-        conn.close()
         return users
 
     def get_user(self, user_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
         cursor.execute('SELECT * FROM users WHERE id=?', (user_id,))
         user = cursor.fetchone()
-        conn.close()
         return user
 
     def get_all_encodings(self):
         """Returns a list of tuples: (user_id, encoding_blob) for active users only."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
         cursor.execute('''
             SELECT e.user_id, e.encoding 
             FROM encodings e
@@ -166,39 +407,117 @@ class DatabaseManager:
             WHERE u.is_active = 1
         ''')
         data = cursor.fetchall()
-        conn.close()
         return data
 
+    def sync_embedding_store(self):
+        """
+        Brings the embedding store up to date with the encodings table.
+        On an existing database the first call migrates every pickled BLOB once.
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM encodings")
+        db_count, db_max = cursor.fetchone()
+        store_count = self.embeddings.count()
+        store_max = self.embeddings.last_encoding_id()
+        
+        if (store_count, store_max) == (db_count, db_max):
+            return
+        
+        # Rows were removed behind our back: start over, otherwise only fetch the tail
+        full_rebuild = store_count > db_count or store_max > db_max
+        after_id = 0 if full_rebuild else store_max
+        cursor.execute("SELECT id, user_id, encoding FROM encodings WHERE id > ? ORDER BY id", (after_id,))
+        rows = cursor.fetchall()
+        
+        encoding_ids = [r[0] for r in rows]
+        user_ids = [r[1] for r in rows]
+        vectors = [decode_encoding(r[2]) for r in rows]
+        if full_rebuild:
+            self.embeddings.rebuild(encoding_ids, user_ids, vectors)
+        else:
+            self.embeddings.append(encoding_ids, user_ids, vectors)
+            if self.embeddings.count() != db_count:
+                # Tail append could not reconcile the two, rebuild everything
+                self.embeddings.rebuild([], [], [])
+                self.sync_embedding_store()
+
+    def get_gallery(self):
+        """
+        Returns (encoding_ids, user_ids, vectors, names) for active users.
+        vectors is a zero-copy memory map unless inactive users have to be filtered out,
+        names maps user_id -> name.
+        """
+        self.sync_embedding_store()
+        ids, vectors = self.embeddings.load()
+        names = {u[0]: u[1] for u in self.get_all_users()}
+        
+        encoding_ids = np.asarray(ids['encoding_id'])
+        user_ids = np.asarray(ids['user_id'])
+        active = np.isin(user_ids, np.fromiter(names.keys(), dtype=np.int64, count=len(names)))
+        if not active.all():
+            encoding_ids = encoding_ids[active]
+            user_ids = user_ids[active]
+            vectors = vectors[active]
+        return encoding_ids, user_ids, vectors, names
+
+    def get_gallery_generation(self):
+        """Generation of the gallery: the last recorded change, 0 before any."""
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT COALESCE(MAX(generation), 0) FROM gallery_changes")
+        return cursor.fetchone()[0]
+
+    def get_gallery_changes(self, after_generation):
+        """
+        Returns the gallery changes newer than a generation, oldest first, as
+        (generation, kind, user_id, encoding_id, encoding, name, is_active).
+        The encoding and user columns hold their current values.
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute('''
+            SELECT c.generation, c.kind, c.user_id, c.encoding_id, e.encoding, u.name, u.is_active
+            FROM gallery_changes c
+            LEFT JOIN encodings e ON e.id = c.encoding_id
+            LEFT JOIN users u ON u.id = c.user_id
+            WHERE c.generation > ?
+            ORDER BY c.generation
+        ''', (after_generation,))
+        return cursor.fetchall()
+
+    def get_user_encodings(self, user_id):
+        """Returns (encoding_id, encoding_blob) of one user."""
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT id, encoding FROM encodings WHERE user_id = ? ORDER BY id", (user_id,))
+        return cursor.fetchall()
+
     def mark_attendance(self, user_id, emotion="Neutral"):
         """Marks attendance for a user, prevents duplicates, and stores emotion."""
         today = datetime.datetime.now().strftime("%Y-%m-%d")
         now_ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Check if already present today
-        cursor.execute("SELECT id FROM attendance WHERE user_id = ? AND date = ?", (user_id, today))
-        existing = cursor.fetchone()
-        
-        if existing:
-            conn.close()
+        if self.attendance_cache.is_present(user_id, today, self.get_present_user_ids):
             return False, "Already registered today"
-
+        
         try:
-            cursor.execute("INSERT INTO attendance (user_id, date, timestamp, emotion) VALUES (?, ?, ?, ?)",
-                         (user_id, today, now_ts, emotion))
-            conn.commit()
-            conn.close()
+            with self.transaction() as cursor:
+                # The unique (user_id, date) index makes the insert its own duplicate check
+                cursor.execute("INSERT OR IGNORE INTO attendance (user_id, date, timestamp, emotion) VALUES (?, ?, ?, ?)",
+                             (user_id, today, now_ts, emotion))
+                inserted = cursor.rowcount > 0
+            self.attendance_cache.add(user_id, today)
+            if not inserted:
+                return False, "Already registered today"
             return True, "Attendance marked"
         except Exception as e:
-            conn.close()
             return False, str(e)
 
+    def get_present_user_ids(self, date):
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT user_id FROM attendance WHERE date = ?", (date,))
+        return [row[0] for row in cursor.fetchall()]
+
     def get_attendance_range(self, start_date, end_date):
         """Returns records between two dates (inclusive), including user status."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
         cursor.execute('''
             SELECT a.id, u.name, a.date, a.timestamp, u.is_active, a.emotion
             FROM attendance a
@@ -207,56 +526,93 @@ class DatabaseManager:
             ORDER BY a.date DESC, a.timestamp DESC
         ''', (start_date, end_date))
         records = cursor.fetchall()
-        conn.close()
         return records
 
+    def _history_filter(self, start_date, end_date, name_filter):
+        where = "a.date BETWEEN ? AND ?"
+        params = [start_date, end_date]
+        if name_filter:
+            where += " AND u.name LIKE ?"
+            params.append(f"%{name_filter}%")
+        return where, params
+
+    def get_attendance_page(self, start_date, end_date, after=None, limit=500,
+                            sort_key="date", descending=True, name_filter=None):
+        """
+        One page of the attendance history, using keyset pagination.
+        Returns (records, last_key); pass last_key as `after` to get the next page.
+        """
+        columns = self.HISTORY_SORT_KEYS[sort_key]
+        where, params = self._history_filter(start_date, end_date, name_filter)
+        if after is not None:
+            # Row-value comparison continues right after the last row of the previous page
+            where += f" AND ({', '.join(columns)}) {'<' if descending else '>'} ({', '.join('?' * len(columns))})"
+            params.extend(after)
+        direction = "DESC" if descending else "ASC"
+        cursor = self.get_connection().cursor()
+        cursor.execute(f'''
+            SELECT a.id, u.name, a.date, a.timestamp, u.is_active, a.emotion, {', '.join(columns)}
+            FROM attendance a
+            JOIN users u ON a.user_id = u.id
+            WHERE {where}
+            ORDER BY {', '.join(f"{c} {direction}" for c in columns)}
+            LIMIT ?
+        ''', params + [limit])
+        rows = cursor.fetchall()
+        last_key = tuple(rows[-1][6:]) if rows else after
+        return [row[:6] for row in rows], last_key
+
+    def count_attendance_range(self, start_date, end_date, name_filter=None):
+        cursor = self.get_connection().cursor()
+        where, params = self._history_filter(start_date, end_date, name_filter)
+        cursor.execute(f"SELECT COUNT(*) FROM attendance a JOIN users u ON a.user_id = u.id WHERE {where}", params)
+        return cursor.fetchone()[0]
+
     def delete_attendance_record(self, record_id):
         """Removes a specific attendance log entry."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM attendance WHERE id = ?", (record_id,))
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute("SELECT user_id, date FROM attendance WHERE id = ?", (record_id,))
+            row = cursor.fetchone()
+            cursor.execute("DELETE FROM attendance WHERE id = ?", (record_id,))
+        if row:
+            # The user can be marked again today
+            self.attendance_cache.discard(row[0], row[1])
         return True, "Attendance record deleted"
 
-    def get_attendance_stats(self):
-        """Returns (total_active_users, present_today, absence_today)"""
+    def get_attendance_stats(self, start_date=None, end_date=None):
+        """Returns (total_active_users, present, absent) for today or a date range."""
         today = datetime.datetime.now().strftime("%Y-%m-%d")
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        start_date, end_date = start_date or today, end_date or today
+        cursor = self.get_connection().cursor()
         
         cursor.execute("SELECT COUNT(*) FROM users WHERE is_active=1")
         total_users = cursor.fetchone()[0]
         
         cursor.execute('''
-            SELECT COUNT(DISTINCT a.user_id) 
-            FROM attendance a
-            JOIN users u ON a.user_id = u.id
-            WHERE a.date = ? AND u.is_active = 1
-        ''', (today,))
-        present_today = cursor.fetchone()[0]
+            SELECT COUNT(DISTINCT p.user_id) 
+            FROM attendance_presence p
+            JOIN users u ON p.user_id = u.id
+            WHERE p.date BETWEEN ? AND ? AND u.is_active = 1
+        ''', (start_date, end_date))
+        present = cursor.fetchone()[0]
         
-        conn.close()
-        return total_users, present_today, total_users - present_today
+        return total_users, present, total_users - present
 
-    def get_mood_stats(self):
-        """Returns emotion counts for today's attendance."""
+    def get_mood_stats(self, start_date=None, end_date=None):
+        """Returns emotion counts for today's attendance (or a date range)."""
         today = datetime.datetime.now().strftime("%Y-%m-%d")
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
         cursor.execute('''
-            SELECT emotion, COUNT(*) FROM attendance 
-            WHERE date = ? 
+            SELECT emotion, SUM(count) FROM attendance_mood_daily 
+            WHERE date BETWEEN ? AND ? 
             GROUP BY emotion
-        ''', (today,))
+        ''', (start_date or today, end_date or today))
         stats = cursor.fetchall()
-        conn.close()
         return stats
 
     def get_attendance_today(self):
         today = datetime.datetime.now().strftime("%Y-%m-%d")
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
         cursor.execute('''
             SELECT u.name, a.timestamp, u.is_active, a.emotion
             FROM attendance a
@@ -265,48 +621,43 @@ class DatabaseManager:
             ORDER BY a.timestamp DESC
         ''', (today,))
         records = cursor.fetchall()
-        conn.close()
         return records
 
-    def get_peak_hours(self):
-        """Returns list of (hour, count)"""
+    def get_peak_hours(self, start_date=None, end_date=None):
+        """Returns list of (hour, count) for today (or a date range)"""
         today = datetime.datetime.now().strftime("%Y-%m-%d")
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
         cursor.execute('''
-            SELECT strftime('%H', timestamp) as hour, COUNT(*) 
-            FROM attendance 
-            WHERE date = ?
+            SELECT hour, SUM(count) 
+            FROM attendance_hourly 
+            WHERE date BETWEEN ? AND ?
             GROUP BY hour
             ORDER BY hour ASC
-        ''', (today,))
+        ''', (start_date or today, end_date or today))
         data = cursor.fetchall()
-        conn.close()
         return data
 
-    def get_top_disciplined(self, limit=5):
+    def get_top_disciplined(self, limit=5, days=30):
         """Returns list of (name, count) for the last 30 days"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        since = (datetime.datetime.now() - datetime.timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        cursor = self.get_connection().cursor()
         cursor.execute('''
-            SELECT u.name, COUNT(a.id) as count
-            FROM users u
-            JOIN attendance a ON u.id = a.user_id
-            GROUP BY u.id
+            SELECT u.name, COUNT(*) as count
+            FROM attendance_presence p
+            JOIN users u ON u.id = p.user_id
+            WHERE p.date >= ?
+            GROUP BY p.user_id
             ORDER BY count DESC
             LIMIT ?
-        ''', (limit,))
+        ''', (since, limit))
         data = cursor.fetchall()
-        conn.close()
         return data
 
     def verify_admin_password(self, password):
         """Verifies if the provided password matches the stored hash."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.get_connection().cursor()
         cursor.execute("SELECT value FROM settings WHERE key='admin_password'")
         result = cursor.fetchone()
-        conn.close()
         
         if result:
             stored_hash = result[0].encode('utf-8')
@@ -316,69 +667,276 @@ class DatabaseManager:
     def update_admin_password(self, new_password):
         """Updates the admin password with a new hash."""
         hashed = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE settings SET value=? WHERE key='admin_password'", (hashed,))
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute("UPDATE settings SET value=? WHERE key='admin_password'", (hashed,))
+        self.settings.update("admin_password", hashed)
         return True
 
+    def _load_settings(self):
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT key, value FROM settings")
+        return cursor.fetchall()
+
     def get_setting(self, key, default=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT value FROM settings WHERE key=?", (key,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else default
+        self.settings.ensure_loaded(self._load_settings)
+        return self.settings.get(key, default)
+
+    def get_typed_setting(self, key):
+        """Returns an engine setting (see settings_store.SETTING_TYPES) parsed to its type."""
+        self.settings.ensure_loaded(self._load_settings)
+        return self.settings.get_typed(key)
 
     def set_setting(self, key, value):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+        self.settings.update(key, str(value))
 
-    def log_stranger(self, image_data):
+    def log_stranger(self, image_data, embedding=None):
         """Logs a stranger or updates their last seen."""
-        # Save image to a 'strangers' folder
-        os.makedirs("data/strangers", exist_ok=True)
-        filename = f"stranger_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-        filepath = os.path.join("data/strangers", filename)
-        
-        import cv2
-        cv2.imwrite(filepath, image_data)
-        
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO strangers (image_path, first_seen, last_seen, count)
-            VALUES (?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, 1)
-        ''', (filepath,))
-        conn.commit()
-        conn.close()
+        seen_at = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        # A repeat sighting only updates the existing stranger, no new crop
+        filepath = None
+        if self.find_recent_stranger(embedding) is None:
+            filepath = self.save_stranger_crop(image_data)
+        self.write_events([{"type": "stranger", "event_id": uuid.uuid4().hex, "image_path": filepath,
+                            "seen_at": seen_at, "embedding": embedding_list(embedding)}])
+        return True
+
+    def _load_recent_strangers(self):
+        cutoff = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=RECENT_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT id, embedding FROM strangers WHERE embedding IS NOT NULL AND last_seen >= ? "
+                       "ORDER BY last_seen DESC", (cutoff,))
+        return [(sid, decode_encoding(blob)) for sid, blob in cursor.fetchall()]
+
+    def find_recent_stranger(self, embedding):
+        """Id of a recently seen stranger with this face, or None."""
+        if embedding is None:
+            return None
+        self.stranger_index.ensure_loaded(self._load_recent_strangers)
+        return self.stranger_index.nearest(embedding)
+
+    def save_stranger_crop(self, image_data):
+        """Saves a stranger crop (and its thumbnail) to the 'strangers' folder and returns its path."""
+        return self.crops.save(image_data)
+
+    def _remove_crop_if_unused(self, path):
+        # Identical crops share one file, and promoted strangers keep theirs as the user's photo
+        if not path:
+            return
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT 1 FROM strangers WHERE image_path = ? UNION ALL "
+                       "SELECT 1 FROM encodings WHERE image_path = ? LIMIT 1", (path, path))
+        if cursor.fetchone() is None:
+            self.crops.remove(path)
+
+    def sync_stranger_store(self):
+        """Brings the stranger embedding store up to date with the strangers table."""
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM strangers WHERE embedding IS NOT NULL")
+        db_count, db_max = cursor.fetchone()
+        store = self.stranger_embeddings
+        store_count = store.count()
+        store_max = store.last_encoding_id()
+
+        if (store_count, store_max) == (db_count, db_max):
+            return
+
+        # Merged or deleted strangers: start over, otherwise only fetch the new ones
+        full_rebuild = store_count > db_count or store_max > db_max
+        after_id = 0 if full_rebuild else store_max
+        cursor.execute("SELECT id, embedding FROM strangers WHERE embedding IS NOT NULL AND id > ? ORDER BY id", (after_id,))
+        rows = cursor.fetchall()
+
+        # The store's encoding_id column holds the stranger id
+        stranger_ids = [r[0] for r in rows]
+        vectors = [decode_encoding(r[1]) for r in rows]
+        if full_rebuild:
+            store.rebuild(stranger_ids, [0] * len(rows), vectors)
+        else:
+            store.append(stranger_ids, [0] * len(rows), vectors)
+            if store.count() != db_count:
+                store.rebuild([], [], [])
+                self.sync_stranger_store()
+
+    def search_strangers(self, embedding, limit=20):
+        """
+        Ranks every stranger with a stored embedding by distance to a face.
+        Returns up to limit (id, image_path, first_seen, last_seen, count, distance), closest first.
+        """
+        self.sync_stranger_store()
+        ids, vectors = self.stranger_embeddings.load()
+        if len(ids) == 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        distances = np.linalg.norm(vectors - query, axis=1)
+        k = min(limit, len(distances))
+        top = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(len(distances))
+        top = top[np.argsort(distances[top])]
+        ranked = [(int(ids['encoding_id'][i]), float(distances[i])) for i in top]
+
+        cursor = self.get_connection().cursor()
+        placeholders = ",".join("?" * len(ranked))
+        cursor.execute(f"SELECT id, image_path, first_seen, last_seen, count FROM strangers WHERE id IN ({placeholders})",
+                       [sid for sid, _ in ranked])
+        rows = {r[0]: r for r in cursor.fetchall()}
+        return [rows[sid] + (distance,) for sid, distance in ranked if sid in rows]
+
+    def promote_stranger(self, stranger_id, name):
+        """
+        Enrolls a stranger as a new user from the stored embedding, without re-encoding.
+        The crop becomes the user's photo. Returns the new user id.
+        The user, their encoding and the removal of the stranger are one transaction.
+        """
+        with self.transaction() as cursor:
+            # Under the write lock, so the same stranger cannot be promoted twice
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT image_path, embedding FROM strangers WHERE id = ?", (stranger_id,))
+            row = cursor.fetchone()
+            if row is None or row[1] is None:
+                raise ValueError("This stranger no longer exists or has no stored face embedding.")
+            image_path, embedding = row
+            cursor.execute("INSERT INTO users (name, notes) VALUES (?, ?)", (name, "Promoted from the stranger log"))
+            user_id = cursor.lastrowid
+            # Stored in the same raw float64 format as the encodings table
+            cursor.execute("INSERT INTO encodings (user_id, encoding, image_path) VALUES (?, ?, ?)",
+                           (user_id, embedding, image_path))
+            encoding_id = cursor.lastrowid
+            cursor.execute("DELETE FROM strangers WHERE id = ?", (stranger_id,))
+        self._encoding_added(encoding_id, user_id, embedding)
+        self.stranger_index.remove([stranger_id])
+        return user_id
+
+    def write_events(self, events):
+        """
+        Writes attendance / stranger events in a single transaction.
+        A stranger whose embedding matches a recent one (also one added earlier in
+        this batch) counts as a repeat sighting, and a crop saved for it is deleted.
+        Safe to replay: attendance is deduplicated by the unique index, stranger
+        events by their event_id.
+        """
+        attendance = [(e["user_id"], e["date"], e["timestamp"], e["emotion"])
+                      for e in events if e["type"] == "attendance"]
+        strangers = [e for e in events if e["type"] == "stranger"]
+        unused_crops = []
+        try:
+            with self.transaction() as cursor:
+                cursor.executemany("INSERT OR IGNORE INTO attendance (user_id, date, timestamp, emotion) VALUES (?, ?, ?, ?)",
+                                   attendance)
+                for event in strangers:
+                    if not self._write_stranger(cursor, event) and event.get("image_path"):
+                        unused_crops.append(event["image_path"])
+        except BaseException:
+            # Strangers added to the index by the rolled back batch
+            if strangers:
+                self.stranger_index.invalidate()
+            raise
+        for user_id, date, _, _ in attendance:
+            self.attendance_cache.add(user_id, date)
+        for path in set(unused_crops):
+            self._remove_crop_if_unused(path)
+
+    def _write_stranger(self, cursor, event):
+        """Applies one stranger event. Returns True if it added a stranger row (which keeps the crop)."""
+        embedding = event.get("embedding")
+        seen_at = event["seen_at"]
+        event_id = event.get("event_id")
+        if event_id is not None:
+            cursor.execute("INSERT OR IGNORE INTO stranger_sightings (event_id, seen_at) VALUES (?, ?)",
+                           (event_id, seen_at))
+            if cursor.rowcount == 0:
+                return False # written before, replayed from the journal
+        stranger_id = self.find_recent_stranger(embedding)
+        while stranger_id is not None:
+            cursor.execute("UPDATE strangers SET count = count + 1, last_seen = MAX(last_seen, ?) WHERE id = ?",
+                           (seen_at, stranger_id))
+            if cursor.rowcount:
+                return False
+            # Merged away, promoted or deleted since the index was loaded: look again without it
+            self.stranger_index.remove([stranger_id])
+            stranger_id = self.find_recent_stranger(embedding)
+        blob = encode_encoding(embedding) if embedding is not None else None
+        cursor.execute("INSERT INTO strangers (image_path, first_seen, last_seen, count, embedding) VALUES (?, ?, ?, 1, ?)",
+                       (event["image_path"], seen_at, seen_at, blob))
+        if embedding is not None:
+            # Visible to the next events of this batch already
+            self.stranger_index.add(cursor.lastrowid, embedding)
         return True
 
+    def prune_stranger_sightings(self, days=7):
+        """Forgets event ids older than any journal that could still be replayed."""
+        cutoff = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        with self.transaction() as cursor:
+            cursor.execute("DELETE FROM stranger_sightings WHERE seen_at < ?", (cutoff,))
+            return cursor.rowcount
+
+    def recluster_strangers(self, tolerance=MERGE_TOLERANCE):
+        """
+        Merges strangers whose embeddings ended up in separate rows (seen before the
+        index knew them, or drifted apart over time). The oldest row of each group is
+        kept with the summed count, the full seen range and the mean embedding; the
+        other rows and their crops are removed. Returns the number of rows merged away.
+        Clustering runs without holding the write lock, the merge itself does not
+        trust that snapshot and reads the rows again under it.
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT id, embedding FROM strangers WHERE embedding IS NOT NULL ORDER BY id")
+        rows = cursor.fetchall()
+        if len(rows) < 2:
+            return 0
+        clusters = find_clusters([decode_encoding(r[1]) for r in rows], tolerance)
+        if not clusters:
+            return 0
+
+        removed_paths = []
+        merged = 0
+        with self.transaction() as cursor:
+            # The counts are summed from the rows as they are now, under the write lock:
+            # sightings written since the snapshot above are kept
+            cursor.execute("BEGIN IMMEDIATE")
+            for members in clusters:
+                group = [rows[i] for i in members]
+                keep = group[0]
+                ids = [r[0] for r in group]
+                placeholders = ",".join("?" * len(ids))
+                cursor.execute(f"SELECT id, image_path FROM strangers WHERE id IN ({placeholders})", ids)
+                current = dict(cursor.fetchall())
+                if keep[0] not in current or len(current) < 2:
+                    continue # deleted or promoted meanwhile
+                embedding = np.mean([decode_encoding(r[1]) for r in group if r[0] in current], axis=0)
+                cursor.execute(f'''
+                    UPDATE strangers SET
+                        first_seen = (SELECT MIN(first_seen) FROM strangers WHERE id IN ({placeholders})),
+                        last_seen = (SELECT MAX(last_seen) FROM strangers WHERE id IN ({placeholders})),
+                        count = (SELECT SUM(COALESCE(count, 1)) FROM strangers WHERE id IN ({placeholders})),
+                        embedding = ?
+                    WHERE id = ?
+                ''', ids * 3 + [encode_encoding(embedding), keep[0]])
+                others = [sid for sid in current if sid != keep[0]]
+                cursor.executemany("DELETE FROM strangers WHERE id = ?", [(sid,) for sid in others])
+                # Before the commit, so the writer stops updating rows that are about to go
+                self.stranger_index.remove(others)
+                removed_paths.extend(current[sid] for sid in others if current[sid] and current[sid] != current[keep[0]])
+                merged += len(others)
+        self.stranger_index.invalidate()
+
+        for path in set(removed_paths):
+            self._remove_crop_if_unused(path)
+        return merged
+
     def get_all_strangers(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM strangers ORDER BY last_seen DESC")
+        cursor = self.get_connection().cursor()
+        cursor.execute("SELECT id, image_path, first_seen, last_seen, count FROM strangers ORDER BY last_seen DESC")
         data = cursor.fetchall()
-        conn.close()
         return data
 
     def delete_stranger(self, stranger_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        # Get path for cleanup
-        cursor.execute("SELECT image_path FROM strangers WHERE id=?", (stranger_id,))
-        row = cursor.fetchone()
-        if row and os.path.exists(row[0]):
-            try:
-                os.remove(row[0])
-            except:
-                pass
-            
-        cursor.execute("DELETE FROM strangers WHERE id=?", (stranger_id,))
-        conn.commit()
-        conn.close()
+        with self.transaction() as cursor:
+            # Get path for cleanup
+            cursor.execute("SELECT image_path FROM strangers WHERE id=?", (stranger_id,))
+            row = cursor.fetchone()
+            cursor.execute("DELETE FROM strangers WHERE id=?", (stranger_id,))
+        self.stranger_index.remove([stranger_id])
+        if row:
+            self._remove_crop_if_unused(row[0])
         return True
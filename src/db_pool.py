@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import threading
+
+BUSY_TIMEOUT_MS = 5000
+CACHED_STATEMENTS = 256
+
+class _ThreadConnection:
+    """Holds one thread's connection; closes it when the thread (and its locals) go away."""
+    def __init__(self, pool, conn):
+        self.pool = pool
+        self.conn = conn
+        self.pid = os.getpid()
+
+    def __del__(self):
+        self.pool._forget(self)
+        # A connection inherited through fork() belongs to the parent process
+        if self.pid == os.getpid():
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+
+class ConnectionPool:
+    """
+    One persistent SQLite connection per thread for a database file.
+    Connections use WAL so readers (UI tabs) and the writer (camera thread) do
+    not block each other, synchronous=NORMAL (durable at checkpoints, no fsync
+    per commit) and a busy timeout instead of failing on a locked database.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = {} # {id(holder): connection}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000.0,
+                               check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        return conn
+
+    def connection(self):
+        """Returns the calling thread's connection, opening it on first use."""
+        holder = getattr(self._local, "holder", None)
+        if holder is None or holder.pid != os.getpid():
+            holder = _ThreadConnection(self, self._connect())
+            with self._lock:
+                self._open[id(holder)] = holder.conn
+            self._local.holder = holder
+        return holder.conn
+
+    def _forget(self, holder):
+        with self._lock:
+            self._open.pop(id(holder), None)
+
+    def close_all(self):
+        """Closes every connection of this pool (application exit)."""
+        with self._lock:
+            connections = list(self._open.values())
+            self._open.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path):
+    """Returns the process-wide pool of a database file."""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path)
+        return pool
+
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
@@ -0,0 +1,85 @@
+import os
+import pickle
+import numpy as np
+
+EMBEDDING_DIM = 128
+
+# One row of the id file: which encodings row / user a vector belongs to
+ID_DTYPE = np.dtype([('encoding_id', '<i8'), ('user_id', '<i8')])
+VECTOR_ROW_BYTES = EMBEDDING_DIM * 4
+
+def encode_encoding(encoding):
+    """Serializes an encoding as raw float64 bytes (no pickle)."""
+    return np.asarray(encoding, dtype=np.float64).tobytes()
+
+def decode_encoding(enc_bytes):
+    """Decodes an encoding BLOB. Handles raw float64 bytes and legacy pickled arrays."""
+    if len(enc_bytes) == EMBEDDING_DIM * 8:
+        return np.frombuffer(enc_bytes, dtype=np.float64)
+    return np.asarray(pickle.loads(enc_bytes), dtype=np.float64)
+
+class EmbeddingStore:
+    """
+    Append-only on-disk copy of the encodings table.
+    <base>.f32 holds fixed-width float32 rows, <base>.ids the (encoding_id, user_id)
+    of each row. Both are memory-mapped on load, so opening a large gallery costs
+    no parsing at all.
+    """
+    def __init__(self, base_path):
+        self.vectors_path = base_path + ".f32"
+        self.ids_path = base_path + ".ids"
+
+    def _file_size(self, path):
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def count(self):
+        """Number of complete rows (a torn write at the tail is ignored)."""
+        return min(self._file_size(self.vectors_path) // VECTOR_ROW_BYTES,
+                   self._file_size(self.ids_path) // ID_DTYPE.itemsize)
+
+    def load(self):
+        """Returns (ids, vectors) as read-only memory maps."""
+        count = self.count()
+        if count == 0:
+            return np.zeros(0, dtype=ID_DTYPE), np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        ids = np.memmap(self.ids_path, dtype=ID_DTYPE, mode='r', shape=(count,))
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(count, EMBEDDING_DIM))
+        return ids, vectors
+
+    def last_encoding_id(self):
+        count = self.count()
+        if count == 0:
+            return 0
+        with open(self.ids_path, 'rb') as f:
+            f.seek((count - 1) * ID_DTYPE.itemsize)
+            return int(np.frombuffer(f.read(ID_DTYPE.itemsize), dtype=ID_DTYPE)['encoding_id'][0])
+
+    def _truncate_to_count(self):
+        """Drops any partially written row so both files stay aligned."""
+        count = self.count()
+        for path, row_bytes in ((self.vectors_path, VECTOR_ROW_BYTES), (self.ids_path, ID_DTYPE.itemsize)):
+            if self._file_size(path) != count * row_bytes:
+                with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                    f.truncate(count * row_bytes)
+
+    def append(self, encoding_ids, user_ids, vectors):
+        """Appends rows at the end of the store."""
+        if len(encoding_ids) == 0:
+            return
+        self._truncate_to_count()
+        ids = np.zeros(len(encoding_ids), dtype=ID_DTYPE)
+        ids['encoding_id'] = encoding_ids
+        ids['user_id'] = user_ids
+        vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(-1, EMBEDDING_DIM))
+        # Vectors first: a crash between the two writes leaves an ignored tail
+        with open(self.vectors_path, 'ab') as f:
+            f.write(vectors.tobytes())
+        with open(self.ids_path, 'ab') as f:
+            f.write(ids.tobytes())
+
+    def rebuild(self, encoding_ids, user_ids, vectors):
+        """Replaces the whole store."""
+        for path in (self.vectors_path, self.ids_path):
+            with open(path, 'wb'):
+                pass
+        self.append(encoding_ids, user_ids, vectors)
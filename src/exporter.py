@@ -0,0 +1,81 @@
+import os
+import csv
+
+ATTENDANCE_COLUMNS = ["ID", "Name", "Status", "Mood", "Date", "Timestamp"]
+CHUNK_SIZE = 2000
+
+class ExportCancelled(Exception):
+    """Raised by export_attendance when should_stop() asked it to stop."""
+
+def with_export_extension(path, selected_filter):
+    """Appends the extension of the file dialog filter chosen, unless the name already ends in .csv or .xlsx."""
+    if os.path.splitext(path)[1].lower() in (".csv", ".xlsx"):
+        return path
+    return path + (".xlsx" if "xlsx" in selected_filter else ".csv")
+
+def iter_attendance(db, start_date, end_date, chunk_size=CHUNK_SIZE):
+    """Yields report rows (see ATTENDANCE_COLUMNS) of a date range, reading SQLite one page at a time."""
+    after = None
+    while True:
+        records, after = db.get_attendance_page(start_date, end_date, after, chunk_size)
+        for rid, name, date, ts, is_active, emotion in records:
+            yield (rid, name, "Active" if is_active == 1 else "Deleted", emotion or "Neutral", date, ts)
+        if len(records) < chunk_size:
+            break
+
+class _CsvSink:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+class _XlsxSink:
+    def __init__(self, path):
+        from openpyxl import Workbook
+        self.path = path
+        # Write-only mode streams rows to disk instead of building the sheet in memory
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("Attendance")
+
+    def write(self, row):
+        self.sheet.append(list(row))
+
+    def close(self):
+        self.workbook.save(self.path)
+
+def export_attendance(db, path, start_date, end_date, columns=ATTENDANCE_COLUMNS, progress=None, should_stop=None):
+    """
+    Streams an attendance range to a .csv or .xlsx file with constant memory.
+    progress(done, total) is called after every chunk. Returns the number of rows written.
+    A stopped or failed export deletes the partial file (stopping raises ExportCancelled).
+    """
+    total = db.count_attendance_range(start_date, end_date)
+    picks = [ATTENDANCE_COLUMNS.index(c) for c in columns]
+    sink = _XlsxSink(path) if path.lower().endswith(".xlsx") else _CsvSink(path)
+    written = 0
+    completed = False
+    try:
+        sink.write(columns)
+        for row in iter_attendance(db, start_date, end_date):
+            sink.write([row[i] for i in picks])
+            written += 1
+            if written % CHUNK_SIZE == 0:
+                if progress:
+                    progress(written, total)
+                if should_stop and should_stop():
+                    raise ExportCancelled()
+        completed = True
+    finally:
+        try:
+            sink.close()
+        finally:
+            if not completed and os.path.exists(path):
+                os.remove(path)
+    if progress:
+        progress(written, max(total, written))
+    return written
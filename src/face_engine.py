@@ -1,7 +1,28 @@
-import face_recognition
 import cv2
 import numpy as np
-import pickle
+from collections import namedtuple
+from src.embedding_store import encode_encoding, decode_encoding
+from src.ann_index import DEFAULT_NPROBE
+
+# Result of matching one face against the gallery.
+# top_k is a list of (id, distance) pairs sorted by distance.
+FaceMatch = namedtuple("FaceMatch", ["index", "id", "name", "distance", "is_match", "top_k"])
+
+def face_api():
+    """
+    Returns the face_recognition module. Importing it loads dlib and its
+    models, so it is done on first use instead of at application start.
+    """
+    import face_recognition
+    return face_recognition
+
+def warm_up():
+    """Loads the dlib models and runs each network once, so the first real frame does not pay for it."""
+    api = face_api()
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+    api.face_locations(image)
+    api.face_encodings(image, [(8, 56, 56, 8)])
+    api.face_landmarks(image, [(8, 56, 56, 8)])
 
 class FaceEngine:
     DEFAULT_TOLERANCE = 0.45
@@ -11,7 +32,7 @@ class FaceEngine:
 
     def load_image(self, image_path):
         """Loads an image file."""
-        return face_recognition.load_image_file(image_path)
+        return face_api().load_image_file(image_path)
 
     def preprocess_image(self, image):
         """Applies CLAHE to normalize lighting and enhance details."""
@@ -33,94 +54,119 @@ class FaceEngine:
         """
         Returns a list of face encodings found in the image.
         """
-        return face_recognition.face_encodings(image, face_locations, num_jitters=num_jitters)
+        return face_api().face_encodings(image, face_locations, num_jitters=num_jitters)
+
+    def detect_faces(self, image, roi=None):
+        """
+        Face locations in the image, optionally only searched inside a
+        (top, right, bottom, left) region. Locations are in image coordinates.
+        """
+        if roi is None:
+            return face_api().face_locations(image)
+        top, right, bottom, left = roi
+        if bottom <= top or right <= left:
+            return []
+        crop = np.ascontiguousarray(image[top:bottom, left:right])
+        return [(t + top, r + left, b + top, l + left) for t, r, b, l in face_api().face_locations(crop)]
 
     def encode_to_bytes(self, encoding):
-        """Converts numpy array encoding to bytes for storage."""
-        return pickle.dumps(encoding)
+        """Converts numpy array encoding to raw bytes for storage."""
+        return encode_encoding(encoding)
 
     def get_face_landmarks(self, image, face_locations=None):
         """Returns facial landmarks for the first face found."""
-        return face_recognition.face_landmarks(image, face_locations)
+        return face_api().face_landmarks(image, face_locations)
 
-    def detect_emotion(self, image, face_location):
+    def analyze_faces(self, image, face_locations):
         """
-        Detects basic emotion (Happy, Neutral, Surprised) based on normalized landmarks.
-        Much more robust against face distance/scale changes.
+        Runs the 68-point landmark predictor ONCE for all given faces and derives
+        every landmark-based feature from that single pass, vectorised across faces.
+        Returns one dict per face: {"ear": float, "emotion": str, "landmarks": dict}
         """
-        landmarks_list = face_recognition.face_landmarks(image, [face_location])
-        if not landmarks_list:
-            return "Neutral"
-            
-        landmarks = landmarks_list[0]
+        if not face_locations:
+            return []
+        landmarks_list = face_api().face_landmarks(image, face_locations)
         
-        # 1. Get Reference Dimension: Eye-to-Eye distance (Face Width baseline)
-        left_eye = np.array(landmarks.get('left_eye', []))
-        right_eye = np.array(landmarks.get('right_eye', []))
+        results = [{"ear": 1.0, "emotion": "Neutral", "landmarks": lm} for lm in landmarks_list]
+        required = ('left_eye', 'right_eye', 'top_lip', 'bottom_lip', 'left_eyebrow')
+        valid = [i for i, lm in enumerate(landmarks_list) if all(lm.get(k) for k in required)]
+        if not valid:
+            return results
         
-        if len(left_eye) == 0 or len(right_eye) == 0:
-            return "Neutral"
-            
-        # Center of each eye
-        left_eye_center = np.mean(left_eye, axis=0)
-        right_eye_center = np.mean(right_eye, axis=0)
-        face_width = np.linalg.norm(left_eye_center - right_eye_center)
+        def stack(key):
+            return np.array([landmarks_list[i][key] for i in valid], dtype=np.float64)
         
-        if face_width < 1: face_width = 1 # Avoid division by zero
+        left_eye, right_eye = stack('left_eye'), stack('right_eye')
+        ears = (self._eye_aspect_ratios(left_eye) + self._eye_aspect_ratios(right_eye)) / 2.0
+        emotions = self._classify_emotions(left_eye, right_eye, stack('top_lip'), stack('bottom_lip'), stack('left_eyebrow'))
+        
+        for i, ear, emotion in zip(valid, ears, emotions):
+            results[i]["ear"] = float(ear)
+            results[i]["emotion"] = emotion
+        return results
+
+    def _eye_aspect_ratios(self, eyes):
+        """EAR for a (faces x 6 x 2) array of eye points."""
+        A = np.linalg.norm(eyes[:, 1] - eyes[:, 5], axis=1)
+        B = np.linalg.norm(eyes[:, 2] - eyes[:, 4], axis=1)
+        C = np.linalg.norm(eyes[:, 0] - eyes[:, 3], axis=1)
+        return (A + B) / (2.0 * np.maximum(C, 1e-6))
+
+    def _classify_emotions(self, left_eye, right_eye, top_lip, bottom_lip, left_eyebrow):
+        """
+        Detects basic emotion (Happy, Neutral, Surprised) based on normalized landmarks.
+        Much more robust against face distance/scale changes.
+        """
+        # 1. Get Reference Dimension: Eye-to-Eye distance (Face Width baseline)
+        left_eye_center = left_eye.mean(axis=1)
+        right_eye_center = right_eye.mean(axis=1)
+        face_width = np.maximum(np.linalg.norm(left_eye_center - right_eye_center, axis=1), 1) # Avoid division by zero
         
         # 2. Analyze Mouth
-        top_lip = landmarks.get('top_lip', [])
-        bottom_lip = landmarks.get('bottom_lip', [])
-        if not top_lip or not bottom_lip: return "Neutral"
-            
-        # Normalized Mouth Width
-        mouth_width = np.linalg.norm(np.array(top_lip[0]) - np.array(top_lip[6]))
+        mouth_width = np.linalg.norm(top_lip[:, 0] - top_lip[:, 6], axis=1)
         mouth_width_ratio = mouth_width / face_width
         
         # Normalized Mouth Height (Openness)
-        mouth_height = np.linalg.norm(np.array(top_lip[9]) - np.array(bottom_lip[9]))
-        mouth_open_ratio = mouth_height / mouth_width if mouth_width > 0 else 0
+        mouth_height = np.linalg.norm(top_lip[:, 9] - bottom_lip[:, 9], axis=1)
+        mouth_open_ratio = np.divide(mouth_height, mouth_width, out=np.zeros_like(mouth_height), where=mouth_width > 0)
         
         # 3. Analyze Eyebrows (Surprise indicator)
-        left_eyebrow = landmarks.get('left_eyebrow', [])
-        if left_eyebrow:
-            # Distance from eye to eyebrow center normalized
-            eb_center = np.mean(np.array(left_eyebrow), axis=0)
-            eb_elevation = np.linalg.norm(eb_center - left_eye_center) / face_width
-        else:
-            eb_elevation = 0
+        eb_center = left_eyebrow.mean(axis=1)
+        eb_elevation = np.linalg.norm(eb_center - left_eye_center, axis=1) / face_width
 
         # --- HEURISTIC LOGIC ---
         
         # A. Surprised: Mouth open wide OR high eyebrow elevation
-        if mouth_open_ratio > 0.45 or eb_elevation > 0.65:
-            return "Surprised"
-            
+        surprised = (mouth_open_ratio > 0.45) | (eb_elevation > 0.65)
+        
         # B. Happy: Wider mouth (ratio > 0.9) AND lifted corners
         # Note: Standard mouth_width_ratio is around 0.7-0.8
-        corners_y = (top_lip[0][1] + top_lip[6][1]) / 2
-        center_y = top_lip[3][1]
+        corners_y = (top_lip[:, 0, 1] + top_lip[:, 6, 1]) / 2
+        center_y = top_lip[:, 3, 1]
         corners_lifted = corners_y < center_y - (face_width * 0.02) # Lifted relative to face scale
+        happy = (mouth_width_ratio > 0.95) | ((mouth_width_ratio > 0.85) & corners_lifted)
         
-        if mouth_width_ratio > 0.95 or (mouth_width_ratio > 0.85 and corners_lifted):
-            return "Happy"
-            
-        return "Neutral"
+        return np.where(surprised, "Surprised", np.where(happy, "Happy", "Neutral")).tolist()
+
+    def detect_emotion(self, image, face_location):
+        """Detects the emotion of a single face. Prefer analyze_faces for several features/faces."""
+        analysis = self.analyze_faces(image, [face_location])
+        return analysis[0]["emotion"] if analysis else "Neutral"
 
     def decode_from_bytes(self, enc_bytes):
-        """Converts bytes back to numpy array."""
-        return pickle.loads(enc_bytes)
+        """Converts bytes (raw or legacy pickle) back to numpy array."""
+        return decode_encoding(enc_bytes)
 
     def compare_faces(self, known_encodings, face_encoding_to_check, tolerance=None):
         if tolerance is None:
             tolerance = self.DEFAULT_TOLERANCE
-        return face_recognition.compare_faces(known_encodings, face_encoding_to_check, tolerance=tolerance)
+        return face_api().compare_faces(known_encodings, face_encoding_to_check, tolerance=tolerance)
 
     def face_distance(self, known_encodings, face_encoding_to_check):
         """
         Returns the euclidean distance for each face.
         """
-        return face_recognition.face_distance(known_encodings, face_encoding_to_check)
+        return face_api().face_distance(known_encodings, face_encoding_to_check)
 
     def get_eye_landmarks(self, face_landmarks_list):
         """
@@ -155,13 +201,120 @@ class FaceEngine:
     def check_liveness(self, rgb_image, face_location):
         """
         Helper to get EAR for a face.
-        Note: face_recognition.face_landmarks can be slow in real-time.
+        Note: face_recognition.face_landmarks can be slow in real-time,
+        use analyze_faces to share one landmark pass between features.
         """
-        face_landmarks_list = face_recognition.face_landmarks(rgb_image, [face_location])
-        left_eye, right_eye = self.get_eye_landmarks(face_landmarks_list)
-        
-        if left_eye and right_eye:
-            left_ear = self.calculate_ear(left_eye)
-            right_ear = self.calculate_ear(right_eye)
-            return (left_ear + right_ear) / 2.0
-        return 1.0 # Default to "open" if eyes not found
+        analysis = self.analyze_faces(rgb_image, [face_location])
+        return analysis[0]["ear"] if analysis else 1.0 # Default to "open" if eyes not found
+
+
+class GalleryMatcher:
+    """
+    Keeps the known encodings as one contiguous float32 matrix and matches
+    every face of a frame in a single matrix operation.
+    """
+    def __init__(self, encodings=None, ids=None, names=None, sq_norms=None):
+        self.set_gallery(encodings if encodings is not None else [], ids, names, sq_norms)
+
+    @classmethod
+    def from_database(cls, db):
+        """
+        Builds a matcher straight from the memory-mapped embedding store.
+        Large galleries get the persisted IVF index attached if one was trained;
+        this never trains, so worker processes fall back to exact search instead.
+        """
+        encoding_ids, user_ids, vectors, names = db.get_gallery()
+        matcher = cls(vectors, user_ids, names)
+        index = db.ann_index.load(encoding_ids, matcher.matrix)
+        matcher.attach_index(index, db.get_typed_setting("ann_nprobe"))
+        return matcher
+
+    def set_gallery(self, encodings, ids=None, names=None, sq_norms=None):
+        """
+        names is either a list aligned with the encodings or a dict id -> name.
+        A float32 memory map is used as-is without copying.
+        sq_norms can be passed when the caller already keeps them.
+        """
+        matrix = np.asarray(encodings, dtype=np.float32)
+        self.matrix = np.ascontiguousarray(matrix.reshape(-1, 128))
+        # Squared norms are cached so a query only costs one matrix product
+        if sq_norms is None:
+            sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+        self.sq_norms = sq_norms
+        count = len(self.matrix)
+        self.ids = np.asarray(ids, dtype=np.int64) if ids is not None else np.arange(count)
+        self.names = names if names is not None else {}
+        self.index = None
+        self.nprobe = DEFAULT_NPROBE
+
+    def attach_index(self, index, nprobe=DEFAULT_NPROBE):
+        """Uses an IVFIndex (aligned with the gallery rows) instead of a full scan."""
+        self.index = index
+        self.nprobe = nprobe
+
+    def __len__(self):
+        return len(self.matrix)
+
+    def get_name(self, index):
+        if isinstance(self.names, dict):
+            return self.names.get(int(self.ids[index]))
+        return self.names[index]
+
+    def distances(self, face_encodings):
+        """
+        Returns a (faces x gallery) matrix of euclidean distances.
+        Uses ||a - b||^2 = ||a||^2 + ||b||^2 - 2ab so the gallery is scanned once.
+        """
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        q_norms = np.einsum('ij,ij->i', queries, queries)
+        sq = q_norms[:, None] + self.sq_norms[None, :] - 2.0 * (queries @ self.matrix.T)
+        np.maximum(sq, 0, out=sq) # Rounding can push exact matches slightly below zero
+        return np.sqrt(sq)
+
+    def _search(self, queries):
+        """Yields (rows, distances) per query: all rows, or the IVF candidates re-ranked exactly."""
+        if self.index is None:
+            for row in self.distances(queries):
+                yield None, row
+            return
+        # Rows appended after the index was built are always scanned
+        tail = np.arange(len(self.index), len(self.matrix))
+        q_norms = np.einsum('ij,ij->i', queries, queries)
+        for query, q_norm, rows in zip(queries, q_norms, self.index.candidates(queries, self.nprobe)):
+            if len(tail):
+                rows = np.concatenate([rows, tail])
+            sq = q_norm + self.sq_norms[rows] - 2.0 * (self.matrix[rows] @ query)
+            yield rows, np.sqrt(np.maximum(sq, 0))
+
+    def match(self, face_encodings, tolerance=None, top_k=1):
+        """
+        Matches all faces of a frame at once.
+        Returns one FaceMatch per input encoding (index/id/name are None when nothing was found).
+        """
+        if tolerance is None:
+            tolerance = FaceEngine.DEFAULT_TOLERANCE
+        if len(face_encodings) == 0:
+            return []
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        if len(self.matrix) == 0:
+            return [FaceMatch(None, None, None, 1.0, False, []) for _ in queries]
+
+        results = []
+        for rows, dists in self._search(queries):
+            k = min(top_k, len(dists))
+            if k == 0:
+                results.append(FaceMatch(None, None, None, 1.0, False, []))
+                continue
+            # argpartition keeps this O(candidates) per face even for larger k
+            if k < len(dists):
+                cand = np.argpartition(dists, k - 1)[:k]
+            else:
+                cand = np.arange(len(dists))
+            cand = cand[np.argsort(dists[cand])]
+            gallery_rows = cand if rows is None else rows[cand]
+            best = int(gallery_rows[0])
+            best_dist = float(dists[cand[0]])
+            top = [(int(self.ids[g]), float(d)) for g, d in zip(gallery_rows, dists[cand])]
+            results.append(FaceMatch(best, int(self.ids[best]), self.get_name(best), best_dist,
+                                     best_dist <= tolerance, top))
+        return results
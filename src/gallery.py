@@ -0,0 +1,198 @@
+import os
+import threading
+import numpy as np
+from src.face_engine import GalleryMatcher
+from src.embedding_store import EMBEDDING_DIM, decode_encoding
+from src.ann_index import IVFIndex, DEFAULT_NPROBE
+
+MIN_CAPACITY = 64
+
+class LiveGallery:
+    """
+    Recognition gallery shared by every pipeline of a database file.
+    Enrollments, deactivations and renames are read as deltas from the
+    gallery_changes table and applied in place: new rows go into spare capacity
+    of the gallery buffers, so enrolling a face costs O(1) amortized instead of a
+    full reload. Every change publishes a new GalleryMatcher snapshot with a
+    single reference swap, matching threads never see a half-applied delta.
+    The ANN index is trained on a background thread when needed; matching is
+    exact until it is swapped in.
+    """
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.snapshot = None
+        self._nprobe = DEFAULT_NPROBE
+        self._training = False
+
+    def load(self):
+        """Full load from the embedding store, then the deltas recorded meanwhile."""
+        with self._lock:
+            # Read the generation first: changes racing with the load are applied again, idempotently
+            self.generation = self.db.get_gallery_generation()
+            encoding_ids, user_ids, vectors, names = self.db.get_gallery()
+            matcher = GalleryMatcher(vectors, user_ids, names)
+            self._nprobe = self.db.get_typed_setting("ann_nprobe")
+            self._index = self.db.ann_index.load(encoding_ids, matcher.matrix)
+            # Still the zero-copy memory map; copied into growable buffers on the first append
+            self._vectors, self._norms, self._ids = matcher.matrix, matcher.sq_norms, matcher.ids
+            self._encoding_ids = np.asarray(encoding_ids, dtype=np.int64)
+            self._count = len(matcher)
+            self._owned = False
+            self._last_encoding_id = int(self._encoding_ids.max()) if self._count else 0
+            self.names = names
+            self._publish()
+            if self.db.ann_index.needs_training(self._count):
+                self._start_training()
+        self.refresh()
+        return self
+
+    def _start_training(self):
+        if self._training:
+            return
+        self._training = True
+        # Rows below _count are never written in place (see _add/_reallocate), so a view is safe
+        encoding_ids = self._encoding_ids[:self._count].copy()
+        threading.Thread(target=self._train_index, args=(encoding_ids, self._vectors[:self._count]),
+                         daemon=True).start()
+
+    def _train_index(self, encoding_ids, vectors):
+        try:
+            trained = self.db.ann_index.train(encoding_ids, vectors)
+        except Exception as e:
+            print(f"ANN index training error: {e}")
+            self._training = False
+            return
+        with self._lock:
+            # Align with the rows as they are now: the leading rows that were trained get
+            # their lists, rows enrolled meanwhile stay in the exactly scanned tail
+            current = self._encoding_ids[:self._count]
+            order = np.argsort(encoding_ids)
+            pos = np.minimum(np.searchsorted(encoding_ids[order], current), len(order) - 1)
+            known = encoding_ids[order][pos] == current
+            indexed = len(current) if known.all() else int(np.argmin(known))
+            self._index = IVFIndex(trained.centroids, trained.assignments[order[pos[:indexed]]])
+            self._publish()
+            self._training = False
+
+    def refresh(self):
+        """Applies every change newer than the loaded generation. Returns True if the gallery changed."""
+        if self.snapshot is None:
+            self.load()
+            return True
+        with self._lock:
+            changes = self.db.get_gallery_changes(self.generation)
+            if not changes:
+                return False
+            for generation, kind, user_id, encoding_id, encoding, name, is_active in changes:
+                if kind == "add":
+                    if is_active == 1 and encoding is not None:
+                        self._add(encoding_id, user_id, encoding, name)
+                elif kind == "deactivate":
+                    self._remove_user(user_id)
+                elif kind == "activate":
+                    if is_active == 1:
+                        # Reloads every encoding of the user, also those older than the
+                        # last one added (so not covered by the replay guard of 'add')
+                        self._remove_user(user_id)
+                        for enc_id, enc in self.db.get_user_encodings(user_id):
+                            self._add(enc_id, user_id, enc, name, replayed=False)
+                elif kind == "rename":
+                    if user_id in self.names:
+                        self.names[user_id] = name
+                self.generation = generation
+            self._publish()
+            return True
+
+    def _add(self, encoding_id, user_id, encoding, name, replayed=True):
+        # Encoding ids of 'add' changes only grow, anything up to the last one is already in
+        if replayed and encoding_id <= self._last_encoding_id:
+            return
+        if not self._owned or self._count == len(self._vectors):
+            self._reallocate(np.arange(self._count))
+        vector = decode_encoding(encoding).astype(np.float32)
+        # Written past the published rows, so the current snapshot is unaffected
+        i = self._count
+        self._vectors[i] = vector
+        self._norms[i] = vector @ vector
+        self._ids[i] = user_id
+        self._encoding_ids[i] = encoding_id
+        self._count += 1
+        self._last_encoding_id = max(self._last_encoding_id, encoding_id)
+        # Adding a key never disturbs readers of the shared dict
+        self.names[user_id] = name
+
+    def _remove_user(self, user_id):
+        keep = np.flatnonzero(self._ids[:self._count] != user_id)
+        if len(keep) < self._count:
+            if self._index is not None:
+                indexed = keep[keep < len(self._index)]
+                self._index = IVFIndex(self._index.centroids, self._index.assignments[indexed])
+            self._reallocate(keep)
+        # Copied so a matcher still using the old snapshot keeps its names
+        self.names = {k: v for k, v in self.names.items() if k != user_id}
+
+    def _reallocate(self, rows):
+        """Moves the given rows into new buffers with room to grow."""
+        capacity = max(MIN_CAPACITY, 2 * len(rows))
+        vectors = np.zeros((capacity, EMBEDDING_DIM), dtype=np.float32)
+        norms = np.zeros(capacity, dtype=np.float32)
+        ids = np.zeros(capacity, dtype=np.int64)
+        encoding_ids = np.zeros(capacity, dtype=np.int64)
+        vectors[:len(rows)] = self._vectors[rows]
+        norms[:len(rows)] = self._norms[rows]
+        ids[:len(rows)] = self._ids[rows]
+        encoding_ids[:len(rows)] = self._encoding_ids[rows]
+        self._vectors, self._norms, self._ids, self._encoding_ids = vectors, norms, ids, encoding_ids
+        self._count = len(rows)
+        self._owned = True
+
+    def _publish(self):
+        n = self._count
+        snapshot = GalleryMatcher(self._vectors[:n], self._ids[:n], self.names, sq_norms=self._norms[:n])
+        snapshot.attach_index(self._index, self._nprobe)
+        self.snapshot = snapshot
+
+    # Matcher interface, always answered by the current snapshot
+
+    def match(self, face_encodings, tolerance=None, top_k=1):
+        return self.snapshot.match(face_encodings, tolerance=tolerance, top_k=top_k)
+
+    def distances(self, face_encodings):
+        return self.snapshot.distances(face_encodings)
+
+    def __len__(self):
+        return len(self.snapshot) if self.snapshot is not None else 0
+
+    @property
+    def nprobe(self):
+        return self._nprobe
+
+    @nprobe.setter
+    def nprobe(self, value):
+        self._nprobe = value
+        if self.snapshot is not None:
+            self.snapshot.nprobe = value
+
+_galleries = {}
+_galleries_lock = threading.Lock()
+
+def get_live_gallery(db):
+    """Returns the loaded gallery of a database file, shared by every pipeline of this process."""
+    key = os.path.abspath(db.db_path)
+    with _galleries_lock:
+        gallery = _galleries.get(key)
+        if gallery is None:
+            gallery = _galleries[key] = LiveGallery(db)
+    gallery.refresh()
+    return gallery
+
+def notify_gallery_changed(db_path):
+    """Called after a write to users/encodings; updates the shared gallery if one is loaded."""
+    gallery = _galleries.get(os.path.abspath(db_path))
+    if gallery is not None and gallery.snapshot is not None:
+        try:
+            gallery.refresh()
+        except Exception as e:
+            print(f"Gallery refresh error: {e}")
@@ -0,0 +1,82 @@
+import time
+import cv2
+import numpy as np
+
+class MotionGate:
+    """
+    Cheap change detector in front of face detection.
+    Each checked frame is shrunk to a tiny blurred grayscale thumbnail and
+    compared with the previous one. Nothing changed and no face on screen:
+    detection is skipped. Something changed: detection only has to look at
+    the changed region plus the known faces, padded. A full-frame detection
+    still runs every `max_idle` seconds so a face that held still while
+    entering is never missed for long.
+    """
+    def __init__(self, width=64, threshold=20, min_changed=0.002, padding=0.15,
+                 full_frame_ratio=0.6, max_idle=5.0, clock=time.monotonic):
+        self.width = width
+        self.threshold = threshold # gray level change counted as motion
+        self.min_changed = min_changed # fraction of thumbnail pixels that must change
+        self.padding = padding # ROI padding, fraction of the larger frame side
+        self.full_frame_ratio = full_frame_ratio # larger ROIs are not worth cropping
+        self.max_idle = max_idle
+        self.clock = clock
+        self._previous = None
+        self._last_full = None
+        self.checked = 0
+        self.skipped = 0
+        self.cropped = 0
+
+    @property
+    def skip_ratio(self):
+        return self.skipped / self.checked if self.checked else 0.0
+
+    def reset(self):
+        self._previous = None
+
+    def check(self, frame, boxes=()):
+        """
+        frame is BGR, boxes are the (top, right, bottom, left) faces currently followed, in frame coordinates.
+        Returns None if detection can be skipped, otherwise the (top, right, bottom, left) region to detect in.
+        """
+        height, width = frame.shape[:2]
+        thumb_height = max(1, int(round(height * self.width / width)))
+        thumb = cv2.resize(frame, (self.width, thumb_height), interpolation=cv2.INTER_AREA)
+        thumb = cv2.GaussianBlur(cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        previous, self._previous = self._previous, thumb
+        self.checked += 1
+
+        now = self.clock()
+        if previous is None or self._last_full is None or now - self._last_full >= self.max_idle:
+            self._last_full = now
+            return (0, width, height, 0)
+
+        # Followed faces clipped to the frame, a tracker can drift a box off-screen
+        regions = []
+        for top, right, bottom, left in boxes:
+            top, bottom = max(0, top), min(height, bottom)
+            left, right = max(0, left), min(width, right)
+            if bottom > top and right > left:
+                regions.append((top, right, bottom, left))
+        changed = cv2.absdiff(thumb, previous) > self.threshold
+        ys, xs = np.nonzero(changed)
+        if len(xs) > self.min_changed * changed.size:
+            sy, sx = height / thumb_height, width / self.width
+            regions.append((ys.min() * sy, (xs.max() + 1) * sx, (ys.max() + 1) * sy, xs.min() * sx))
+        if not regions:
+            self.skipped += 1
+            return None
+
+        pad = self.padding * max(height, width)
+        top = max(0, int(min(r[0] for r in regions) - pad))
+        right = min(width, int(max(r[1] for r in regions) + pad))
+        bottom = min(height, int(max(r[2] for r in regions) + pad))
+        left = max(0, int(min(r[3] for r in regions) - pad))
+        if bottom <= top or right <= left:
+            self.skipped += 1
+            return None
+        if (bottom - top) * (right - left) >= self.full_frame_ratio * height * width:
+            self._last_full = now
+            return (0, width, height, 0)
+        self.cropped += 1
+        return (top, right, bottom, left)
@@ -0,0 +1,113 @@
+import os
+import threading
+
+def _parse_bool(value):
+    return str(value) == "1"
+
+# Typed engine settings: key -> (parser, default)
+SETTING_TYPES = {
+    "num_jitters": (int, 1),
+    "tolerance": (float, 0.45),
+    "liveness_enabled": (_parse_bool, True),
+    "motion_gate_enabled": (_parse_bool, True),
+    "ann_nprobe": (int, 8),
+    "camera_grace_seconds": (float, 10.0),
+    "video_workers": (int, max(1, (os.cpu_count() or 2) // 2)),
+    "video_sample_rate": (float, 2.0),
+    "video_dense_sample_rate": (float, 6.0),
+}
+
+class SettingsCache:
+    """
+    In-memory copy of the settings table, shared by every DatabaseManager of a
+    database file. It is read from SQLite once; set_setting keeps it current
+    and notifies observers, so running pipelines can apply changes live.
+    Observers are called as callback(key, value) on the thread that wrote the setting;
+    worker threads use changes() instead and apply them on their own thread.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = None # {key: str}
+        self._observers = []
+
+    def ensure_loaded(self, loader):
+        """loader() returns the (key, value) rows of the settings table."""
+        with self._lock:
+            if self._values is None:
+                self._values = dict(loader())
+
+    def get(self, key, default=None):
+        value = (self._values or {}).get(key)
+        return default if value is None else value
+
+    def get_typed(self, key):
+        """Returns a known setting parsed to its type, or its default."""
+        parser, default = SETTING_TYPES[key]
+        value = self.get(key)
+        if value is None:
+            return default
+        try:
+            return parser(value)
+        except ValueError:
+            return default
+
+    def update(self, key, value):
+        with self._lock:
+            if self._values is not None:
+                self._values[key] = value
+            observers = list(self._observers)
+        typed = self.get_typed(key) if key in SETTING_TYPES else value
+        for callback in observers:
+            try:
+                callback(key, typed)
+            except Exception as e:
+                print(f"Settings observer error: {e}")
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._observers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._observers:
+                self._observers.remove(callback)
+
+    def changes(self):
+        """Returns a SettingChanges inbox that collects every change from now on."""
+        return SettingChanges(self)
+
+class SettingChanges:
+    """
+    Setting changes waiting for a worker thread. The writer only records them,
+    the worker applies them between frames with take(), so its attributes are
+    never changed while a frame is being processed.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._pending = {}
+        cache.subscribe(self._record)
+
+    def _record(self, key, value):
+        with self._lock:
+            self._pending[key] = value
+
+    def take(self):
+        """Returns the (key, value) changes since the last call, latest value per key."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return list(pending.items())
+
+    def close(self):
+        self.cache.unsubscribe(self._record)
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_settings_cache(db_path):
+    key = os.path.abspath(db_path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = SettingsCache()
+        return cache
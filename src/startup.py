@@ -0,0 +1,28 @@
+import time
+
+class StartupTimer:
+    """
+    Records startup milestones, measured from process start or from an earlier
+    milestone, and prints each one when it is first reached.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks = {} # {name: seconds since process start}
+        self.lines = []
+
+    def mark(self, name, label=None, since=None):
+        """Records a milestone once; later calls with the same name are ignored."""
+        if name in self.marks:
+            return
+        now = time.perf_counter() - self.started
+        self.marks[name] = now
+        line = f"{label or name}: {now:.2f}s"
+        if since in self.marks:
+            line += f" ({now - self.marks[since]:.2f}s after {since.replace('_', ' ')})"
+        self.lines.append(line)
+        print(f"[Startup] {line}")
+
+    def report(self):
+        return "\n".join(self.lines)
+
+startup_timer = StartupTimer()
@@ -0,0 +1,83 @@
+import time
+import weakref
+from collections import OrderedDict
+
+# Lifetimes of the recognition loops' per-identity state, in seconds since last seen
+LIVENESS_TTL = 60.0 # a person who left has to blink again when they come back
+EMOTION_TTL = 10.0
+STRANGER_TTL = 10.0
+
+_stores = weakref.WeakSet()
+
+def total_live_entries():
+    """
+    Entries currently held by every ExpiringState of the process (for monitoring memory).
+    Read-only, so any thread may call it; entries past their TTL count until their owner touches the store.
+    """
+    return sum(store.held() for store in list(_stores))
+
+class ExpiringState:
+    """
+    Per-identity state of a recognition loop that is forgotten `ttl` seconds after
+    it was last touched, holding at most `max_entries` entries (the least recently
+    touched one is evicted first). Entries are kept in touch order, so expiring
+    costs O(1) per removed entry. Not thread-safe: each loop owns its stores.
+    """
+    def __init__(self, ttl, max_entries=500, factory=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.factory = factory
+        self.clock = clock
+        self._items = OrderedDict() # key -> [value, last_touched]
+        self.expired = 0
+        self.evicted = 0
+        _stores.add(self)
+
+    def expire(self, now=None):
+        now = self.clock() if now is None else now
+        while self._items:
+            key, (_, touched) = next(iter(self._items.items()))
+            if now - touched < self.ttl:
+                break
+            del self._items[key]
+            self.expired += 1
+
+    def _touch(self, key, value):
+        self._items[key] = [value, self.clock()]
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+            self.evicted += 1
+
+    def get(self, key, default=None):
+        """Current value without refreshing its lifetime."""
+        self.expire()
+        item = self._items.get(key)
+        return default if item is None else item[0]
+
+    def touch(self, key):
+        """Returns the value of key (created by the factory if missing) and restarts its lifetime."""
+        self.expire()
+        item = self._items.get(key)
+        value = item[0] if item is not None else self.factory()
+        self._touch(key, value)
+        return value
+
+    def set(self, key, value):
+        self.expire()
+        self._touch(key, value)
+
+    def pop(self, key, default=None):
+        item = self._items.pop(key, None)
+        return default if item is None else item[0]
+
+    def __contains__(self, key):
+        self.expire()
+        return key in self._items
+
+    def __len__(self):
+        self.expire()
+        return len(self._items)
+
+    def held(self):
+        return len(self._items)
@@ -0,0 +1,120 @@
+import os
+import threading
+import numpy as np
+
+# Same person if the encodings are closer than this (a bit looser than user matching,
+# crops of strangers are taken at any angle)
+STRANGER_TOLERANCE = 0.5
+# Stricter limit for merging stored strangers, rows merged away are deleted
+MERGE_TOLERANCE = 0.4
+# Strangers seen within this many days are candidates for a repeat sighting
+RECENT_DAYS = 14
+MAX_RECENT = 5000
+
+def embedding_list(embedding):
+    """JSON-friendly copy of an encoding (queued events are journaled as JSON)."""
+    return None if embedding is None else [float(v) for v in embedding]
+
+class StrangerIndex:
+    """
+    In-memory index of recently seen strangers, shared by every DatabaseManager
+    of a database file. A new unknown face is compared with it so a repeat
+    sighting updates the existing stranger instead of adding a row.
+    """
+    def __init__(self, tolerance=STRANGER_TOLERANCE, max_size=MAX_RECENT):
+        self.tolerance = tolerance
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._ids = None # None until loaded
+        self._vectors = None
+
+    def ensure_loaded(self, loader):
+        """loader() returns (stranger_id, embedding) of recent strangers, most recent first."""
+        with self._lock:
+            if self._ids is None:
+                rows = loader()[:self.max_size]
+                self._ids = np.array([r[0] for r in rows], dtype=np.int64)
+                self._vectors = np.array([r[1] for r in rows], dtype=np.float32).reshape(-1, 128)
+
+    def nearest(self, embedding):
+        """Returns the id of the closest recent stranger within tolerance, or None."""
+        if embedding is None:
+            return None
+        with self._lock:
+            if self._ids is None or len(self._ids) == 0:
+                return None
+            query = np.asarray(embedding, dtype=np.float32)
+            dists = np.linalg.norm(self._vectors - query, axis=1)
+            best = int(np.argmin(dists))
+            if dists[best] > self.tolerance:
+                return None
+            return int(self._ids[best])
+
+    def add(self, stranger_id, embedding):
+        with self._lock:
+            if self._ids is None:
+                return # picked up from the database on load
+            # Newest first, the oldest fall off once the index is full
+            self._ids = np.concatenate([[stranger_id], self._ids])[:self.max_size]
+            self._vectors = np.vstack([np.asarray(embedding, dtype=np.float32).reshape(1, 128),
+                                       self._vectors])[:self.max_size]
+
+    def remove(self, stranger_ids):
+        with self._lock:
+            if self._ids is None:
+                return
+            keep = ~np.isin(self._ids, np.asarray(list(stranger_ids), dtype=np.int64))
+            self._ids = self._ids[keep]
+            self._vectors = self._vectors[keep]
+
+    def invalidate(self):
+        """Forgets everything; the next use reloads from the database."""
+        with self._lock:
+            self._ids = None
+            self._vectors = None
+
+def find_clusters(vectors, tolerance=MERGE_TOLERANCE, chunk_size=1024):
+    """
+    Groups embeddings of the same face with complete linkage: a row joins the
+    group of an earlier row only if it is within tolerance of every member, so a
+    chain of look-alikes never pulls different people into one group.
+    Returns a list of row-index lists (oldest row first), one per group of two or more rows.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, 128)
+    # Close earlier rows of each row: {row: {earlier row: squared distance}}
+    neighbours = [{} for _ in range(len(vectors))]
+    norms = np.einsum('ij,ij->i', vectors, vectors)
+    limit = tolerance * tolerance
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        sq = norms[start:start + chunk_size, None] + norms[None, :] - 2.0 * (chunk @ vectors.T)
+        rows, cols = np.nonzero(sq <= limit)
+        for r, j in zip(rows, cols):
+            i = r + start
+            if j < i:
+                neighbours[i][j] = sq[r, j]
+
+    head_of = {}
+    groups = {}
+    for i in range(len(vectors)):
+        near = neighbours[i]
+        # Closest group heads first; a group is joined only if all of its members are close
+        heads = sorted({head_of[j] for j in near}, key=lambda h: near.get(h, np.inf))
+        head = next((h for h in heads if all(m in near for m in groups[h])), None)
+        if head is None:
+            head = i
+            groups[i] = []
+        head_of[i] = head
+        groups[head].append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_stranger_index(db_path):
+    key = os.path.abspath(db_path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = StrangerIndex()
+        return index
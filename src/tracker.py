@@ -0,0 +1,161 @@
+import itertools
+import time
+import cv2
+import numpy as np
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+def box_center(box):
+    top, right, bottom, left = box
+    return np.array([(left + right) / 2.0, (top + bottom) / 2.0])
+
+def create_correlation_tracker():
+    """
+    Returns an OpenCV correlation tracker, or None.
+    KCF/CSRT need opencv-contrib; plain opencv-python falls back to MIL.
+    """
+    for module in (cv2, getattr(cv2, "legacy", None)):
+        if module is None:
+            continue
+        for factory in ("TrackerKCF_create", "TrackerCSRT_create", "TrackerMIL_create"):
+            if hasattr(module, factory):
+                return getattr(module, factory)()
+    return None
+
+class Track:
+    """A face followed across frames, with its cached identity."""
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.hits = 1
+        self.misses = 0
+        self.cv_tracker = None
+
+        # Cached identity (refreshed by FaceTracker.set_identity)
+        self.user_id = None
+        self.name = None
+        self.distance = None
+        self.is_match = False
+        self.last_encoded = None
+        self.encoding = None # last face encoding, kept for strangers
+
+class FaceTracker:
+    """
+    Associates detections across processing cycles (IoU, then centroid distance)
+    and gives every face a stable track id. The identity is cached per track so a
+    face is only re-encoded every `reencode_interval` seconds, or on every cycle
+    while its match is weak. Between detections an OpenCV correlation tracker,
+    when available, keeps the boxes following the face.
+    """
+    def __init__(self, iou_threshold=0.3, max_misses=2, reencode_interval=3.0, confidence_margin=0.05):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.reencode_interval = reencode_interval
+        self.confidence_margin = confidence_margin
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, face_locations, frame=None):
+        """
+        Matches this cycle's detections to existing tracks.
+        Returns the track of each detection, in the same order as face_locations.
+        """
+        pairs = sorted(((box_iou(t.box, loc), ti, di)
+                        for ti, t in enumerate(self.tracks)
+                        for di, loc in enumerate(face_locations)), reverse=True)
+        assigned = {}
+        used_tracks = set()
+        for iou, ti, di in pairs:
+            if iou < self.iou_threshold:
+                break
+            if ti in used_tracks or di in assigned:
+                continue
+            assigned[di] = self.tracks[ti]
+            used_tracks.add(ti)
+
+        # Fallback: a fast move can kill the IoU, accept a close centroid instead
+        for di, loc in enumerate(face_locations):
+            if di in assigned:
+                continue
+            width = loc[1] - loc[3]
+            best, best_dist = None, width * 0.75
+            for ti, t in enumerate(self.tracks):
+                if ti in used_tracks:
+                    continue
+                dist = np.linalg.norm(box_center(t.box) - box_center(loc))
+                if dist < best_dist:
+                    best, best_dist = ti, dist
+            if best is not None:
+                assigned[di] = self.tracks[best]
+                used_tracks.add(best)
+
+        result = []
+        for di, loc in enumerate(face_locations):
+            track = assigned.get(di)
+            if track is None:
+                track = Track(next(self._ids), loc)
+                self.tracks.append(track)
+            else:
+                track.box = loc
+                track.hits += 1
+                track.misses = 0
+            if frame is not None:
+                self._init_cv_tracker(track, frame)
+            result.append(track)
+
+        # Age out tracks that were not seen this cycle
+        seen = set(id(t) for t in result)
+        for t in self.tracks:
+            if id(t) not in seen:
+                t.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        return result
+
+    def _init_cv_tracker(self, track, frame):
+        top, right, bottom, left = track.box
+        track.cv_tracker = create_correlation_tracker()
+        if track.cv_tracker is not None:
+            try:
+                track.cv_tracker.init(frame, (int(left), int(top), int(right - left), int(bottom - top)))
+            except cv2.error:
+                track.cv_tracker = None
+
+    def predict(self, frame):
+        """Moves every track with its correlation tracker on a frame between detections."""
+        for track in self.tracks:
+            if track.cv_tracker is None or track.misses:
+                continue
+            ok, (x, y, w, h) = track.cv_tracker.update(frame)
+            if ok:
+                track.box = (int(y), int(x + w), int(y + h), int(x))
+        return self.tracks
+
+    def needs_encoding(self, track, tolerance, now=None):
+        """
+        True if the track has no identity yet, it is due for a refresh, or its match is weak.
+        Unmatched tracks are re-encoded every cycle: one bad encoding (turned head, blur)
+        must not make an enrolled user count as a stranger until the next refresh.
+        """
+        now = time.monotonic() if now is None else now
+        if track.last_encoded is None or now - track.last_encoded >= self.reencode_interval:
+            return True
+        if not track.is_match:
+            return True
+        return track.distance > tolerance - self.confidence_margin
+
+    def set_identity(self, track, face_match, now=None, encoding=None):
+        track.is_match = face_match.is_match
+        track.user_id = face_match.id if face_match.is_match else None
+        track.name = face_match.name if face_match.is_match else None
+        track.distance = face_match.distance
+        track.last_encoded = time.monotonic() if now is None else now
+        if encoding is not None:
+            track.encoding = encoding
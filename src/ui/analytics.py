@@ -1,8 +1,8 @@
 import sys
+import datetime
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                             QTableWidget, QTableWidgetItem, QHeaderView, QGroupBox)
+                             QTableWidget, QTableWidgetItem, QHeaderView, QGroupBox, QComboBox)
 from PyQt6.QtCore import Qt
-from src.database import DatabaseManager
 
 # Matplotlib integration
 import matplotlib
@@ -10,21 +10,39 @@ matplotlib.use('QtAgg')
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
+# Period label -> number of days (ending today); all views read the rollup tables
+PERIODS = {
+    "Today": 1,
+    "Last 7 Days": 7,
+    "Last 30 Days": 30,
+    "Last 12 Months": 365,
+}
+
 class AnalyticsWidget(QWidget):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
-        self.db = DatabaseManager()
+        self.db = db
         self.init_ui()
 
     def init_ui(self):
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
 
+        # Period selector
+        period_layout = QHBoxLayout()
+        period_layout.addWidget(QLabel("Period:"))
+        self.period_combo = QComboBox()
+        self.period_combo.addItems(list(PERIODS.keys()))
+        self.period_combo.currentIndexChanged.connect(self.refresh_data)
+        period_layout.addWidget(self.period_combo)
+        period_layout.addStretch()
+        self.layout.addLayout(period_layout)
+
         # 1. Summary Cards
         summary_layout = QHBoxLayout()
         self.total_card = self.create_summary_card("Total Users", "0", "#3498db")
-        self.present_card = self.create_summary_card("Present Today", "0", "#2ecc71")
-        self.absent_card = self.create_summary_card("Absent Today", "0", "#e74c3c")
+        self.present_card = self.create_summary_card("Present", "0", "#2ecc71")
+        self.absent_card = self.create_summary_card("Absent", "0", "#e74c3c")
         
         summary_layout.addWidget(self.total_card)
         summary_layout.addWidget(self.present_card)
@@ -36,7 +54,7 @@ class AnalyticsWidget(QWidget):
         
         # Pie Chart Container
         self.pie_canvas = FigureCanvas(Figure(figsize=(5, 4), facecolor='#2b2b2b'))
-        pie_group = QGroupBox("Daily Attendance Ratio")
+        pie_group = QGroupBox("Attendance Ratio")
         pie_vbox = QVBoxLayout()
         pie_vbox.addWidget(self.pie_canvas)
         pie_group.setLayout(pie_vbox)
@@ -52,7 +70,7 @@ class AnalyticsWidget(QWidget):
 
         # 3. Mood Chart Container
         self.mood_canvas = FigureCanvas(Figure(figsize=(5, 4), facecolor='#2b2b2b'))
-        mood_group = QGroupBox("Mood of the Day")
+        self.mood_group = mood_group = QGroupBox("Mood of the Day")
         mood_vbox = QVBoxLayout()
         mood_vbox.addWidget(self.mood_canvas)
         mood_group.setLayout(mood_vbox)
@@ -61,7 +79,7 @@ class AnalyticsWidget(QWidget):
         self.layout.addLayout(charts_layout)
 
         # 3. Top Disciplined Table
-        table_group = QGroupBox("Top Disciplined (Last 30 Days)")
+        self.table_group = table_group = QGroupBox("Top Disciplined (Last 30 Days)")
         table_layout = QVBoxLayout()
         self.top_table = QTableWidget()
         self.top_table.setColumnCount(2)
@@ -95,9 +113,23 @@ class AnalyticsWidget(QWidget):
         card.value_label = value_label
         return card
 
+    def selected_range(self):
+        """Returns (label, days, start_date, end_date) of the selected period."""
+        label = self.period_combo.currentText()
+        days = PERIODS[label]
+        today = datetime.date.today()
+        start = today - datetime.timedelta(days=days - 1)
+        return label, days, start.isoformat(), today.isoformat()
+
     def refresh_data(self):
+        label, days, start_date, end_date = self.selected_range()
+        self.mood_group.setTitle("Mood of the Day" if days == 1 else f"Mood ({label})")
+        # "Today" keeps the 30-day ranking
+        top_days = 30 if days == 1 else days
+        self.table_group.setTitle(f"Top Disciplined (Last {top_days} Days)")
+        
         # 1. Update Cards
-        total, present, absent = self.db.get_attendance_stats()
+        total, present, absent = self.db.get_attendance_stats(start_date, end_date)
         self.total_card.value_label.setText(str(total))
         self.present_card.value_label.setText(str(present))
         self.absent_card.value_label.setText(str(absent))
@@ -106,15 +138,15 @@ class AnalyticsWidget(QWidget):
         self.update_pie_chart(present, absent)
 
         # 3. Update Bar Chart
-        peak_data = self.db.get_peak_hours()
+        peak_data = self.db.get_peak_hours(start_date, end_date)
         self.update_bar_chart(peak_data)
 
         # 4. Update Mood Chart
-        mood_data = self.db.get_mood_stats()
+        mood_data = self.db.get_mood_stats(start_date, end_date)
         self.update_mood_chart(mood_data)
 
         # 5. Update Table
-        top_users = self.db.get_top_disciplined()
+        top_users = self.db.get_top_disciplined(days=top_days)
         self.top_table.setRowCount(0)
         for name, count in top_users:
             row = self.top_table.rowCount()
@@ -127,7 +159,7 @@ class AnalyticsWidget(QWidget):
         ax = self.pie_canvas.figure.add_subplot(111)
         
         if present == 0 and absent == 0:
-            ax.text(0.5, 0.5, 'No Data Today', transform=ax.transAxes, ha='center', color='white')
+            ax.text(0.5, 0.5, 'No Data', transform=ax.transAxes, ha='center', color='white')
         else:
             labels = ['Present', 'Absent']
             sizes = [present, absent]
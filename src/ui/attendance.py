@@ -4,178 +4,255 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
 from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal, QPropertyAnimation, QRect, QEasingCurve
 from PyQt6.QtGui import QImage, QPixmap
 import cv2
-import face_recognition
 import numpy as np
 import datetime
-from src.database import DatabaseManager
-from src.utils import EmailManager
-from src.face_engine import FaceEngine
+from collections import deque
+from src.face_engine import FaceEngine, GalleryMatcher
+from src.gallery import get_live_gallery
+from src.tracker import FaceTracker
+from src.motion import MotionGate
+from src.capture import camera_manager
+from src.writer import EventWriter
+from src.ui.export_thread import ExportThread
+from src.exporter import with_export_extension
 from src.ui.voice import VoiceEngine
+from src.startup import startup_timer
+from src.state import ExpiringState, total_live_entries, LIVENESS_TTL, EMOTION_TTL, STRANGER_TTL
 
 class AttendanceVideoThread(QThread):
     change_pixmap_signal = pyqtSignal(np.ndarray)
+    stats_signal = pyqtSignal(str)
 
-    def __init__(self, known_face_encodings, known_face_ids, known_face_names, db):
+    def __init__(self, matcher, db, events):
         super().__init__()
         self._run_flag = True
-        self.known_face_encodings = known_face_encodings
-        self.known_face_ids = known_face_ids
-        self.known_face_names = known_face_names
+        self.matcher = matcher
         self.db = db
+        self.events = events # write-behind queue, this thread never waits on the disk
         self.face_engine = FaceEngine()
         self.voice = VoiceEngine()
         self.last_processed_time = datetime.datetime.now()
         
-        # Load settings
-        self.num_jitters = int(self.db.get_setting("num_jitters", "1"))
-        self.tolerance = float(self.db.get_setting("tolerance", "0.45"))
-        self.liveness_enabled = self.db.get_setting("liveness_enabled", "1") == "1"
+        # Load settings, then follow changes made in the Settings tab while running
+        self.num_jitters = self.db.get_typed_setting("num_jitters")
+        self.tolerance = self.db.get_typed_setting("tolerance")
+        self.liveness_enabled = self.db.get_typed_setting("liveness_enabled")
+        self.motion_gate_enabled = self.db.get_typed_setting("motion_gate_enabled")
+        self.setting_changes = self.db.settings.changes()
         
+        # Per-identity state expires once a face has not been seen for a while
         # Liveness tracking
-        self.liveness_status = {} # {user_id: {"blinked": Bool, "frames_closed": Int, "greeted": Bool}}
+        self.liveness_status = ExpiringState(LIVENESS_TTL, factory=lambda: {"blinked": False, "frames_closed": 0, "greeted": False}) # by user_id
         self.blink_threshold = 0.26
         self.consecutive_frames = 1
         
         # Stranger tracking
-        self.stranger_tracking = {} # {stranger_id_temp: frames_count}
-        self.last_stranger_log_time = {} # To avoid rapid duplicate logging
+        self.stranger_tracking = ExpiringState(STRANGER_TTL, factory=int) # {track_id: cycles_seen}
         
         # Emotion smoothing
-        self.emotion_history = {} # {user_id: [last_emotions]}
+        self.emotion_history = ExpiringState(EMOTION_TTL, factory=lambda: deque(maxlen=3)) # {user_id: last emotions}
+        
+        # Face tracking: stable ids + cached identities between encodings
+        self.tracker = FaceTracker()
+        self.motion = MotionGate()
+        self.track_labels = {} # {track_id: (color, text)}
+        self.overlays = [] # Published snapshot drawn by the display path
 
     def run(self):
-        cap = cv2.VideoCapture(0)
-        while self._run_flag:
-            ret, cv_img = cap.read()
-            if ret:
+        # Shared camera stream: display follows the camera FPS
+        # while this loop only ever works on the newest frame
+        source = camera_manager.acquire(0)
+        try:
+            subscriber = source.subscribe()
+            if subscriber.error:
+                self.stats_signal.emit(f"Status: {subscriber.error}")
+                return
+            source.add_listener(self.on_frame)
+            while self._run_flag:
+                cv_img = subscriber.read(timeout=0.5)
+                if cv_img is None:
+                    continue
+                for key, value in self.setting_changes.take():
+                    self.apply_setting(key, value)
+            
                 # Process every 500ms
                 now = datetime.datetime.now()
                 should_process = (now - self.last_processed_time).total_seconds() > 0.5
-                
-                display_img = cv_img.copy()
-                
-                if should_process and self.known_face_encodings:
+                small_frame = cv2.resize(cv_img, (0, 0), fx=0.25, fy=0.25)
+            
+                if should_process and len(self.matcher):
                     self.last_processed_time = now
-                    
-                    small_frame = cv2.resize(cv_img, (0, 0), fx=0.25, fy=0.25)
-                    # Apply CLAHE pre-processing
-                    processed_small = self.face_engine.preprocess_image(small_frame)
-                    rgb_small_frame = cv2.cvtColor(processed_small, cv2.COLOR_BGR2RGB)
-                    
-                    face_locations = face_recognition.face_locations(rgb_small_frame)
-                    face_encodings = self.face_engine.get_face_encodings(rgb_small_frame, face_locations, num_jitters=self.num_jitters)
-                    
-                    for face_encoding, face_loc in zip(face_encodings, face_locations):
-                        matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=self.tolerance)
-                        
-                        if True in matches:
-                            face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-                            best_match_index = np.argmin(face_distances)
-                            
-                            if matches[best_match_index]:
-                                user_id = self.known_face_ids[best_match_index]
-                                name = self.known_face_names[best_match_index]
-                                
-                                # Liveness Check
-                                if user_id not in self.liveness_status:
-                                    self.liveness_status[user_id] = {"blinked": False, "frames_closed": 0, "greeted": False}
-                                
-                                # Check Liveness if enabled
-                                if self.liveness_enabled:
-                                    if not self.liveness_status[user_id]["blinked"]:
-                                        ear = self.face_engine.check_liveness(rgb_small_frame, face_loc)
-                                        if ear < self.blink_threshold:
-                                            self.liveness_status[user_id]["frames_closed"] += 1
-                                        else:
-                                            if self.liveness_status[user_id]["frames_closed"] >= self.consecutive_frames:
-                                                self.liveness_status[user_id]["blinked"] = True
-                                            self.liveness_status[user_id]["frames_closed"] = 0
-                                else:
-                                    # Skip blink check if liveness is disabled
-                                    self.liveness_status[user_id]["blinked"] = True
-                                    self.liveness_status[user_id]["frames_closed"] = 0
-                                
-                                # Draw status
-                                top, right, bottom, left = face_loc
-                                top *= 4; right *= 4; bottom *= 4; left *= 4
-                                
-                                is_live = self.liveness_status[user_id]["blinked"]
-                                color = (0, 255, 0) if is_live else (0, 255, 255)
-                                # Detect Emotion with temporal smoothing
-                                raw_emotion = self.face_engine.detect_emotion(rgb_small_frame, face_loc)
-                                if user_id not in self.emotion_history:
-                                    self.emotion_history[user_id] = []
-                                self.emotion_history[user_id].append(raw_emotion)
-                                if len(self.emotion_history[user_id]) > 3:
-                                    self.emotion_history[user_id].pop(0)
-                                
-                                # Majority vote for stable display
-                                current_emotion = max(set(self.emotion_history[user_id]), key=self.emotion_history[user_id].count)
-                                
-                                # Draw status
-                                top, right, bottom, left = face_loc
-                                top *= 4; right *= 4; bottom *= 4; left *= 4
-                                
-                                is_live = self.liveness_status[user_id]["blinked"]
-                                color = (0, 255, 0) if is_live else (0, 255, 255)
-                                status_text = f"{name} ({current_emotion})" if is_live else f"{name} (Please Blink)"
-                                
-                                cv2.rectangle(display_img, (left, top), (right, bottom), color, 2)
-                                cv2.putText(display_img, status_text, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+                    # Detect only where something moved, nothing at all in an empty, still scene
+                    roi = None
+                    if self.motion_gate_enabled:
+                        roi = self.motion.check(small_frame, [track.box for track in self.tracker.tracks])
+                    idle = self.motion_gate_enabled and roi is None
+                    if idle:
+                        self.tracker.predict(small_frame)
+                    else:
+                        self.process_frame(cv_img, small_frame, roi)
+                    self.stats_signal.emit(f"Status: {'Idle' if idle else 'Scanning...'} | Camera {source.fps:.0f} FPS | "
+                                           f"Dropped frames: {subscriber.dropped} | "
+                                           f"Pending writes: {self.events.pending()} | "
+                                           f"State entries: {total_live_entries()} | "
+                                           f"Detection skipped: {self.motion.skip_ratio:.0%}")
+                else:
+                    # Follow the faces between detections
+                    self.tracker.predict(small_frame)
+            
+                self.overlays = self.collect_overlays()
+        finally:
+            # Always hand the camera back, also when the loop failed
+            source.remove_listener(self.on_frame)
+            camera_manager.release(0)
+
+    def on_frame(self, seq, frame):
+        """Display path, called by the capture thread for every camera frame."""
+        display_img = frame.copy()
+        for (top, right, bottom, left), color, text in self.overlays:
+            cv2.rectangle(display_img, (left, top), (right, bottom), color, 2)
+            cv2.putText(display_img, text, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        self.change_pixmap_signal.emit(display_img)
+
+    def process_frame(self, cv_img, small_frame, roi=None):
+        """
+        Detects faces (only inside roi of the small frame if given), refreshes
+        stale track identities and handles known faces / strangers.
+        """
+        # Apply CLAHE pre-processing
+        processed_small = self.face_engine.preprocess_image(small_frame)
+        rgb_small_frame = cv2.cvtColor(processed_small, cv2.COLOR_BGR2RGB)
+        
+        face_locations = self.face_engine.detect_faces(rgb_small_frame, roi)
+        tracks = self.tracker.update(face_locations, small_frame)
+        
+        # Forget per-track state of faces that left the frame
+        live_ids = {track.id for track in self.tracker.tracks}
+        for track_id in [k for k in self.track_labels if k not in live_ids]:
+            del self.track_labels[track_id]
+            self.stranger_tracking.pop(track_id)
+        
+        # Only encode tracks without a fresh, confident identity
+        to_encode = [i for i, track in enumerate(tracks) if self.tracker.needs_encoding(track, self.tolerance)]
+        if to_encode:
+            face_encodings = self.face_engine.get_face_encodings(
+                rgb_small_frame, [face_locations[i] for i in to_encode], num_jitters=self.num_jitters)
+            # Match every encoded face of the frame against the gallery in one pass
+            face_matches = self.matcher.match(face_encodings, tolerance=self.tolerance)
+            for i, face_match, encoding in zip(to_encode, face_matches, face_encodings):
+                self.tracker.set_identity(tracks[i], face_match, encoding=encoding)
+        
+        # One landmark pass for all recognised faces (EAR + emotion together)
+        known = [(track, loc) for track, loc in zip(tracks, face_locations) if track.is_match]
+        analyses = self.face_engine.analyze_faces(rgb_small_frame, [loc for _, loc in known])
+        for (track, _), analysis in zip(known, analyses):
+            self.handle_known_face(track, analysis)
+        if known:
+            startup_timer.mark("first_recognition", "First recognised frame", since="main_window")
+        
+        for track in tracks:
+            if not track.is_match:
+                self.handle_stranger(track, cv_img)
+
+    def handle_known_face(self, track, analysis):
+        user_id = track.user_id
+        name = track.name
+        # Strangers are counted over consecutive unmatched cycles only
+        self.stranger_tracking.pop(track.id)
+        
+        # Liveness Check (seeing the face keeps its state alive)
+        status = self.liveness_status.touch(user_id)
+        
+        # Check Liveness if enabled
+        if self.liveness_enabled:
+            if not status["blinked"]:
+                ear = analysis["ear"]
+                if ear < self.blink_threshold:
+                    status["frames_closed"] += 1
+                else:
+                    if status["frames_closed"] >= self.consecutive_frames:
+                        status["blinked"] = True
+                    status["frames_closed"] = 0
+        else:
+            # Skip blink check if liveness is disabled
+            status["blinked"] = True
+            status["frames_closed"] = 0
+        
+        # Emotion with temporal smoothing over the last 3 readings
+        history = self.emotion_history.touch(user_id)
+        history.append(analysis["emotion"])
+        
+        # Majority vote for stable display
+        current_emotion = max(set(history), key=history.count)
+        
+        is_live = status["blinked"]
+        color = (0, 255, 0) if is_live else (0, 255, 255)
+        status_text = f"{name} ({current_emotion})" if is_live else f"{name} (Please Blink)"
+        self.track_labels[track.id] = (color, status_text)
+
+        # Mark Attendance ONLY if verified
+        if is_live:
+            success, msg = self.events.mark_attendance(user_id, emotion=current_emotion)
+            if success and not status["greeted"]:
+                greet_msg = f"Hello {name}, your attendance has been recorded. "
+                if current_emotion == "Happy":
+                    greet_msg += "You look happy today!"
+                self.voice.say(greet_msg)
+                status["greeted"] = True
+            elif not success and msg == "Already registered today" and not status["greeted"]:
+                self.voice.say(f"Hello {name}, you have already registered your attendance today")
+                status["greeted"] = True
+
+    def handle_stranger(self, track, cv_img):
+        # Stranger detected, counted per track instead of per pixel position
+        seen = self.stranger_tracking.touch(track.id) + 1
+        
+        if seen >= 3: # Seen for 3 cycles (~1.5s)
+            # Crop face for logging
+            top, right, bottom, left = track.box
+            face_img = cv_img[top*4:bottom*4, left*4:right*4]
+            if face_img.size > 0:
+                self.events.log_stranger(face_img, track.encoding)
+                seen = -10 # cooldown for this track
+        self.stranger_tracking.set(track.id, seen)
+        
+        # Red box once the track has been flagged as a stranger
+        if seen < 0 or seen >= 3:
+            self.track_labels[track.id] = ((0, 0, 255), "STRANGER")
+        else:
+            self.track_labels.pop(track.id, None)
 
-                                # Mark Attendance ONLY if verified
-                                if is_live:
-                                    success, msg = self.db.mark_attendance(user_id, emotion=current_emotion)
-                                    if success and not self.liveness_status[user_id]["greeted"]:
-                                        greet_msg = f"Hello {name}, your attendance has been recorded. "
-                                        if current_emotion == "Happy":
-                                            greet_msg += "You look happy today!"
-                                        self.voice.say(greet_msg)
-                                        self.liveness_status[user_id]["greeted"] = True
-                                    elif not success and msg == "Already registered today" and not self.liveness_status[user_id]["greeted"]:
-                                        self.voice.say(f"Hello {name}, you have already registered your attendance today")
-                                        self.liveness_status[user_id]["greeted"] = True
-                        else:
-                            # Stranger detected
-                            # We'll use a simple coordinate-based key for temporary tracking
-                            top, right, bottom, left = face_loc
-                            s_key = f"{top}_{left}" # Not perfect but works for consecutive frames
-                            
-                            self.stranger_tracking[s_key] = self.stranger_tracking.get(s_key, 0) + 1
-                            
-                            if self.stranger_tracking[s_key] >= 3: # Seen for 3 cycles (~1.5s)
-                                # Log stranger
-                                # Draw red box for stranger
-                                cv2.rectangle(display_img, (left*4, top*4), (right*4, bottom*4), (0, 0, 255), 2)
-                                cv2.putText(display_img, "STRANGER", (left*4, top*4 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-                                
-                                # Crop face for logging
-                                face_img = cv_img[top*4:bottom*4, left*4:right*4]
-                                if face_img.size > 0:
-                                    self.db.log_stranger(face_img)
-                                    self.stranger_tracking[s_key] = -10 # cooldown for this spot
+    def collect_overlays(self):
+        """Snapshot of the last known label of every visible track, in full-frame coordinates."""
+        overlays = []
+        for track in self.tracker.tracks:
+            label = self.track_labels.get(track.id)
+            if label is None or track.misses:
+                continue
+            color, text = label
+            overlays.append((tuple(int(v) * 4 for v in track.box), color, text))
+        return overlays
 
-                self.change_pixmap_signal.emit(display_img)
-        cap.release()
+    def apply_setting(self, key, value):
+        if key in ("num_jitters", "tolerance", "liveness_enabled", "motion_gate_enabled"):
+            setattr(self, key, value)
+        elif key == "ann_nprobe":
+            self.matcher.nprobe = value
 
     def stop(self):
+        self.setting_changes.close()
         self._run_flag = False
         self.wait()
 
 class AttendanceWidget(QWidget):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
-        self.db = DatabaseManager()
-        self.email_manager = EmailManager()
+        self.db = db
         self.face_engine = FaceEngine()
-        self.known_face_encodings = []
-        self.known_face_ids = []
-        self.known_face_names = []
+        self.matcher = GalleryMatcher()
         self.last_processed_time = datetime.datetime.now()
         
         self.init_ui()
-        # Check for report on startup 
-        self.check_and_send_daily_report()
         
     def init_ui(self):
         layout = QHBoxLayout()
@@ -238,9 +315,16 @@ class AttendanceWidget(QWidget):
         refresh_btn.clicked.connect(self.load_todays_log)
         log_layout.addWidget(refresh_btn)
         
-        export_btn = QPushButton("Export to CSV")
-        export_btn.clicked.connect(self.export_log)
-        log_layout.addWidget(export_btn)
+        export_layout = QHBoxLayout()
+        self.export_btn = QPushButton("Export to CSV")
+        self.export_btn.clicked.connect(self.export_log)
+        export_layout.addWidget(self.export_btn)
+        self.cancel_export_btn = QPushButton("Cancel Export")
+        self.cancel_export_btn.clicked.connect(self.cancel_export)
+        self.cancel_export_btn.setEnabled(False)
+        export_layout.addWidget(self.cancel_export_btn)
+        log_layout.addLayout(export_layout)
+        self.export_thread = None
         
         self.log_group.setLayout(log_layout)
         right_layout.addWidget(self.log_group, stretch=1)
@@ -248,42 +332,52 @@ class AttendanceWidget(QWidget):
         layout.addLayout(right_layout)
 
     def export_log(self):
-        records = self.db.get_attendance_today()
-        if not records:
+        today = datetime.datetime.now().strftime("%Y-%m-%d")
+        if self.db.count_attendance_range(today, today) == 0:
             QMessageBox.information(self, "Info", "No records to export.")
             return
-            
-        import pandas as pd
-        df = pd.DataFrame(records, columns=["Name", "Timestamp", "IsActive", "Mood"])
-        df['Status'] = df['IsActive'].apply(lambda x: "Active" if x == 1 else "Deleted")
-        # Final export with clean columns
-        export_df = df[["Name", "Timestamp", "Status", "Mood"]]
         
-        filename, _ = QFileDialog.getSaveFileName(self, "Save CSV", "", "CSV Files (*.csv)")
+        filename, selected_filter = QFileDialog.getSaveFileName(self, "Save CSV", "", "CSV Files (*.csv);;Excel Files (*.xlsx)")
         if filename:
-            export_df.to_csv(filename, index=False)
-            QMessageBox.information(self, "Success", f"Exported to {filename}")
+            filename = with_export_extension(filename, selected_filter)
+            # Written in the background with clean columns
+            self.export_thread = ExportThread(self.db, filename, today, today,
+                                              columns=["Name", "Timestamp", "Status", "Mood"])
+            self.export_thread.finished_signal.connect(self.on_export_finished)
+            self.export_thread.cancelled_signal.connect(self.on_export_cancelled)
+            self.set_export_running(True)
+            self.export_thread.start()
+
+    def set_export_running(self, running):
+        # One export at a time: the running thread must not lose its last reference
+        self.export_btn.setEnabled(not running)
+        self.cancel_export_btn.setEnabled(running)
+
+    def cancel_export(self):
+        if self.export_thread is not None and self.export_thread.isRunning():
+            self.export_thread.cancel()
+
+    def on_export_cancelled(self):
+        self.set_export_running(False)
+
+    def on_export_finished(self, success, result):
+        self.set_export_running(False)
+        if success:
+            QMessageBox.information(self, "Success", f"Exported to {result}")
+        else:
+            QMessageBox.critical(self, "Error", f"Export failed:\n{result}")
 
     def load_known_faces(self):
-        self.known_face_encodings = []
-        self.known_face_ids = []
-        self.known_face_names = []
-        
-        encodings_data = self.db.get_all_encodings()
-        users = {u[0]: u[1] for u in self.db.get_all_users()}
-        
-        for user_id, enc_bytes in encodings_data:
-            encoding = self.face_engine.decode_from_bytes(enc_bytes)
-            self.known_face_encodings.append(encoding)
-            self.known_face_ids.append(user_id)
-            self.known_face_names.append(users.get(user_id, "Unknown"))
-            
-        self.status_label.setText(f"Loaded {len(self.known_face_encodings)} face encodings.")
+        # Shared and kept current on enrollment, only the first start loads it
+        self.matcher = get_live_gallery(self.db)
+        self.status_label.setText(f"Loaded {len(self.matcher)} face encodings.")
 
     def start_system(self):
         self.load_known_faces()
-        self.video_thread = AttendanceVideoThread(self.known_face_encodings, self.known_face_ids, self.known_face_names, self.db)
+        self.event_writer = EventWriter(self.db).start()
+        self.video_thread = AttendanceVideoThread(self.matcher, self.db, self.event_writer)
         self.video_thread.change_pixmap_signal.connect(self.update_image)
+        self.video_thread.stats_signal.connect(self.status_label.setText)
         self.video_thread.start()
         self.status_label.setText("Status: Scanning...")
         self.start_btn.setEnabled(False)
@@ -302,6 +396,14 @@ class AttendanceWidget(QWidget):
     def stop_system(self):
         if hasattr(self, 'video_thread'):
             self.video_thread.stop()
+            try:
+                self.video_thread.stats_signal.disconnect()
+            except TypeError:
+                pass # Already disconnected
+        if hasattr(self, 'event_writer'):
+            # Flush queued check-ins and strangers before reporting stopped
+            self.event_writer.stop()
+            self.load_todays_log()
         self.status_label.setText("Status: Stopped")
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
@@ -343,20 +445,10 @@ class AttendanceWidget(QWidget):
                 mood_item.setForeground(Qt.GlobalColor.yellow)
             self.log_table.setItem(row, 2, mood_item)
 
-    def check_and_send_daily_report(self):
-        """Checks if yesterday's report was sent, and sends it if not."""
-        yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
-        last_sent = self.db.get_setting("last_report_sent_date", "")
-
-        if last_sent != yesterday:
-            records = self.db.get_attendance_range(yesterday, yesterday)
-            if records:
-                print(f"Sending automated daily report for {yesterday}...")
-                if self.email_manager.send_daily_report(yesterday, records):
-                    self.db.set_setting("last_report_sent_date", yesterday)
-
     def cleanup(self):
         self.stop_system()
+        if self.export_thread is not None and self.export_thread.isRunning():
+            self.export_thread.stop()
 
     def hideEvent(self, event):
         self.cleanup()
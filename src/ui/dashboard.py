@@ -6,8 +6,8 @@ from PyQt6.QtCore import Qt, QTimer, pyqtSignal
 from PyQt6.QtGui import QImage, QPixmap
 import cv2
 import numpy as np
-from src.database import DatabaseManager
 from src.face_engine import FaceEngine
+from src.capture import camera_manager
 
 class CameraWidget(QWidget):
     image_captured = pyqtSignal(np.ndarray)
@@ -27,24 +27,29 @@ class CameraWidget(QWidget):
         self.capture_btn.clicked.connect(self.capture_image)
         self.layout.addWidget(self.capture_btn)
         
-        self.cap = None
+        self.subscriber = None
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
         
     def start_camera(self):
-        if self.cap is None:
-            self.cap = cv2.VideoCapture(0)
+        # The device itself is owned by the shared camera manager
+        if self.subscriber is None:
+            self.subscriber = camera_manager.acquire(0).subscribe()
         self.timer.start(30)
         
     def stop_camera(self):
         self.timer.stop()
-        if self.cap:
-            self.cap.release()
-            self.cap = None
+        if self.subscriber:
+            camera_manager.release(0)
+            self.subscriber = None
             
     def update_frame(self):
-        ret, frame = self.cap.read()
-        if ret:
+        if self.subscriber.error:
+            self.video_label.setText(self.subscriber.error)
+            self.stop_camera()
+            return
+        frame = self.subscriber.read(timeout=0)
+        if frame is not None:
             self.current_frame = frame
             # Convert to Qt format
             rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -60,14 +65,14 @@ class CameraWidget(QWidget):
             self.stop_camera()
 
 class AddUserDialog(QDialog):
-    def __init__(self, parent=None, user_data=None):
+    def __init__(self, db, parent=None, user_data=None):
         super().__init__(parent)
         self.user_data = user_data # If not None, we are in Edit Mode
         self.setWindowTitle("Edit Person" if self.user_data else "Add New Person")
         self.setModal(True)
         self.resize(600, 500)
         
-        self.db = DatabaseManager()
+        self.db = db
         self.face_engine = FaceEngine()
         self.captured_images = [] # List of numpy arrays
         
@@ -249,9 +254,9 @@ class AddUserDialog(QDialog):
         super().reject()
 
 class DashboardWidget(QWidget):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
-        self.db = DatabaseManager()
+        self.db = db
         self.init_ui()
         self.load_users()
 
@@ -320,14 +325,14 @@ class DashboardWidget(QWidget):
                 self.user_table.setRowHidden(row, True)
 
     def open_add_user_dialog(self):
-        dialog = AddUserDialog(self)
+        dialog = AddUserDialog(self.db, self)
         if dialog.exec():
             self.load_users()
 
     def edit_user(self, user_id):
         user = self.db.get_user(user_id)
         if user:
-            dialog = AddUserDialog(self, user_data=user)
+            dialog = AddUserDialog(self.db, self, user_data=user)
             if dialog.exec():
                 self.load_users()
 
@@ -0,0 +1,39 @@
+from PyQt6.QtCore import QThread, pyqtSignal
+from src.exporter import export_attendance, ExportCancelled, ATTENDANCE_COLUMNS
+
+class ExportThread(QThread):
+    """Streams an attendance export to disk off the GUI thread."""
+    progress_signal = pyqtSignal(int) # percent
+    finished_signal = pyqtSignal(bool, str) # success, file path or error
+    cancelled_signal = pyqtSignal() # stopped before the end, nothing was kept
+
+    def __init__(self, db, path, start_date, end_date, columns=ATTENDANCE_COLUMNS):
+        super().__init__()
+        self.db = db
+        self.path = path
+        self.start_date = start_date
+        self.end_date = end_date
+        self.columns = columns
+        self._run_flag = True
+
+    def run(self):
+        try:
+            export_attendance(self.db, self.path, self.start_date, self.end_date, self.columns,
+                              progress=self.report_progress, should_stop=lambda: not self._run_flag)
+            self.finished_signal.emit(True, self.path)
+        except ExportCancelled:
+            self.cancelled_signal.emit()
+        except Exception as e:
+            print(f"Export error: {e}")
+            self.finished_signal.emit(False, str(e))
+
+    def report_progress(self, done, total):
+        self.progress_signal.emit(int(done * 100 / total) if total else 100)
+
+    def cancel(self):
+        """Asks the export to stop after the current chunk, without waiting."""
+        self._run_flag = False
+
+    def stop(self):
+        self.cancel()
+        self.wait()
@@ -1,16 +1,149 @@
 import os
 import datetime
-import pandas as pd
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                             QTableWidget, QTableWidgetItem, QHeaderView, 
+                             QTableView, QHeaderView, QLineEdit, QStyledItemDelegate,
                              QPushButton, QDateEdit, QGroupBox, QMessageBox, QFileDialog, QScroller)
-from PyQt6.QtCore import Qt, QDate
-from src.database import DatabaseManager
+from PyQt6.QtCore import Qt, QDate, QAbstractTableModel, QModelIndex, QPersistentModelIndex, QEvent, pyqtSignal
+from PyQt6.QtGui import QColor
+from src.ui.export_thread import ExportThread
+from src.exporter import with_export_extension
+
+class AttendanceHistoryModel(QAbstractTableModel):
+    """
+    Attendance history fetched page by page as the view scrolls (keyset pagination),
+    sorted and filtered by SQLite.
+    """
+    HEADERS = ["ID", "Name", "Status", "Mood", "Date", "Time", "Action"]
+    SORT_KEYS = ["id", "name", "status", "mood", "date", "date", None]
+    PAGE_SIZE = 500
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self.rows = [] # [(id, name, status, mood, date, time)]
+        self.last_key = None
+        self.has_more = False
+        self.start = self.end = None
+        self.name_filter = None
+        self.sort_key = "date"
+        self.descending = True
+
+    def load(self, start, end, name_filter=None):
+        self.start, self.end, self.name_filter = start, end, name_filter or None
+        self.reload()
+
+    def reload(self):
+        self.beginResetModel()
+        self.rows = []
+        self.last_key = None
+        self.has_more = self.start is not None
+        if self.has_more:
+            self.rows = self._fetch_page()
+        self.endResetModel()
+
+    def _fetch_page(self):
+        records, self.last_key = self.db.get_attendance_page(
+            self.start, self.end, self.last_key, self.PAGE_SIZE,
+            self.sort_key, self.descending, self.name_filter)
+        self.has_more = len(records) == self.PAGE_SIZE
+        page = []
+        for rid, name, date, ts, is_active, emotion in records:
+            # Format time from ISO
+            try:
+                time_str = datetime.datetime.fromisoformat(ts).strftime("%H:%M:%S")
+            except:
+                time_str = ts
+            page.append((rid, name, "Active" if is_active == 1 else "Deleted", emotion or "Neutral", date, time_str))
+        return page
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self.has_more:
+            return
+        page = self._fetch_page()
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row, col = self.rows[index.row()], index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return "Delete" if col == 6 else str(row[col])
+        if role == Qt.ItemDataRole.ForegroundRole:
+            if col == 2:
+                return Qt.GlobalColor.white
+            if col == 3 and row[3] == "Happy":
+                return Qt.GlobalColor.green
+            if col == 3 and row[3] == "Surprised":
+                return Qt.GlobalColor.yellow
+        return None
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        if self.SORT_KEYS[column] is None:
+            return
+        self.sort_key = self.SORT_KEYS[column]
+        self.descending = order == Qt.SortOrder.DescendingOrder
+        self.reload()
+
+    def record_id(self, row):
+        return self.rows[row][0]
+
+    def remove_row(self, row):
+        # Later pages continue from the last fetched key, so removing locally is safe
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.rows[row]
+        self.endRemoveRows()
+
+class DeleteButtonDelegate(QStyledItemDelegate):
+    """Paints a delete button in the action column, instead of one widget per row."""
+    delete_requested = pyqtSignal(int) # row
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pressed = None # cell the left button went down on
+
+    def paint(self, painter, option, index):
+        rect = option.rect.adjusted(4, 4, -4, -4)
+        painter.save()
+        painter.fillRect(rect, QColor("#c0392b"))
+        painter.setPen(Qt.GlobalColor.white)
+        painter.drawText(rect, Qt.AlignmentFlag.AlignCenter, "Delete")
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        # Press and release on the same button: a drag or kinetic scroll ending on it deletes nothing
+        if event.type() == QEvent.Type.MouseButtonPress:
+            inside = event.button() == Qt.MouseButton.LeftButton and option.rect.contains(event.position().toPoint())
+            self._pressed = QPersistentModelIndex(index) if inside else None
+        elif event.type() == QEvent.Type.MouseButtonRelease:
+            pressed, self._pressed = self._pressed, None
+            if (pressed is not None and pressed == QPersistentModelIndex(index)
+                    and option.rect.contains(event.position().toPoint())):
+                self.delete_requested.emit(index.row())
+                return True
+        return False
 
 class HistoryWidget(QWidget):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
-        self.db = DatabaseManager()
+        self.db = db
+        self.export_thread = None
         self.init_ui()
 
     def init_ui(self):
@@ -33,6 +166,11 @@ class HistoryWidget(QWidget):
         self.end_date.setDate(QDate.currentDate())
         filter_layout.addWidget(self.end_date)
 
+        self.name_filter = QLineEdit()
+        self.name_filter.setPlaceholderText("Filter by name...")
+        self.name_filter.returnPressed.connect(self.load_history)
+        filter_layout.addWidget(self.name_filter)
+
         self.apply_btn = QPushButton("Show Logs")
         self.apply_btn.clicked.connect(self.load_history)
         self.apply_btn.setStyleSheet("background-color: #3498db; font-weight: bold;")
@@ -53,16 +191,26 @@ class HistoryWidget(QWidget):
         self.monthly_report_btn.clicked.connect(lambda: self.generate_report("monthly"))
         filter_layout.addWidget(self.monthly_report_btn)
 
+        self.cancel_export_btn = QPushButton("Cancel Export")
+        self.cancel_export_btn.clicked.connect(self.cancel_export)
+        self.cancel_export_btn.setEnabled(False)
+        filter_layout.addWidget(self.cancel_export_btn)
+
         filter_group.setLayout(filter_layout)
         layout.addWidget(filter_group)
 
-        # 2. Table Section
-        self.table = QTableWidget()
-        self.table.setColumnCount(7)
-        self.table.setHorizontalHeaderLabels(["ID", "Name", "Status", "Mood", "Date", "Time", "Action"])
+        # 2. Table Section (rows are loaded page by page while scrolling)
+        self.model = AttendanceHistoryModel(self.db)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setSortIndicator(4, Qt.SortOrder.DescendingOrder)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
         self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)
+        self.delete_delegate = DeleteButtonDelegate(self.table)
+        self.delete_delegate.delete_requested.connect(self.delete_row)
+        self.table.setItemDelegateForColumn(6, self.delete_delegate)
         layout.addWidget(self.table)
         
         # Enable Kinetic Scrolling
@@ -79,57 +227,26 @@ class HistoryWidget(QWidget):
     def load_history(self):
         start = self.start_date.date().toString("yyyy-MM-dd")
         end = self.end_date.date().toString("yyyy-MM-dd")
+        name_filter = self.name_filter.text().strip()
         
-        records = self.db.get_attendance_range(start, end)
-        self.table.setRowCount(0)
-        
-        for rec in records:
-            rid, name, date, ts, is_active, emotion = rec
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            
-            # Format time from ISO
-            try:
-                time_str = datetime.datetime.fromisoformat(ts).strftime("%H:%M:%S")
-            except:
-                time_str = ts
+        self.model.load(start, end, name_filter)
+        self.record_count = self.db.count_attendance_range(start, end, name_filter)
+        self.status_label.setText(f"Records found: {self.record_count}")
 
-            status_text = "Active" if is_active == 1 else "Deleted"
-            
-            self.table.setItem(row, 0, QTableWidgetItem(str(rid)))
-            self.table.setItem(row, 1, QTableWidgetItem(name))
-            
-            # Status
-            status_item = QTableWidgetItem(status_text)
-            status_item.setForeground(Qt.GlobalColor.white)
-            self.table.setItem(row, 2, status_item)
-            
-            # Mood (Emotion)
-            mood_item = QTableWidgetItem(emotion or "Neutral")
-            if emotion == "Happy": 
-                mood_item.setForeground(Qt.GlobalColor.green)
-            elif emotion == "Surprised":
-                mood_item.setForeground(Qt.GlobalColor.yellow)
-            self.table.setItem(row, 3, mood_item)
-            
-            self.table.setItem(row, 4, QTableWidgetItem(date))
-            self.table.setItem(row, 5, QTableWidgetItem(time_str))
-            
-            # Delete Button
-            del_btn = QPushButton("Delete")
-            del_btn.setStyleSheet("background-color: #c0392b; color: white;")
-            del_btn.clicked.connect(lambda checked, r=rid: self.delete_record(r))
-            self.table.setCellWidget(row, 6, del_btn)
-
-        self.status_label.setText(f"Records found: {len(records)}")
+    def delete_row(self, row):
+        if self.delete_record(self.model.record_id(row)):
+            self.model.remove_row(row)
+            self.record_count -= 1
+            self.status_label.setText(f"Records found: {self.record_count}")
 
     def delete_record(self, record_id):
         reply = QMessageBox.question(self, 'Confirm', f"Delete attendance record #{record_id}?",
                                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         
         if reply == QMessageBox.StandardButton.Yes:
-            if self.db.delete_attendance_record(record_id):
-                self.load_history()
+            success, _ = self.db.delete_attendance_record(record_id)
+            return success
+        return False
 
     def generate_report(self, period):
         today = datetime.datetime.now()
@@ -143,22 +260,52 @@ class HistoryWidget(QWidget):
             start = today.replace(day=1).strftime("%Y-%m-%d")
             end = today.strftime("%Y-%m-%d")
 
-        records = self.db.get_attendance_range(start, end)
-        if not records:
+        if self.db.count_attendance_range(start, end) == 0:
             QMessageBox.warning(self, "No Data", f"No records found for the {period} period.")
             return
-
-        df = pd.DataFrame(records, columns=["ID", "Name", "Date", "Timestamp", "IsActive"])
-        df['Status'] = df['IsActive'].apply(lambda x: "Active" if x == 1 else "Deleted")
-        # Reorder columns for better report
-        df = df[["ID", "Name", "Status", "Date", "Timestamp"]]
         
-        file_path, _ = QFileDialog.getSaveFileName(self, "Save Report", 
-                                                 f"Attendance_Report_{period}_{start}.csv", 
-                                                 "CSV Files (*.csv)")
-        if file_path:
-            df.to_csv(file_path, index=False)
-            QMessageBox.information(self, "Success", f"Report saved to:\n{file_path}")
+        file_path, selected_filter = QFileDialog.getSaveFileName(self, "Save Report", 
+                                                 f"Attendance_Report_{period}_{start}", 
+                                                 "CSV Files (*.csv);;Excel Files (*.xlsx)")
+        if not file_path:
+            return
+        file_path = with_export_extension(file_path, selected_filter)
+        
+        # Streamed to disk in the background, page by page
+        self.set_report_buttons_enabled(False)
+        self.export_thread = ExportThread(self.db, file_path, start, end)
+        self.export_thread.progress_signal.connect(
+            lambda p: self.status_label.setText(f"Exporting report... {p}%"))
+        self.export_thread.finished_signal.connect(self.on_export_finished)
+        self.export_thread.cancelled_signal.connect(self.on_export_cancelled)
+        self.export_thread.start()
+
+    def cancel_export(self):
+        if self.export_thread is not None and self.export_thread.isRunning():
+            self.status_label.setText("Cancelling export...")
+            self.export_thread.cancel()
+
+    def on_export_cancelled(self):
+        self.set_report_buttons_enabled(True)
+        self.status_label.setText(f"Records found: {self.record_count} (export cancelled)")
+
+    def on_export_finished(self, success, result):
+        self.set_report_buttons_enabled(True)
+        self.status_label.setText(f"Records found: {self.record_count}")
+        if success:
+            QMessageBox.information(self, "Success", f"Report saved to:\n{result}")
+        else:
+            QMessageBox.critical(self, "Error", f"Export failed:\n{result}")
+
+    def set_report_buttons_enabled(self, enabled):
+        for btn in (self.daily_report_btn, self.weekly_report_btn, self.monthly_report_btn):
+            btn.setEnabled(enabled)
+        self.cancel_export_btn.setEnabled(not enabled)
+
+    def cleanup(self):
+        # A running export must finish (and delete its partial file) before the thread object goes away
+        if self.export_thread is not None and self.export_thread.isRunning():
+            self.export_thread.stop()
 
     def refresh_data(self):
         self.load_history()
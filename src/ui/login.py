@@ -1,12 +1,11 @@
 from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QLabel, QLineEdit, 
                              QPushButton, QMessageBox)
 from PyQt6.QtCore import Qt
-from src.database import DatabaseManager
 
 class LoginDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, db, parent=None):
         super().__init__(parent)
-        self.db = DatabaseManager()
+        self.db = db
         self.setWindowTitle("Admin Login")
         self.setFixedSize(300, 150)
         self.init_ui()
@@ -1,20 +1,34 @@
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QTabWidget, 
                               QLabel, QStatusBar, QScrollArea)
-from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve, QPoint, QRect
+from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve, QPoint, QRect, QTimer
 import sys
+import importlib
+import threading
 
-from src.ui.dashboard import DashboardWidget
-from src.ui.testing import TestingWidget
-from src.ui.attendance import AttendanceWidget
-from src.ui.analytics import AnalyticsWidget
-from src.ui.history import HistoryWidget
-from src.ui.settings import SettingsWidget
-from src.ui.video_analysis import VideoAnalysisWidget
-from src.ui.strangers import StrangerWidget
+from src.capture import camera_manager
+from src.db_pool import close_all_pools
+from src.startup import startup_timer
+
+# (title, module, widget class, attribute, wrapped in a scroll area)
+# Each tab is imported and built on its first activation.
+TABS = [
+    ("Identity Management", "src.ui.dashboard", "DashboardWidget", "dashboard_tab", True),
+    ("Model Testing", "src.ui.testing", "TestingWidget", "testing_tab", False),
+    ("Attendance System", "src.ui.attendance", "AttendanceWidget", "attendance_tab", False),
+    ("Analytics", "src.ui.analytics", "AnalyticsWidget", "analytics_tab", True),
+    ("Attendance Logs", "src.ui.history", "HistoryWidget", "history_tab", False),
+    ("Settings", "src.ui.settings", "SettingsWidget", "settings_tab", True),
+    ("Video Analysis", "src.ui.video_analysis", "VideoAnalysisWidget", "video_analysis_tab", False),
+    ("Strangers", "src.ui.strangers", "StrangerWidget", "strangers_tab", False),
+]
+
+REPORT_CHECK_DELAY_MS = 5000
+RECLUSTER_INTERVAL_MS = 60 * 60 * 1000
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
+        self.db = db # shared by every tab
         self.setWindowTitle("Face Recognition System")
         self.setGeometry(100, 100, 1200, 800)
         
@@ -33,37 +47,13 @@ class MainWindow(QMainWindow):
         self.tabs = QTabWidget()
         main_layout.addWidget(self.tabs)
         
-        # Initialize Tab Widgets
-        self.dashboard_tab = DashboardWidget()
-        self.testing_tab = TestingWidget()
-        self.attendance_tab = AttendanceWidget()
-        self.analytics_tab = AnalyticsWidget()
-        self.history_tab = HistoryWidget()
-        self.settings_tab = SettingsWidget()
-        self.video_analysis_tab = VideoAnalysisWidget()
-        self.strangers_tab = StrangerWidget()
-        
-        # Helper to create styled scroll area
-        def wrap_scroll(widget):
-            scroll = QScrollArea()
-            scroll.setWidget(widget)
-            scroll.setWidgetResizable(True)
-            scroll.setFrameShape(QScrollArea.Shape.NoFrame)
-            scroll.setStyleSheet("background-color: transparent;")
-            # Enable kinetic scrolling for the scroll area itself
-            from PyQt6.QtWidgets import QScroller
-            QScroller.grabGesture(scroll.viewport(), QScroller.ScrollerGestureType.LeftMouseButtonGesture)
-            return scroll
-
-        # Add Tabs (Wrapped in Scroll Areas where needed)
-        self.tabs.addTab(wrap_scroll(self.dashboard_tab), "Identity Management")
-        self.tabs.addTab(self.testing_tab, "Model Testing")
-        self.tabs.addTab(self.attendance_tab, "Attendance System")
-        self.tabs.addTab(wrap_scroll(self.analytics_tab), "Analytics")
-        self.tabs.addTab(self.history_tab, "Attendance Logs")
-        self.tabs.addTab(wrap_scroll(self.settings_tab), "Settings")
-        self.tabs.addTab(self.video_analysis_tab, "Video Analysis")
-        self.tabs.addTab(self.strangers_tab, "Strangers")
+        # Empty pages for now, a tab's widget is created when it is first shown
+        for title, _, _, attr, _ in TABS:
+            setattr(self, attr, None)
+            page = QWidget()
+            page_layout = QVBoxLayout(page)
+            page_layout.setContentsMargins(0, 0, 0, 0)
+            self.tabs.addTab(page, title)
         
         # Status Bar
         self.status_bar = QStatusBar()
@@ -72,15 +62,86 @@ class MainWindow(QMainWindow):
 
         # Connect tab change signal
         self.tabs.currentChanged.connect(self.on_tab_change)
+        self.ensure_tab(self.tabs.currentIndex())
+
+    def wrap_scroll(self, widget):
+        """Helper to create styled scroll area"""
+        scroll = QScrollArea()
+        scroll.setWidget(widget)
+        scroll.setWidgetResizable(True)
+        scroll.setFrameShape(QScrollArea.Shape.NoFrame)
+        scroll.setStyleSheet("background-color: transparent;")
+        # Enable kinetic scrolling for the scroll area itself
+        from PyQt6.QtWidgets import QScroller
+        QScroller.grabGesture(scroll.viewport(), QScroller.ScrollerGestureType.LeftMouseButtonGesture)
+        return scroll
+
+    def ensure_tab(self, index):
+        """Imports and builds the widget of a tab on its first activation."""
+        if index < 0:
+            return None
+        _, module_name, class_name, attr, scroll = TABS[index]
+        widget = getattr(self, attr)
+        if widget is None:
+            widget_class = getattr(importlib.import_module(module_name), class_name)
+            widget = widget_class(self.db)
+            setattr(self, attr, widget)
+            self.tabs.widget(index).layout().addWidget(self.wrap_scroll(widget) if scroll else widget)
+        return widget
+
+    def on_shown(self):
+        """Startup work that would delay the first paint, started once the window is visible."""
+        startup_timer.mark("main_window", "Main window", since="login")
+        threading.Thread(target=self.warm_up_models, daemon=True).start()
+        QTimer.singleShot(REPORT_CHECK_DELAY_MS, self.start_report_check)
+        # Merge stranger rows that turned out to be the same person, now and then every hour
+        self.recluster_timer = QTimer(self)
+        self.recluster_timer.timeout.connect(self.start_recluster)
+        self.recluster_timer.start(RECLUSTER_INTERVAL_MS)
+        QTimer.singleShot(REPORT_CHECK_DELAY_MS, self.start_recluster)
+
+    def warm_up_models(self):
+        from src.face_engine import warm_up
+        try:
+            warm_up()
+            startup_timer.mark("models_ready", "Face models loaded", since="main_window")
+        except Exception as e:
+            print(f"Model warm-up error: {e}")
+
+    def start_report_check(self):
+        # Sending mail can take seconds, keep it off the GUI thread
+        threading.Thread(target=self.send_pending_report, daemon=True).start()
+
+    def send_pending_report(self):
+        from src.utils import EmailManager
+        try:
+            EmailManager(self.db).check_and_send_daily_report()
+        except Exception as e:
+            print(f"Daily report error: {e}")
+
+    def start_recluster(self):
+        threading.Thread(target=self.recluster_strangers, daemon=True).start()
+
+    def recluster_strangers(self):
+        try:
+            merged = self.db.recluster_strangers()
+            if merged:
+                print(f"Merged {merged} duplicate stranger records")
+            self.db.prune_stranger_sightings()
+        except Exception as e:
+            print(f"Stranger re-clustering error: {e}")
 
     def set_status(self, message):
         self.status_bar.showMessage(message)
 
     def on_tab_change(self, index):
+        self.ensure_tab(index)
+        
         # 1. Handle background cleanup/refresh
-        if index != 1:
+        # (stopping a tab only releases its camera subscription, the device stays warm)
+        if index != 1 and self.testing_tab:
             self.testing_tab.cleanup()
-        if index != 2:
+        if index != 2 and self.attendance_tab:
             self.attendance_tab.cleanup()
             
         if self.tabs.tabText(index) == "Analytics":
@@ -110,7 +171,11 @@ class MainWindow(QMainWindow):
                 print(f"Animation Error: {e}")
 
     def closeEvent(self, event):
-        self.testing_tab.cleanup()
-        self.attendance_tab.cleanup()
-        self.video_analysis_tab.cleanup()
+        for tab in (self.testing_tab, self.attendance_tab, self.history_tab, self.video_analysis_tab):
+            if tab:
+                tab.cleanup()
+        # Close cameras now instead of waiting for the keep-alive period
+        camera_manager.shutdown()
+        # Closing the last connection checkpoints the WAL back into the database file
+        close_all_pools()
         event.accept()
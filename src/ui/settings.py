@@ -1,12 +1,11 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                             QLineEdit, QPushButton, QGroupBox, QMessageBox, QSlider, QCheckBox)
+                             QLineEdit, QPushButton, QGroupBox, QMessageBox, QSlider, QCheckBox, QSpinBox)
 from PyQt6.QtCore import Qt
-from src.database import DatabaseManager
 
 class SettingsWidget(QWidget):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
-        self.db = DatabaseManager()
+        self.db = db
         self.init_ui()
 
     def init_ui(self):
@@ -71,21 +70,40 @@ class SettingsWidget(QWidget):
         tuning_layout.addWidget(QLabel("Recognition Accuracy (Jitters):"))
         self.jitter_slider = QSlider(Qt.Orientation.Horizontal)
         self.jitter_slider.setRange(1, 10)
-        self.jitter_slider.setValue(int(self.db.get_setting("num_jitters", "1")))
+        self.jitter_slider.setValue(self.db.get_typed_setting("num_jitters"))
         tuning_layout.addWidget(self.jitter_slider)
 
         # Sensitivity (Tolerance)
         tuning_layout.addWidget(QLabel("Recognition Sensitivity (Tolerance - Lower is Stricter):"))
         self.tolerance_slider = QSlider(Qt.Orientation.Horizontal)
         self.tolerance_slider.setRange(30, 70) # 0.3 to 0.7
-        self.tolerance_slider.setValue(int(float(self.db.get_setting("tolerance", "0.45")) * 100))
+        self.tolerance_slider.setValue(int(round(self.db.get_typed_setting("tolerance") * 100)))
         tuning_layout.addWidget(self.tolerance_slider)
 
+        # Search Speed vs Recall (ANN probes)
+        tuning_layout.addWidget(QLabel("Large Gallery Search (Lower is Faster, Higher is More Accurate):"))
+        self.nprobe_slider = QSlider(Qt.Orientation.Horizontal)
+        self.nprobe_slider.setRange(1, 64)
+        self.nprobe_slider.setValue(self.db.get_typed_setting("ann_nprobe"))
+        tuning_layout.addWidget(self.nprobe_slider)
+
+        # Camera keep-alive after the last user leaves (avoids reopening USB cameras on tab switch)
+        tuning_layout.addWidget(QLabel("Keep Camera Open After Use (seconds):"))
+        self.camera_grace_spin = QSpinBox()
+        self.camera_grace_spin.setRange(0, 300)
+        self.camera_grace_spin.setValue(int(self.db.get_typed_setting("camera_grace_seconds")))
+        tuning_layout.addWidget(self.camera_grace_spin)
+
         # Liveness Toggle
         self.liveness_cb = QCheckBox("Enable Liveness Detection (Blink Check)")
-        self.liveness_cb.setChecked(self.db.get_setting("liveness_enabled", "1") == "1")
+        self.liveness_cb.setChecked(self.db.get_typed_setting("liveness_enabled"))
         tuning_layout.addWidget(self.liveness_cb)
 
+        # Skip face detection while the camera sees no motion
+        self.motion_gate_cb = QCheckBox("Skip Detection When Nothing Moves")
+        self.motion_gate_cb.setChecked(self.db.get_typed_setting("motion_gate_enabled"))
+        tuning_layout.addWidget(self.motion_gate_cb)
+
         self.save_tuning_btn = QPushButton("Save Engine Settings")
         self.save_tuning_btn.clicked.connect(self.save_tuning_settings)
         self.save_tuning_btn.setStyleSheet("background-color: #9b59b6; font-weight: bold;")
@@ -115,7 +133,10 @@ class SettingsWidget(QWidget):
     def save_tuning_settings(self):
         self.db.set_setting("num_jitters", str(self.jitter_slider.value()))
         self.db.set_setting("tolerance", str(self.tolerance_slider.value() / 100.0))
+        self.db.set_setting("ann_nprobe", str(self.nprobe_slider.value()))
+        self.db.set_setting("camera_grace_seconds", str(self.camera_grace_spin.value()))
         self.db.set_setting("liveness_enabled", "1" if self.liveness_cb.isChecked() else "0")
+        self.db.set_setting("motion_gate_enabled", "1" if self.motion_gate_cb.isChecked() else "0")
         QMessageBox.information(self, "Success", "Engine settings applied!")
 
     def save_email_settings(self):
@@ -1,15 +1,156 @@
-from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                             QPushButton, QTableWidget, QTableWidgetItem, 
-                             QHeaderView, QMessageBox, QScroller)
-from PyQt6.QtCore import Qt, QSize
-from PyQt6.QtGui import QPixmap, QIcon
-from src.database import DatabaseManager
-import os
+from collections import OrderedDict
+import time
+import cv2
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableView,
+                             QHeaderView, QScroller, QFileDialog, QMessageBox, QInputDialog, QAbstractItemView)
+from PyQt6.QtCore import (Qt, QSize, QObject, QRunnable, QThreadPool, QAbstractTableModel,
+                          QModelIndex, pyqtSignal)
+from PyQt6.QtGui import QPixmap, QImage
+from src.ui.history import DeleteButtonDelegate
+from src.face_engine import FaceEngine
+
+THUMBNAIL_ROW_HEIGHT = 100
+
+class PixmapCache:
+    """Least recently used thumbnails, so scrolling back never reloads from disk."""
+    def __init__(self, capacity=512):
+        self.capacity = capacity
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        pixmap = self._items.get(key)
+        if key in self._items:
+            self._items.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        self._items[key] = pixmap
+        self._items.move_to_end(key)
+        while len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+
+class _ThumbnailTask(QRunnable):
+    def __init__(self, loader, path):
+        super().__init__()
+        self.loader = loader
+        self.path = path
+
+    def run(self):
+        image = QImage()
+        try:
+            thumb_path = self.loader.crops.ensure_thumbnail(self.path)
+            if thumb_path:
+                image = QImage(thumb_path)
+        except Exception as e:
+            print(f"Thumbnail error: {e}")
+        # Queued to the GUI thread, QPixmap can only be created there
+        self.loader.loaded.emit(self.path, image)
+
+class ThumbnailLoader(QObject):
+    """Decodes stranger thumbnails on a thread pool, each path at most once at a time."""
+    loaded = pyqtSignal(str, QImage) # crop path, thumbnail (null if unreadable)
+
+    def __init__(self, crops, parent=None):
+        super().__init__(parent)
+        self.crops = crops
+        self.pool = QThreadPool.globalInstance()
+        self.pending = set()
+        self.loaded.connect(lambda path, _: self.pending.discard(path))
+
+    def request(self, path):
+        if path in self.pending:
+            return
+        self.pending.add(path)
+        self.pool.start(_ThumbnailTask(self, path))
+
+class StrangerTableModel(QAbstractTableModel):
+    """Stranger rows with thumbnails that are only loaded once their row is painted."""
+    HEADERS = ["Photo", "First Seen", "Last Seen", "Sightings", "Distance", "Action"]
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self.rows = [] # [(id, image_path, first_seen, last_seen, count)]
+        self.distances = None # set while showing search results
+        self.rows_by_path = {}
+        self.cache = PixmapCache()
+        self.loader = ThumbnailLoader(db.crops, self)
+        self.loader.loaded.connect(self.on_thumbnail_loaded)
+
+    def reload(self):
+        self.set_rows(self.db.get_all_strangers())
+
+    def set_rows(self, rows, distances=None):
+        self.beginResetModel()
+        self.rows = rows
+        self.distances = distances
+        self._index_paths()
+        self.endResetModel()
+
+    def _index_paths(self):
+        self.rows_by_path = {}
+        for i, rec in enumerate(self.rows):
+            if rec[1]:
+                self.rows_by_path.setdefault(rec[1], []).append(i)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        sid, img_path, first, last, count = self.rows[index.row()]
+        col = index.column()
+        if col == 0:
+            if role == Qt.ItemDataRole.DecorationRole and img_path:
+                if img_path in self.cache:
+                    return self.cache.get(img_path)
+                self.loader.request(img_path)
+                return None
+            if role == Qt.ItemDataRole.DisplayRole:
+                missing = not img_path or (img_path in self.cache and self.cache.get(img_path) is None)
+                return "No Image" if missing else None
+            if role == Qt.ItemDataRole.SizeHintRole:
+                return QSize(THUMBNAIL_ROW_HEIGHT, THUMBNAIL_ROW_HEIGHT)
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            if col == 4:
+                return f"{self.distances[index.row()]:.3f}" if self.distances else None
+            return [None, first, last, str(count or 1), None, "Delete"][col]
+        return None
+
+    def on_thumbnail_loaded(self, path, image):
+        self.cache.put(path, None if image.isNull() else QPixmap.fromImage(image))
+        for row in self.rows_by_path.get(path, []):
+            index = self.index(row, 0)
+            self.dataChanged.emit(index, index)
+
+    def stranger_id(self, row):
+        return self.rows[row][0]
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.rows[row]
+        if self.distances:
+            del self.distances[row]
+        self._index_paths()
+        self.endRemoveRows()
 
 class StrangerWidget(QWidget):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
-        self.db = DatabaseManager()
+        self.db = db
         self.init_ui()
 
     def init_ui(self):
@@ -21,61 +162,102 @@ class StrangerWidget(QWidget):
         title = QLabel("Stranger Tracking Log")
         title.setStyleSheet("font-size: 18px; font-weight: bold; color: #e74c3c;")
         header_layout.addWidget(title)
-        
+
+        header_layout.addStretch()
+
+        self.search_btn = QPushButton("Search by Face")
+        self.search_btn.clicked.connect(self.search_by_face)
+        self.search_btn.setStyleSheet("background-color: #3498db; font-weight: bold;")
+        header_layout.addWidget(self.search_btn)
+
+        self.promote_btn = QPushButton("Promote to User")
+        self.promote_btn.clicked.connect(self.promote_selected)
+        self.promote_btn.setStyleSheet("background-color: #27ae60; font-weight: bold;")
+        header_layout.addWidget(self.promote_btn)
+
         self.refresh_btn = QPushButton("Refresh")
         self.refresh_btn.clicked.connect(self.load_strangers)
         header_layout.addWidget(self.refresh_btn)
-        
+
         layout.addLayout(header_layout)
 
-        # Table
-        self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(["Photo", "First Seen", "Last Seen", "Action"])
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        # Table (thumbnails are loaded in the background as rows come into view)
+        self.model = StrangerTableModel(self.db)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setIconSize(QSize(THUMBNAIL_ROW_HEIGHT - 4, THUMBNAIL_ROW_HEIGHT - 4))
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
-        self.table.verticalHeader().setDefaultSectionSize(100)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(THUMBNAIL_ROW_HEIGHT)
+        self.delete_delegate = DeleteButtonDelegate(self.table)
+        self.delete_delegate.delete_requested.connect(self.delete_row)
+        self.table.setItemDelegateForColumn(5, self.delete_delegate)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setColumnHidden(4, True)
         layout.addWidget(self.table)
-        
+
         # Kinetic Scrolling
         QScroller.grabGesture(self.table, QScroller.ScrollerGestureType.LeftMouseButtonGesture)
 
         self.load_strangers()
 
     def load_strangers(self):
-        records = self.db.get_all_strangers()
-        self.table.setRowCount(0)
-        
-        for rec in records:
-            sid, img_path, first, last, count = rec
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            
-            # Photo
-            img_label = QLabel()
-            if os.path.exists(img_path):
-                pixmap = QPixmap(img_path)
-                img_label.setPixmap(pixmap.scaled(100, 100, Qt.AspectRatioMode.KeepAspectRatio))
-            else:
-                img_label.setText("No Image")
-            self.table.setCellWidget(row, 0, img_label)
-            
-            self.table.setItem(row, 1, QTableWidgetItem(first))
-            self.table.setItem(row, 2, QTableWidgetItem(last))
-            
-            # Actions
-            action_widget = QWidget()
-            action_layout = QHBoxLayout(action_widget)
-            
-            del_btn = QPushButton("Delete")
-            del_btn.setStyleSheet("background-color: #c0392b; color: white;")
-            del_btn.clicked.connect(lambda checked, i=sid: self.delete_stranger(i))
-            action_layout.addWidget(del_btn)
-            
-            self.table.setCellWidget(row, 3, action_widget)
-
-    def delete_stranger(self, sid):
-        if self.db.delete_stranger(sid):
-            self.load_strangers()
+        self.model.reload()
+        self.table.setColumnHidden(4, True)
+        self.status_label.setText(f"{self.model.rowCount()} strangers")
+
+    def search_by_face(self):
+        """Lists the strangers closest to the face in an image, best match first."""
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select Image", "", "Images (*.png *.jpg *.jpeg)")
+        if not file_path:
+            return
+        from src.utils import load_image_safe
+        image = load_image_safe(file_path)
+        if image is None:
+            QMessageBox.warning(self, "Error", "Failed to load image. Please check the file format and path.")
+            return
+        encodings = FaceEngine().get_face_encodings(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        if not encodings:
+            QMessageBox.information(self, "Search", "No face detected in the selected image.")
+            return
+
+        start = time.perf_counter()
+        results = self.db.search_strangers(encodings[0])
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.model.set_rows([r[:5] for r in results], [r[5] for r in results])
+        self.table.setColumnHidden(4, False)
+        self.status_label.setText(f"{len(results)} closest strangers ({elapsed_ms:.1f} ms) - "
+                                  f"lower distance is more similar, Refresh shows all")
+
+    def promote_selected(self):
+        """Enrolls the selected stranger as a user, reusing the stored face embedding."""
+        rows = self.table.selectionModel().selectedRows()
+        if not rows:
+            QMessageBox.information(self, "Promote", "Select a stranger first.")
+            return
+        row = rows[0].row()
+        name, ok = QInputDialog.getText(self, "Promote to User", "Name:")
+        name = name.strip()
+        if not ok or not name:
+            return
+        try:
+            self.db.promote_stranger(self.model.stranger_id(row), name)
+        except ValueError as e:
+            QMessageBox.warning(self, "Promote", str(e))
+            return
+        self.model.remove_row(row)
+        QMessageBox.information(self, "Success", f"{name} was added as a user.")
+
+    def delete_row(self, row):
+        sid = self.model.stranger_id(row)
+        reply = QMessageBox.question(self, 'Confirm', f"Delete stranger #{sid} and their photo? This cannot be undone.",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply == QMessageBox.StandardButton.Yes and self.db.delete_stranger(sid):
+            self.model.remove_row(row)
 
     def refresh_data(self):
         self.load_strangers()
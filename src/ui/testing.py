@@ -4,115 +4,161 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
 from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal
 from PyQt6.QtGui import QImage, QPixmap
 import cv2
-import face_recognition
 import numpy as np
-from src.database import DatabaseManager
-from src.face_engine import FaceEngine
+from src.face_engine import FaceEngine, GalleryMatcher, face_api
+from src.gallery import get_live_gallery
 from src.ui.voice import VoiceEngine
+from src.capture import camera_manager
+from src.motion import MotionGate
+from src.state import ExpiringState, total_live_entries, LIVENESS_TTL
 
 class VideoThread(QThread):
     change_pixmap_signal = pyqtSignal(np.ndarray)
+    stats_signal = pyqtSignal(str)
 
-    def __init__(self, known_face_encodings, known_face_names):
+    def __init__(self, matcher, db):
         super().__init__()
         self._run_flag = True
-        self.known_face_encodings = known_face_encodings
-        self.known_face_names = known_face_names
+        self.matcher = matcher
+        self.db = db
         self.face_engine = FaceEngine()
         self.voice = VoiceEngine()
         
         # Liveness tracking
-        self.liveness_status = {}
+        self.liveness_status = ExpiringState(LIVENESS_TTL, factory=lambda: {"blinked": False, "frames_closed": 0, "greeted": False})
         self.blink_threshold = 0.26 
         self.consecutive_frames = 1
+        
+        # Latest results, drawn on every camera frame by the display path
+        self.overlays = []
+        
+        # Detection only runs where something moved (or around faces still on screen)
+        self.motion = MotionGate()
+        self.motion_gate_enabled = self.db.get_typed_setting("motion_gate_enabled")
+        self.setting_changes = self.db.settings.changes()
+        self.face_locations = []
 
     def run(self):
-        cap = cv2.VideoCapture(0)
-        while self._run_flag:
-            ret, cv_img = cap.read()
-            if ret:
-                # Process frame here
-                small_frame = cv2.resize(cv_img, (0, 0), fx=0.25, fy=0.25)
-                rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        # Shared camera stream; recognition takes the newest frame when it is ready
+        source = camera_manager.acquire(0)
+        try:
+            subscriber = source.subscribe()
+            if subscriber.error:
+                self.stats_signal.emit(subscriber.error)
+                return
+            source.add_listener(self.on_frame)
+            while self._run_flag:
+                cv_img = subscriber.read(timeout=0.5)
+                for key, value in self.setting_changes.take():
+                    self.apply_setting(key, value)
+                if cv_img is not None:
+                    # Process frame here
+                    small_frame = cv2.resize(cv_img, (0, 0), fx=0.25, fy=0.25)
+                    roi = self.motion.check(small_frame, self.face_locations) if self.motion_gate_enabled else None
+                    if self.motion_gate_enabled and roi is None:
+                        # Empty, still scene: the last (empty) results stay valid
+                        self.emit_stats(source, subscriber)
+                        continue
+                    rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
                 
-                face_locations = face_recognition.face_locations(rgb_small_frame)
-                face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+                    face_locations = self.face_engine.detect_faces(rgb_small_frame, roi)
+                    self.face_locations = face_locations
+                    face_encodings = face_api().face_encodings(rgb_small_frame, face_locations)
                 
-                face_names = []
-                for face_encoding, face_location in zip(face_encodings, face_locations):
                     # Use stricter tolerance from FaceEngine
-                    tolerance = FaceEngine.DEFAULT_TOLERANCE
-                    matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=tolerance)
-                    name = "Unknown"
-                    distance = 0.0
-                    liveness_label = ""
+                    face_matches = self.matcher.match(face_encodings, tolerance=FaceEngine.DEFAULT_TOLERANCE)
+                
+                    # Landmarks only for recognised faces that still have to blink, in one pass
+                    pending = [loc for m, loc in zip(face_matches, face_locations)
+                               if m.is_match and not self.liveness_status.get(m.name, {}).get("blinked")]
+                    ears = {loc: a["ear"] for loc, a in zip(pending, self.face_engine.analyze_faces(rgb_small_frame, pending))}
+                
+                    face_names = []
+                    for face_match, face_location in zip(face_matches, face_locations):
+                        name = "Unknown"
+                        distance = 0.0
+                        liveness_label = ""
 
-                    if self.known_face_encodings:
-                        face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-                        best_match_index = np.argmin(face_distances)
-                        if matches[best_match_index]:
-                            name = self.known_face_names[best_match_index]
-                            distance = face_distances[best_match_index]
-                            
-                            # Liveness Check for known faces
-                            # Initialize status if new
-                            if name not in self.liveness_status:
-                                self.liveness_status[name] = {"blinked": False, "frames_closed": 0, "greeted": False}
-                            
-                            if not self.liveness_status[name]["blinked"]:
+                        if face_match.is_match:
+                            name = face_match.name
+                            distance = face_match.distance
+                        
+                            # Liveness Check for known faces (created if new, kept alive while seen)
+                            status = self.liveness_status.touch(name)
+                        
+                            if not status["blinked"]:
                                 # Get EAR
-                                ear = self.face_engine.check_liveness(rgb_small_frame, face_location)
+                                ear = ears.get(face_location, 1.0)
                                 if ear < self.blink_threshold:
-                                    self.liveness_status[name]["frames_closed"] += 1
+                                    status["frames_closed"] += 1
                                 else:
-                                    if self.liveness_status[name]["frames_closed"] >= self.consecutive_frames:
-                                        self.liveness_status[name]["blinked"] = True
-                                        if not self.liveness_status[name]["greeted"]:
+                                    if status["frames_closed"] >= self.consecutive_frames:
+                                        status["blinked"] = True
+                                        if not status["greeted"]:
                                             self.voice.say(f"Verification successful, Welcome {name}")
-                                            self.liveness_status[name]["greeted"] = True
-                                    self.liveness_status[name]["frames_closed"] = 0
-                                
-                                liveness_label = " (Please Blink)" if not self.liveness_status[name]["blinked"] else " (Verified)"
+                                            status["greeted"] = True
+                                    status["frames_closed"] = 0
+                            
+                                liveness_label = " (Please Blink)" if not status["blinked"] else " (Verified)"
                             else:
                                 liveness_label = " (Verified)"
 
-                    face_names.append((name, distance, liveness_label))
+                        face_names.append((name, distance, liveness_label))
                 
-                # Draw results on the frame
-                for ((top, right, bottom, left), (name, dist, live_text)) in zip(face_locations, face_names):
-                    top *= 4
-                    right *= 4
-                    bottom *= 4
-                    left *= 4
+                    # Publish results for the display path
+                    overlays = []
+                    for ((top, right, bottom, left), (name, dist, live_text)) in zip(face_locations, face_names):
+                        top *= 4
+                        right *= 4
+                        bottom *= 4
+                        left *= 4
 
-                    is_verified = "(Verified)" in live_text or name == "Unknown"
-                    color = (0, 255, 0) if is_verified and name != "Unknown" else (0, 0, 255)
-                    if name != "Unknown" and "(Please Blink)" in live_text:
-                        color = (0, 255, 255) # Yellow for pending
-                    
-                    cv2.rectangle(cv_img, (left, top), (right, bottom), color, 2)
-                    cv2.rectangle(cv_img, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
+                        is_verified = "(Verified)" in live_text or name == "Unknown"
+                        color = (0, 255, 0) if is_verified and name != "Unknown" else (0, 0, 255)
+                        if name != "Unknown" and "(Please Blink)" in live_text:
+                            color = (0, 255, 255) # Yellow for pending
                     
-                    label = f"{name}{live_text}"
-                    if name != "Unknown":
-                        label += f" [{dist:.2f}]"
-                        
-                    cv2.putText(cv_img, label, (left + 6, bottom - 6), cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
+                        label = f"{name}{live_text}"
+                        if name != "Unknown":
+                            label += f" [{dist:.2f}]"
+                        overlays.append(((top, right, bottom, left), color, label))
+
+                    self.overlays = overlays
+                    self.emit_stats(source, subscriber)
+        finally:
+            # Always hand the camera back, also when the loop failed
+            source.remove_listener(self.on_frame)
+            camera_manager.release(0)
+
+    def emit_stats(self, source, subscriber):
+        self.stats_signal.emit(f"Camera {source.fps:.0f} FPS | Dropped frames: {subscriber.dropped} | "
+                               f"State entries: {total_live_entries()} | "
+                               f"Detection skipped: {self.motion.skip_ratio:.0%}")
 
-                self.change_pixmap_signal.emit(cv_img)
-        cap.release()
+    def on_frame(self, seq, frame):
+        """Display path, called by the capture thread for every camera frame."""
+        display_img = frame.copy()
+        for (top, right, bottom, left), color, label in self.overlays:
+            cv2.rectangle(display_img, (left, top), (right, bottom), color, 2)
+            cv2.rectangle(display_img, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
+            cv2.putText(display_img, label, (left + 6, bottom - 6), cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
+        self.change_pixmap_signal.emit(display_img)
+
+    def apply_setting(self, key, value):
+        if key == "motion_gate_enabled":
+            self.motion_gate_enabled = value
 
     def stop(self):
+        self.setting_changes.close()
         self._run_flag = False
         self.wait()
 
 class LiveRecognitionWidget(QWidget):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
-        self.db = DatabaseManager()
+        self.db = db
         self.face_engine = FaceEngine()
-        self.known_face_encodings = []
-        self.known_face_names = []
+        self.matcher = GalleryMatcher()
         
         self.init_ui()
         
@@ -145,23 +191,14 @@ class LiveRecognitionWidget(QWidget):
 
     def load_known_faces(self):
         """Loads all known faces from DB for recognition."""
-        self.known_face_encodings = []
-        self.known_face_names = []
-        
-        encodings_data = self.db.get_all_encodings()
-        users = {u[0]: u[1] for u in self.db.get_all_users()}
-        
-        for user_id, enc_bytes in encodings_data:
-            encoding = self.face_engine.decode_from_bytes(enc_bytes)
-            self.known_face_encodings.append(encoding)
-            self.known_face_names.append(users.get(user_id, "Unknown"))
-            
-        self.stats_label.setText(f"Loaded {len(self.known_face_encodings)} face encodings.")
+        self.matcher = get_live_gallery(self.db)
+        self.stats_label.setText(f"Loaded {len(self.matcher)} face encodings.")
 
     def start_video(self):
         self.load_known_faces()
-        self.video_thread = VideoThread(self.known_face_encodings, self.known_face_names)
+        self.video_thread = VideoThread(self.matcher, self.db)
         self.video_thread.change_pixmap_signal.connect(self.update_image)
+        self.video_thread.stats_signal.connect(self.stats_label.setText)
         self.video_thread.start()
         self.start_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
@@ -169,6 +206,10 @@ class LiveRecognitionWidget(QWidget):
     def stop_video(self):
         if hasattr(self, 'video_thread'):
             self.video_thread.stop()
+            try:
+                self.video_thread.stats_signal.disconnect()
+            except TypeError:
+                pass # Already disconnected
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
         self.image_label.setText("Camera Feed Off")
@@ -189,8 +230,9 @@ class LiveRecognitionWidget(QWidget):
 
 
 class BatchTestWidget(QWidget):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
+        self.db = db
         self.init_ui()
 
     def init_ui(self):
@@ -250,41 +292,29 @@ class BatchTestWidget(QWidget):
         
         # Process image
         rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_image)
-        face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
+        face_locations = face_api().face_locations(rgb_image)
+        face_encodings = face_api().face_encodings(rgb_image, face_locations)
 
         # Load known faces
-        db = DatabaseManager()
-        face_engine = FaceEngine()
-        known_encodings = []
-        known_ids = []
-        
-        encodings_data = db.get_all_encodings()
+        db = self.db
+        matcher = get_live_gallery(db)
         # We need user details, not just names
         # Create a map: user_id -> user_details_tuple
         users_map = {u[0]: u for u in db.get_all_users()}
-        
-        for user_id, enc_bytes in encodings_data:
-            known_encodings.append(face_engine.decode_from_bytes(enc_bytes))
-            known_ids.append(user_id)
+
+        face_matches = matcher.match(face_encodings, tolerance=FaceEngine.DEFAULT_TOLERANCE)
 
         # Match faces
         display_image = image.copy()
         
-        for idx, (face_encoding, face_loc) in enumerate(zip(face_encodings, face_locations)):
-            tolerance = FaceEngine.DEFAULT_TOLERANCE
-            matches = face_recognition.compare_faces(known_encodings, face_encoding, tolerance=tolerance)
+        for idx, (face_match, face_loc) in enumerate(zip(face_matches, face_locations)):
             user_details = None
             name = "Unknown"
             
-            if known_encodings:
-                face_distances = face_recognition.face_distance(known_encodings, face_encoding)
-                best_match_index = np.argmin(face_distances)
-                if matches[best_match_index]:
-                    user_id = known_ids[best_match_index]
-                    user_details = users_map.get(user_id)
-                    if user_details:
-                        name = user_details[1]
+            if face_match.is_match:
+                user_details = users_map.get(face_match.id)
+                if user_details:
+                    name = user_details[1]
             
             # Draw on image
             top, right, bottom, left = face_loc
@@ -323,14 +353,14 @@ class BatchTestWidget(QWidget):
         self.image_label.setPixmap(scaled_pixmap)
 
 class TestingWidget(QWidget):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
         layout = QVBoxLayout()
         self.setLayout(layout)
         
         tabs = QTabWidget()
-        self.live_tab = LiveRecognitionWidget()
-        self.batch_tab = BatchTestWidget()
+        self.live_tab = LiveRecognitionWidget(db)
+        self.batch_tab = BatchTestWidget(db)
         
         tabs.addTab(self.live_tab, "Live Recognition")
         tabs.addTab(self.batch_tab, "Batch Testing")
@@ -1,94 +1,138 @@
 import cv2
 import os
-import numpy as np
-import datetime
-import face_recognition
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
                              QPushButton, QTableWidget, QTableWidgetItem, 
-                             QProgressBar, QFileDialog, QHeaderView, QMessageBox)
+                             QProgressBar, QFileDialog, QHeaderView, QMessageBox, QSpinBox,
+                             QDoubleSpinBox)
 from PyQt6.QtCore import Qt, QThread, pyqtSignal
 from src.face_engine import FaceEngine
-from src.database import DatabaseManager
+from src.gallery import get_live_gallery
+from src.video_segments import FrameSampler, split_segments, recognize_faces, analyze_segment, merge_first_seen, format_timestamp
 
 class VideoProcessorThread(QThread):
     progress_signal = pyqtSignal(int)
     result_signal = pyqtSignal(list) # [(name, time), ...]
     finished_signal = pyqtSignal()
 
-    def __init__(self, file_path, known_face_encodings, known_face_names, db):
+    def __init__(self, file_path, matcher, db, workers=1, samples_per_second=2.0):
         super().__init__()
         self.file_path = file_path
-        self.known_face_encodings = known_face_encodings
-        self.known_face_names = known_face_names
+        self.matcher = matcher
         self.db = db
+        self.workers = workers
         self.face_engine = FaceEngine()
         self._run_flag = True
         
         # Load settings
-        self.num_jitters = int(self.db.get_setting("num_jitters", "1"))
-        self.tolerance = float(self.db.get_setting("tolerance", "0.45"))
-        # For video analysis, we use Higher Upsampling and Lower Skip Rate for better accuracy
+        self.num_jitters = self.db.get_typed_setting("num_jitters")
+        self.tolerance = self.db.get_typed_setting("tolerance")
+        # For video analysis, we use Higher Upsampling for better accuracy
         self.upsample = 1 # detect smaller faces
-        self.skip_frames = 5 # check more frequently than the default 10
+        # Time-based sampling, densified while faces are on screen
+        self.samples_per_second = samples_per_second
+        self.dense_samples_per_second = self.db.get_typed_setting("video_dense_sample_rate")
+        # Tolerance / jitter changes apply live to the single-process analysis
+        self.setting_changes = self.db.settings.changes()
 
     def run(self):
         cap = cv2.VideoCapture(self.file_path)
         if not cap.isOpened():
+            self.setting_changes.close()
             self.finished_signal.emit()
             return
 
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        segments = split_segments(total_frames, self.workers) if total_frames > 0 else []
+        if len(segments) > 1:
+            cap.release()
+            self.run_parallel(segments, total_frames)
+        else:
+            self.run_serial(cap, total_frames)
+            cap.release()
+        self.setting_changes.close()
+        self.finished_signal.emit()
+
+    def apply_setting(self, key, value):
+        if key in ("num_jitters", "tolerance"):
+            setattr(self, key, value)
+
+    def run_serial(self, cap, total_frames):
         results = []
         seen_names = set()
         
-        frame_idx = 0
-        while self._run_flag:
-            ret, frame = cap.read()
-            if not ret:
+        # Only sampled frames are decoded, the rest are grabbed
+        sampler = FrameSampler(cap, samples_per_second=self.samples_per_second,
+                               dense_samples_per_second=self.dense_samples_per_second)
+        for frame_idx, frame in sampler:
+            if not self._run_flag:
                 break
-                
-            # Process every Nth frame
-            if frame_idx % self.skip_frames == 0:
-                small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5) # Scale to 0.5 instead of 0.25 for better detail
-                # Apply CLAHE pre-processing
-                processed_small = self.face_engine.preprocess_image(small_frame)
-                rgb_small_frame = cv2.cvtColor(processed_small, cv2.COLOR_BGR2RGB)
-                
-                # Use Upsampling to catch smaller faces
-                face_locations = face_recognition.face_locations(rgb_small_frame, number_of_times_to_upsample=self.upsample)
-                # Use Multi-Jittering for robustness
-                face_encodings = self.face_engine.get_face_encodings(rgb_small_frame, face_locations, num_jitters=self.num_jitters)
-                
-                for face_encoding in face_encodings:
-                    matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=self.tolerance)
-                    if True in matches:
-                        first_match_index = matches.index(True)
-                        name = self.known_face_names[first_match_index]
-                        
-                        # Calculate timestamp in video
-                        ms = cap.get(cv2.CAP_PROP_POS_MSEC)
-                        time_str = str(datetime.timedelta(milliseconds=ms)).split('.')[0]
-                        
-                        if name not in seen_names:
-                            results.append((name, time_str))
-                            seen_names.add(name)
-                            self.result_signal.emit(results)
-
-            frame_idx += 1
+            for key, value in self.setting_changes.take():
+                self.apply_setting(key, value)
+            matches = recognize_faces(frame, self.face_engine, self.matcher, self.tolerance,
+                                      self.num_jitters, self.upsample)
+            sampler.report_faces(bool(matches))
+            for face_match in matches:
+                if face_match.is_match and face_match.name not in seen_names:
+                    # Calculate timestamp in video
+                    time_str = format_timestamp(sampler.timestamp_ms(frame_idx))
+                    results.append((face_match.name, time_str))
+                    seen_names.add(face_match.name)
+                    self.result_signal.emit(results)
+
             if total_frames > 0:
-                progress = int((frame_idx / total_frames) * 100)
+                progress = int((sampler.position / total_frames) * 100)
                 self.progress_signal.emit(progress)
-
-        cap.release()
-        self.finished_signal.emit()
+        if total_frames > 0 and self._run_flag:
+            self.progress_signal.emit(100)
+
+    def run_parallel(self, segments, total_frames):
+        """Analyses time segments in worker processes and merges the first-seen times in order."""
+        options = {"samples_per_second": self.samples_per_second,
+                   "dense_samples_per_second": self.dense_samples_per_second,
+                   "tolerance": self.tolerance, "num_jitters": self.num_jitters, "upsample": self.upsample}
+        first_seen = {}
+        done_frames = [0] * len(segments)
+        
+        # Spawned, not forked: a fork would copy this multithreaded Qt process with its
+        # camera thread, pooled SQLite connections and held locks
+        context = multiprocessing.get_context("spawn")
+        workers = max(1, min(len(segments), os.cpu_count() or 1))
+        with context.Manager() as manager:
+            progress_queue = manager.Queue()
+            stop_event = manager.Event()
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                pending = {pool.submit(analyze_segment, i, self.file_path, self.db.db_path, start, end,
+                                       options, progress_queue, stop_event)
+                           for i, (start, end) in enumerate(segments)}
+                while pending:
+                    finished, pending = wait(pending, timeout=0.2)
+                    if not self._run_flag:
+                        stop_event.set()
+                    
+                    # Aggregate progress across workers
+                    while not progress_queue.empty():
+                        segment_idx, frames = progress_queue.get()
+                        done_frames[segment_idx] = frames
+                    self.progress_signal.emit(int(sum(done_frames) / total_frames * 100))
+                    
+                    for future in finished:
+                        try:
+                            merge_first_seen(first_seen, future.result())
+                        except Exception as e:
+                            print(f"Video segment error: {e}")
+                            continue
+                        ordered = sorted(first_seen.items(), key=lambda item: item[1])
+                        self.result_signal.emit([(name, format_timestamp(ms)) for name, ms in ordered])
 
     def stop(self):
         self._run_flag = False
 
 class VideoAnalysisWidget(QWidget):
-    def __init__(self):
+    def __init__(self, db):
         super().__init__()
-        self.db = DatabaseManager()
+        self.db = db
         self.init_ui()
 
     def init_ui(self):
@@ -127,6 +171,20 @@ class VideoAnalysisWidget(QWidget):
         self.stop_btn.setEnabled(False)
         self.stop_btn.setStyleSheet("background-color: #e74c3c; font-weight: bold; padding: 10px;")
         
+        # Parallel analysis: the file is split into time segments, one worker process each
+        ctrl_layout.addWidget(QLabel("Worker Processes:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, max(1, os.cpu_count() or 1))
+        self.workers_spin.setValue(min(self.workers_spin.maximum(), self.db.get_typed_setting("video_workers")))
+        ctrl_layout.addWidget(self.workers_spin)
+        
+        ctrl_layout.addWidget(QLabel("Samples / sec:"))
+        self.sample_rate_spin = QDoubleSpinBox()
+        self.sample_rate_spin.setRange(0.5, 30.0)
+        self.sample_rate_spin.setSingleStep(0.5)
+        self.sample_rate_spin.setValue(self.db.get_typed_setting("video_sample_rate"))
+        ctrl_layout.addWidget(self.sample_rate_spin)
+        
         ctrl_layout.addWidget(self.start_btn)
         ctrl_layout.addWidget(self.stop_btn)
         layout.addLayout(ctrl_layout)
@@ -147,29 +205,24 @@ class VideoAnalysisWidget(QWidget):
 
     def start_analysis(self):
         # Load known faces
-        users = self.db.get_all_users()
-        encodings_data = self.db.get_all_encodings()
+        # Fixed snapshot of the shared gallery for the whole file
+        matcher = get_live_gallery(self.db).snapshot
         
-        if not encodings_data:
+        if not len(matcher):
             QMessageBox.warning(self, "Error", "No registered users found!")
             return
 
-        known_encs = []
-        known_names = []
-        user_map = {u[0]: u[1] for u in users}
-        
-        fe = FaceEngine()
-        for u_id, enc_blob in encodings_data:
-            known_encs.append(fe.decode_from_bytes(enc_blob))
-            known_names.append(user_map.get(u_id, "Unknown"))
-
         self.table.setRowCount(0)
         self.progress_bar.setValue(0)
         self.start_btn.setEnabled(False)
         self.select_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
 
-        self.analysis_thread = VideoProcessorThread(self.file_path, known_encs, known_names, self.db)
+        workers = self.workers_spin.value()
+        sample_rate = self.sample_rate_spin.value()
+        self.db.set_setting("video_workers", str(workers))
+        self.db.set_setting("video_sample_rate", str(sample_rate))
+        self.analysis_thread = VideoProcessorThread(self.file_path, matcher, self.db, workers, sample_rate)
         self.analysis_thread.progress_signal.connect(self.progress_bar.setValue)
         self.analysis_thread.result_signal.connect(self.update_table)
         self.analysis_thread.finished_signal.connect(self.on_finished)
@@ -1,7 +1,6 @@
-import yagmail
 import datetime
 import os
-from src.database import DatabaseManager
+from src.exporter import export_attendance
 import cv2
 import numpy as np
 
@@ -15,8 +14,8 @@ def load_image_safe(image_path):
         return None
 
 class EmailManager:
-    def __init__(self):
-        self.db = DatabaseManager()
+    def __init__(self, db):
+        self.db = db
 
     def send_report(self, subject, body, attachment_path=None):
         """Sends an email with an optional attachment."""
@@ -29,6 +28,7 @@ class EmailManager:
             return False
 
         try:
+            import yagmail # only needed when a report is actually sent
             yag = yagmail.SMTP(user, password)
             if attachment_path and os.path.exists(attachment_path):
                 yag.send(to=receiver, subject=subject, contents=[body, attachment_path])
@@ -39,22 +39,20 @@ class EmailManager:
             print(f"Email Error: {e}")
             return False
 
-    def send_daily_report(self, date_str, records):
+    def send_daily_report(self, date_str):
         """Generates and sends the daily summary report."""
-        if not records:
+        total = self.db.count_attendance_range(date_str, date_str)
+        if not total:
             return False
 
         subject = f"Face Recognition Attendance Report - {date_str}"
         body = f"Hello Administrator,\n\nHere is the attendance report for {date_str}.\n"
-        body += f"Total attendees: {len(records)}\n\n"
+        body += f"Total attendees: {total}\n\n"
         body += "Best regards,\nAttendance System"
 
-        # Create temporary CSV
-        import pandas as pd
-        df = pd.DataFrame(records, columns=["ID", "Name", "Date", "Timestamp", "IsActive", "Mood"])
-        df['Status'] = df['IsActive'].apply(lambda x: "Active" if x == 1 else "Deleted")
+        # Create temporary CSV, streamed from the database
         temp_file = f"temp_report_{date_str}.csv"
-        df[["ID", "Name", "Status", "Mood", "Date", "Timestamp"]].to_csv(temp_file, index=False)
+        export_attendance(self.db, temp_file, date_str, date_str)
 
         success = self.send_report(subject, body, temp_file)
         
@@ -63,3 +61,14 @@ class EmailManager:
             os.remove(temp_file)
             
         return success
+
+    def check_and_send_daily_report(self):
+        """Checks if yesterday's report was sent, and sends it if not."""
+        yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+        last_sent = self.db.get_setting("last_report_sent_date", "")
+
+        if last_sent != yesterday:
+            if self.db.count_attendance_range(yesterday, yesterday):
+                print(f"Sending automated daily report for {yesterday}...")
+                if self.send_daily_report(yesterday):
+                    self.db.set_setting("last_report_sent_date", yesterday)
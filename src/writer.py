@@ -0,0 +1,236 @@
+import os
+import json
+import base64
+import time
+import queue
+import datetime
+import threading
+import uuid
+import cv2
+import numpy as np
+from src.stranger_index import StrangerIndex, embedding_list
+
+class EventWriter:
+    """
+    Write-behind queue for attendance and stranger events.
+    Recognition threads journal each event as they enqueue it (one appended
+    line, stranger crops as JPEG), so a crash loses nothing that was accepted.
+    A background thread saves the stranger crops and commits batches in one
+    transaction, then drops the committed events from the journal. Whatever is
+    left in the journal is replayed on the next start. The writer thread
+    fsyncs the journal before each commit, so a power loss can still take the
+    events of the last flush_interval.
+    """
+    def __init__(self, db, journal_path=None, batch_size=64, flush_interval=0.25):
+        self.db = db
+        self.journal_path = journal_path or os.path.join(os.path.dirname(db.db_path), "events.journal")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._retry = [] # events of a batch whose commit failed
+        self._journal_lock = threading.Lock()
+        self._sequence = 0 # of the last journaled event, events are queued in this order
+        # (user_id, date) of attendance queued but not committed yet; the attendance
+        # cache only learns about it from write_events once it is in the database
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+        self.written = 0
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        try:
+            self.replay_journal()
+        except Exception as e:
+            # A journal that cannot be written must not keep the system from starting
+            print(f"Journal replay error: {e}")
+            self._set_journal_aside()
+        # Load today's attendance now so mark_attendance never hits the database
+        self.db.attendance_cache.is_present(None, self._today(), self.db.get_present_user_ids)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Flushes everything still queued and stops the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def pending(self):
+        return self._queue.qsize() + len(self._retry)
+
+    def _today(self):
+        return datetime.datetime.now().strftime("%Y-%m-%d")
+
+    def mark_attendance(self, user_id, emotion="Neutral"):
+        """Same answer as DatabaseManager.mark_attendance, decided from the attendance cache."""
+        now = datetime.datetime.now()
+        today = now.strftime("%Y-%m-%d")
+        # Both checked under the lock: the writer updates the cache before it drops the in-flight entry
+        with self._in_flight_lock:
+            if ((user_id, today) in self._in_flight
+                    or self.db.attendance_cache.is_present(user_id, today, self.db.get_present_user_ids)):
+                return False, "Already registered today"
+            self._in_flight.add((user_id, today))
+        event = {"type": "attendance", "user_id": user_id, "date": today,
+                 "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"), "emotion": emotion}
+        self._enqueue(event, dict(event))
+        return True, "Attendance marked"
+
+    def log_stranger(self, image_data, embedding=None):
+        seen_at = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        event = {"type": "stranger", "event_id": uuid.uuid4().hex, "seen_at": seen_at,
+                 "image": image_data.copy(), "embedding": embedding_list(embedding)}
+        record = {k: v for k, v in event.items() if k != "image"}
+        ok, encoded = cv2.imencode(".png", image_data) # lossless, the crop is re-encoded on save
+        record["image_png"] = base64.b64encode(encoded.tobytes()).decode('ascii') if ok else None
+        self._enqueue(event, record)
+        return True
+
+    def _enqueue(self, event, record):
+        with self._journal_lock:
+            self._sequence += 1
+            event["seq"] = record["seq"] = self._sequence
+            try:
+                with open(self.journal_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                print(f"Journal error: {e}") # the event is still written, just not crash-safe
+            self._queue.put(event)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            event = self._queue.get()
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if event is None:
+                    stop = True
+                else:
+                    batch.append(event)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    event = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch or self._retry:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    # Keep the thread alive for the next batches
+                    print(f"Event writer error: {e}")
+
+    def _save_crops(self, events):
+        """Saves the crops of new strangers, returns the events that can be written."""
+        dropped = set()
+        batch_strangers = StrangerIndex()
+        batch_strangers.ensure_loaded(list)
+        for event in events:
+            # Retried events already went through here and carry an image_path instead
+            if event["type"] != "stranger" or "image" not in event:
+                continue
+            # A likely repeat sighting (of a known stranger or one earlier in this batch)
+            # needs no crop; write_events decides and deletes any crop it does not keep
+            embedding = event.get("embedding")
+            image_path = None
+            if (self.db.find_recent_stranger(embedding) is None
+                    and batch_strangers.nearest(embedding) is None):
+                try:
+                    image_path = self.db.save_stranger_crop(event["image"])
+                except Exception as e:
+                    print(f"Stranger crop error: {e}")
+                    dropped.add(id(event))
+                    continue
+                if embedding is not None:
+                    batch_strangers.add(0, embedding) # only the face matters here
+            del event["image"]
+            event["image_path"] = image_path
+        return [e for e in events if id(e) not in dropped]
+
+    def _write(self, events):
+        events = self._retry + events
+        try:
+            events = self._save_crops(events)
+            self._sync_journal()
+            self.db.write_events(events)
+        except Exception as e:
+            print(f"Event writer error: {e}")
+            self._retry = events # retried with the next batch
+            return
+        self._retry = []
+        self.written += len(events)
+        with self._in_flight_lock:
+            self._in_flight.difference_update((e["user_id"], e["date"]) for e in events if e["type"] == "attendance")
+        if events:
+            try:
+                self._clear_journal(max(e.get("seq", 0) for e in events))
+            except OSError as e:
+                print(f"Journal error: {e}") # replaying it again is harmless
+
+    def _sync_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'rb') as f:
+            os.fsync(f.fileno())
+
+    def _clear_journal(self, committed=None):
+        """Drops the journaled events up to sequence number committed (all of them if None)."""
+        with self._journal_lock:
+            if committed is None or committed >= self._sequence:
+                with open(self.journal_path, 'w'):
+                    pass
+                return
+            # Events queued while the batch was committed stay journaled
+            kept = []
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        if json.loads(line).get("seq", 0) > committed:
+                            kept.append(line)
+                    except ValueError:
+                        pass
+            tmp_path = f"{self.journal_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(kept)
+            os.replace(tmp_path, self.journal_path)
+
+    def _set_journal_aside(self):
+        """Renames an unusable journal so it can be inspected, and starts a new one."""
+        bad_path = f"{self.journal_path}.{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.bad"
+        try:
+            os.replace(self.journal_path, bad_path)
+            print(f"Moved the event journal aside to {bad_path}")
+        except OSError as e:
+            print(f"Could not move the event journal aside: {e}")
+
+    def replay_journal(self):
+        """Commits events journaled by a previous run that did not reach the database."""
+        if not os.path.exists(self.journal_path):
+            return 0
+        events = []
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    break # torn last line
+        for event in events:
+            # Journaled at enqueue time, the crop is not saved yet
+            image_png = event.pop("image_png", None)
+            if image_png is not None:
+                data = np.frombuffer(base64.b64decode(image_png), dtype=np.uint8)
+                event["image"] = cv2.imdecode(data, cv2.IMREAD_COLOR)
+            elif event["type"] == "stranger":
+                event.setdefault("image_path", None)
+        events = self._save_crops(events)
+        if events:
+            self.db.write_events(events)
+            print(f"Replayed {len(events)} journaled events")
+        self._clear_journal()
+        return len(events)
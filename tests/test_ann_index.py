@@ -0,0 +1,27 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.ann_index import IVFIndexStore, ANN_MIN_GALLERY
+
+def test_load_never_trains_and_survives_a_torn_file(tmp_path):
+    store = IVFIndexStore(str(tmp_path / "ann_index"))
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(ANN_MIN_GALLERY, 128)).astype(np.float32)
+    ids = np.arange(1, len(matrix) + 1)
+    assert store.load(ids, matrix) is None
+    assert not os.path.exists(store.centroids_path)
+
+    trained = store.train(ids, matrix)
+    loaded = store.load(ids, matrix)
+    assert np.array_equal(loaded.assignments, trained.assignments)
+    store.train(ids, matrix) # retrained: the new generation replaces the old lists
+    assert [name for name in os.listdir(tmp_path) if not name.endswith(".npz")] == [
+        os.path.basename(store._lists_path(store._load_header()[2]))]
+
+    with open(store.centroids_path, 'r+b') as f:
+        f.truncate(100)
+    assert store.load(ids, matrix) is None
+    assert store.needs_training(len(matrix))
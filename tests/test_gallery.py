@@ -0,0 +1,36 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import DatabaseManager
+from src.embedding_store import encode_encoding
+from src.gallery import get_live_gallery, LiveGallery
+
+def enroll(db, name, count, rng):
+    user_id = db.add_user(name)
+    for _ in range(count):
+        db.add_encoding(user_id, encode_encoding(rng.normal(size=128)))
+    return user_id
+
+def test_reactivated_user_is_back_in_gallery(tmp_path):
+    db = DatabaseManager(str(tmp_path / "database.db"))
+    rng = np.random.default_rng(0)
+    enroll(db, "A", 10, rng)
+    user_id = enroll(db, "B", 2, rng)
+    enroll(db, "C", 10, rng)
+    gallery = get_live_gallery(db)
+    assert len(gallery) == 22
+
+    db.delete_user(user_id)
+    gallery.refresh()
+    assert len(gallery) == 20
+    assert user_id not in gallery.snapshot.names
+
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE users SET is_active=1 WHERE id=?", (user_id,))
+    gallery.refresh()
+    assert len(gallery) == 22
+    assert gallery.snapshot.names[user_id] == "B"
+    assert len(gallery) == len(LiveGallery(db).load())
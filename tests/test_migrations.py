@@ -0,0 +1,28 @@
+import os
+import sys
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import DatabaseManager
+
+def test_duplicate_attendance_is_archived(tmp_path):
+    path = str(tmp_path / "database.db")
+    # Attendance table as written before the unique (user, day) index existed
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+                 "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    conn.execute("CREATE TABLE attendance (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, "
+                 "timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, date TEXT, emotion TEXT DEFAULT 'Neutral')")
+    conn.execute("INSERT INTO users (name) VALUES ('A')")
+    conn.executemany("INSERT INTO attendance (user_id, timestamp, date, emotion) VALUES (1, ?, '2026-10-16', ?)",
+                     [("2026-10-16 09:00:00", "Happy"), ("2026-10-16 09:30:00", "Sad"), ("2026-10-16 10:00:00", "Neutral")])
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(path)
+    cursor = db.get_connection().cursor()
+    cursor.execute("SELECT timestamp, emotion FROM attendance")
+    assert cursor.fetchall() == [("2026-10-16 09:00:00", "Happy")]
+    cursor.execute("SELECT id, timestamp, emotion FROM attendance_duplicates ORDER BY id")
+    assert cursor.fetchall() == [(2, "2026-10-16 09:30:00", "Sad"), (3, "2026-10-16 10:00:00", "Neutral")]
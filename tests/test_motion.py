@@ -0,0 +1,25 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.motion import MotionGate
+
+def test_idle_frames_are_skipped_and_boxes_clipped():
+    now = [0.0]
+    gate = MotionGate(clock=lambda: now[0])
+    frame = np.zeros((120, 160, 3), dtype=np.uint8)
+    assert gate.check(frame) == (0, 160, 120, 0) # first frame: full detection
+    now[0] += 0.5
+    assert gate.check(frame) is None
+    # A box that drifted off-frame adds nothing to detect
+    assert gate.check(frame, [(176, 200, 220, 146)]) is None
+    top, right, bottom, left = gate.check(frame, [(100, 200, 150, 146)])
+    assert 0 <= top < bottom <= 120 and 0 <= left < right <= 160
+
+    moved = frame.copy()
+    moved[40:70, 100:130] = 255
+    top, right, bottom, left = gate.check(moved)
+    assert top <= 40 and bottom >= 70 and left <= 100 and right >= 130
+    assert gate.skip_ratio == 2 / 5
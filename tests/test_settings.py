@@ -0,0 +1,19 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.settings_store import SettingsCache
+
+def test_changes_wait_for_the_worker():
+    cache = SettingsCache()
+    cache.ensure_loaded(lambda: [])
+    changes = cache.changes()
+    cache.update("tolerance", "0.5")
+    cache.update("tolerance", "0.4")
+    cache.update("liveness_enabled", "0")
+    assert changes.take() == [("tolerance", 0.4), ("liveness_enabled", False)]
+    assert changes.take() == []
+    changes.close()
+    cache.update("tolerance", "0.3")
+    assert changes.take() == []
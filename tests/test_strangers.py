@@ -0,0 +1,48 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import DatabaseManager
+from src.stranger_index import find_clusters
+
+def stranger_event(db, event_id, embedding, rng):
+    crop = rng.integers(0, 255, (40, 40, 3)).astype(np.uint8)
+    return {"type": "stranger", "event_id": event_id, "seen_at": "2026-10-16 10:00:00",
+            "image_path": db.save_stranger_crop(crop), "embedding": [float(v) for v in embedding]}
+
+def test_repeat_sightings_in_one_batch_and_replay(tmp_path):
+    db = DatabaseManager(str(tmp_path / "database.db"))
+    rng = np.random.default_rng(0)
+    face = rng.normal(size=128) * 0.1
+    events = [stranger_event(db, "a", face, rng), stranger_event(db, "b", face + 0.01, rng)]
+
+    db.write_events(events)
+    db.write_events(events) # journal replayed after a crash
+    rows = db.get_all_strangers()
+    assert len(rows) == 1
+    assert rows[0][4] == 2 # both sightings of the same second count, once each
+    assert os.path.exists(events[0]["image_path"])
+    assert not os.path.exists(events[1]["image_path"]) # crop of the repeat sighting is deleted
+
+def test_clusters_do_not_chain_different_faces():
+    rng = np.random.default_rng(1)
+    step = rng.normal(size=128)
+    step *= 0.3 / np.linalg.norm(step)
+    a = rng.normal(size=128) * 0.1
+    # a-b and b-c are close but a-c is not: c must not be chained into the group of a
+    assert find_clusters([a, a + step, a + 2 * step, a + 0.01]) == [[0, 1, 3]]
+
+def test_sighting_of_a_merged_stranger_is_not_lost(tmp_path):
+    db = DatabaseManager(str(tmp_path / "database.db"))
+    rng = np.random.default_rng(2)
+    face = rng.normal(size=128) * 0.1
+    db.write_events([stranger_event(db, "a", face, rng)])
+    assert db.find_recent_stranger(face) is not None # index loaded with the row
+    # Removed by another process (recluster, promotion) while this index still has it
+    with db.transaction() as cursor:
+        cursor.execute("DELETE FROM strangers")
+    db.write_events([stranger_event(db, "b", face, rng)])
+    rows = db.get_all_strangers()
+    assert len(rows) == 1 and rows[0][4] == 1
@@ -0,0 +1,21 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.face_engine import FaceMatch
+from src.tracker import FaceTracker
+
+def test_unmatched_track_is_reencoded_every_cycle():
+    tracker = FaceTracker(reencode_interval=3.0)
+    track = tracker.update([(10, 60, 60, 10)])[0]
+    assert tracker.needs_encoding(track, 0.45, now=0.0)
+
+    # One bad encoding of an enrolled user must not freeze the track as unknown
+    tracker.set_identity(track, FaceMatch(None, None, None, 0.6, False, []), now=0.0)
+    assert tracker.needs_encoding(track, 0.45, now=0.5)
+
+    # A confident match is cached until the refresh interval
+    tracker.set_identity(track, FaceMatch(0, 7, "A", 0.2, True, []), now=0.5)
+    assert not tracker.needs_encoding(track, 0.45, now=1.0)
+    assert tracker.needs_encoding(track, 0.45, now=3.5)